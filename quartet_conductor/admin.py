@@ -23,7 +23,8 @@ class SessionAdmin(admin.ModelAdmin):
 class InputMapAdmin(admin.ModelAdmin):
     model = models.InputMap
     search_fields = ['rule__name', 'input_number']
-    list_display = ['rule', 'input_number', 'related_session_input']
+    list_display = ['rule', 'module', 'input_number',
+                    'related_session_module', 'related_session_input']
 
 
 def register_to_site(admin_site: admin.AdminSite):
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 
 class QuartetConductorConfig(AppConfig):
     name = 'quartet_conductor'
+
+    def ready(self):
+        # connect the cache invalidation signal receivers
+        from quartet_conductor import signals  # noqa: F401
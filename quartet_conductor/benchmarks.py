@@ -0,0 +1,419 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import io
+import os
+import platform
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, redirect_stdout
+from logging import getLogger
+
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from quartet_capture.models import Rule, StepParameter
+from serialbox.models import Pool
+
+from quartet_conductor import connections
+from quartet_conductor import dio
+from quartet_conductor import metrics
+from quartet_conductor import registry
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor import traces
+from quartet_conductor.input_maps import get_input_map, input_map_cache
+from quartet_conductor.models import InputMap
+from quartet_conductor.rules import execute_rule, rule_cache
+from quartet_conductor.simulators.base import Faults
+from quartet_conductor.simulators.microscan import MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol, serials
+
+logger = getLogger(__name__)
+
+SESSION_INPUT = 1
+PRINT_INPUT = 2
+
+
+@contextmanager
+def temporary_state_dir():
+    """
+    Points CONDUCTOR_STATE_DIR at a temporary directory so that the version
+    stamps, traces, sessions and process image of a benchmark do not
+    reach the conductor processes running on the controller.  The trace
+    ring, session registry and DIO simulator of this process are replaced
+    for the duration and restored afterwards.
+    """
+    from quartet_conductor.simulators import dio as simulated_dio
+    state_dir = conductor_settings.CONDUCTOR_STATE_DIR
+    saved = traces._ring, registry._registry, simulated_dio._simulator
+    with tempfile.TemporaryDirectory() as directory:
+        conductor_settings.CONDUCTOR_STATE_DIR = directory
+        traces._ring = registry._registry = simulated_dio._simulator = None
+        try:
+            yield directory
+        finally:
+            for opened in (traces._ring, registry._registry,
+                           simulated_dio._simulator):
+                if hasattr(opened, 'close'):
+                    opened.close()
+            traces._ring, registry._registry, simulated_dio._simulator = \
+                saved
+            conductor_settings.CONDUCTOR_STATE_DIR = state_dir
+
+
+def percentile(values: list, percent: float) -> float:
+    """
+    Returns the nearest-rank percentile of a sorted list.
+    """
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1,
+                       int(round(percent / 100 * len(values))) - 1))
+    return values[index]
+
+
+def _set_parameter(rule: Rule, step_name: str, name: str, value):
+    parameter, created = StepParameter.objects.get_or_create(
+        step=rule.step_set.get(name=step_name), name=name,
+        defaults={'value': str(value)}
+    )
+    if not created:
+        parameter.value = str(value)
+        parameter.save()
+
+
+def create_rules(printer: VideojetSimulator, scanner: MicroscanSimulator):
+    """
+    Creates the Initialize Microscan and VideoJet Print rules, pointed at
+    the simulators, along with the input maps that trigger them and the
+    default number range.
+    """
+    # the commands print what they delete
+    with redirect_stdout(io.StringIO()):
+        call_command('create_microscan_rule', delete=True,
+                     scannerHost=scanner.host, printerHost=printer.host)
+        call_command('create_print_rule', delete=True)
+        if not Pool.objects.filter(machine_name='DEFAULT').exists():
+            call_command('create_default_number_range')
+    session_rule = Rule.objects.get(name='Initialize Microscan')
+    _set_parameter(session_rule, 'Get Job Fields', 'Port', printer.port)
+    _set_parameter(session_rule, 'Telnet Data', 'Port', scanner.port)
+    print_rule = Rule.objects.get(name='VideoJet Print')
+    _set_parameter(print_rule, 'Send Printer Commands', 'Host', printer.host)
+    _set_parameter(print_rule, 'Send Printer Commands', 'Port', printer.port)
+    module = dio.default_module()
+    InputMap.objects.filter(input_number__in=(SESSION_INPUT, PRINT_INPUT),
+                            module=module).delete()
+    InputMap.objects.create(input_number=SESSION_INPUT, rule=session_rule)
+    InputMap.objects.create(input_number=PRINT_INPUT, rule=print_rule,
+                            related_session_input=SESSION_INPUT)
+    # drop any compiled copies of the rules that were replaced now rather
+    # than when the transaction commits
+    rule_cache.clear()
+    input_map_cache.invalidate()
+
+
+def trigger(input_number: int, module: str = None):
+    """
+    Handles an input the way the input monitor does- the input map is
+    looked up and its rule executed inline.
+    """
+    module = module or dio.default_module()
+    traces.begin(dio.input_key(module, input_number))
+    error = None
+    try:
+        with metrics.timer('input_map'):
+            input_map = get_input_map(module, input_number)
+        with metrics.timer('rule'):
+            execute_rule(dio.format_address(module, input_number),
+                         input_map.rule)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        traces.end(error)
+
+
+def stage_means(before: dict, after: dict) -> dict:
+    """
+    The mean time of each stage, in milliseconds, between two metrics
+    snapshots.
+    """
+    ret = {}
+    for stage, histogram in after['histograms'].items():
+        old = before['histograms'].get(stage, {'sum': 0.0, 'count': 0})
+        count = histogram['count'] - old['count']
+        if count:
+            ret[stage] = round(
+                (histogram['sum'] - old['sum']) / count * 1000, 3)
+    return ret
+
+
+def error_counts(before: dict, after: dict) -> dict:
+    """
+    The errors counted between two metrics snapshots.
+    """
+    return {name: count - before['errors'].get(name, 0)
+            for name, count in after['errors'].items()
+            if count > before['errors'].get(name, 0)}
+
+
+def run_benchmark(labels: int = 1000, warmup: int = 20,
+                  faults: Faults = None, nak_rate: float = 0.0) -> dict:
+    """
+    Starts a session with the Initialize Microscan rule and then prints
+    labels with the VideoJet Print rule against local printer and scanner
+    simulators.  Output control is switched off for the run.  The current
+    database is used, so run this against a test database.
+    :param labels: The number of labels to time.
+    :param warmup: The number of labels printed before timing starts.
+    :param faults: The latency and faults of the printer while labels are
+        timed.  The session start and warm up run against a well behaved
+        printer.
+    :param nak_rate: The probability of the printer answering a label
+        with NAK while labels are timed.
+    :return: Labels per second, trigger to ACK latency percentiles in
+        milliseconds, database queries per label, the mean time of each
+        print path stage and, if labels failed, how long it took to print
+        again after a failure.
+    """
+    printer = VideojetSimulator().start_in_thread()
+    scanner = MicroscanSimulator().start_in_thread()
+    output_control = conductor_settings.OUTPUT_CONTROL
+    conductor_settings.OUTPUT_CONTROL = False
+    try:
+        create_rules(printer, scanner)
+        start = time.perf_counter()
+        trigger(SESSION_INPUT)
+        session_start = time.perf_counter() - start
+        for i in range(warmup):
+            trigger(PRINT_INPUT)
+        if faults:
+            printer.faults = faults
+        printer.nak_rate = nak_rate
+        before = metrics.metrics.snapshot()
+        latencies = []
+        recoveries = []
+        failed = 0
+        first_failure = None
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for i in range(labels):
+                label_start = time.perf_counter()
+                try:
+                    trigger(PRINT_INPUT)
+                except Exception:
+                    failed += 1
+                    if first_failure is None:
+                        first_failure = label_start
+                    continue
+                now = time.perf_counter()
+                latencies.append(now - label_start)
+                if first_failure is not None:
+                    recoveries.append(now - first_failure)
+                    first_failure = None
+            elapsed = time.perf_counter() - start
+        after = metrics.metrics.snapshot()
+    finally:
+        conductor_settings.OUTPUT_CONTROL = output_control
+        serials.release_buffers()
+        connections.pool.close()
+        protocol.client_thread.close()
+        printer.stop_in_thread()
+        scanner.stop_in_thread()
+    latencies.sort()
+    return {
+        'labels': labels,
+        'seconds': round(elapsed, 3),
+        'labels_per_second': round(len(latencies) / elapsed, 1)
+        if elapsed else 0.0,
+        'failed': failed,
+        'latency_ms': latency_summary(latencies),
+        'queries_per_label': round(len(queries) / labels, 2)
+        if labels else 0.0,
+        'recovery_ms': {
+            'count': len(recoveries),
+            'mean': round(sum(recoveries) / len(recoveries) * 1000, 3)
+            if recoveries else 0.0,
+            'max': round(max(recoveries) * 1000, 3) if recoveries else 0.0,
+        },
+        'session_start_ms': round(session_start * 1000, 3),
+        'stages_ms': stage_means(before, after),
+        'errors': error_counts(before, after),
+        'printed': len([frame for frame in printer.received
+                        if frame.command == 'JDA']),
+        'printer': {'dropped': printer.dropped,
+                    'malformed': printer.malformed,
+                    'connections': printer.connection_count},
+        'settings': get_settings(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+    }
+
+
+def get_settings() -> dict:
+    """
+    :return: The conductor settings that affect the print path.
+    """
+    return {
+        'COMPILED_RULES': conductor_settings.COMPILED_RULES,
+        'VIDEOJET_CLIENT': conductor_settings.VIDEOJET_CLIENT,
+        'PERSISTENT_CONNECTIONS': conductor_settings.PERSISTENT_CONNECTIONS,
+        'SERIAL_BUFFER_SIZE': conductor_settings.SERIAL_BUFFER_SIZE,
+        'SESSION_REGISTRY': conductor_settings.SESSION_REGISTRY,
+    }
+
+
+def latency_summary(latencies: list) -> dict:
+    """
+    :param latencies: Sorted latencies in seconds.
+    :return: The p50, p95, p99 and max latency in milliseconds.
+    """
+    return {
+        'p50': round(percentile(latencies, 50) * 1000, 3),
+        'p95': round(percentile(latencies, 95) * 1000, 3),
+        'p99': round(percentile(latencies, 99) * 1000, 3),
+        'max': round(latencies[-1] * 1000, 3) if latencies else 0.0,
+    }
+
+
+def start_monitor(image, poll_period: float):
+    """
+    Runs the edge triggered input monitor against a process image
+    simulator on a daemon thread.
+    :return: The monitor and its thread.
+    """
+    # imported here since the module sets up django for the command line
+    from quartet_conductor.microscan.inputs import EdgeInputMonitor
+    monitor = EdgeInputMonitor(
+        poll_period=poll_period,
+        process_image=dio.ProcessImage(image.path, image.size),
+        modules=image.offsets,
+        stats_interval=3600
+    )
+
+    def run():
+        try:
+            monitor.run()
+        finally:
+            connection.close()
+
+    thread = threading.Thread(target=run, name='benchmark-monitor',
+                              daemon=True)
+    thread.start()
+    return monitor, thread
+
+
+def wait_until_idle(before: dict, interval: float = .1) -> int:
+    """
+    Waits until no rule has finished for `interval` seconds.
+    :param before: The metrics snapshot taken before the triggers.
+    :return: The number of rules that finished since the snapshot.
+    """
+    start = before['histograms'].get('rule', {'count': 0})['count']
+    handled = -1
+    while True:
+        time.sleep(interval)
+        done = metrics.metrics.snapshot()['histograms'].get(
+            'rule', {'count': 0})['count'] - start
+        if done == handled:
+            return done
+        handled = done
+
+
+def edge_latencies(start_ns: int, input: int = None) -> list:
+    """
+    Returns the sorted time from an edge being seen to its rule finishing
+    for the traces since `start_ns`.
+    """
+    return sorted(
+        t.to_dict()['stages'].get('input', 0.0) + t.total
+        for t in traces.get_traces(last=0, input=input)
+        if t.start_ns >= start_ns
+    )
+
+
+def run_pipeline_benchmark(rate: float = 1000, count: int = 5000,
+                           poll_period: float = .0002,
+                           width: float = None) -> dict:
+    """
+    Runs the whole pipeline without hardware.  The edge triggered input
+    monitor polls the DIO process image simulator while input edges are
+    scripted at a fixed rate, and the rules print to the printer
+    simulator and set outputs on the process image simulator.  The
+    current database is used, so run this against a test database.
+    :param rate: The number of print triggers per second.
+    :param count: The number of print triggers.
+    :param poll_period: The input monitor cycle time in seconds.
+    :param width: How long each trigger stays high.  Default is half of
+        the trigger period.
+    :return: The triggers sent and handled, the handled triggers per
+        second, edge to completion latency percentiles in milliseconds,
+        the mean time of each stage, the output writes and the monitor's
+        cycle statistics.
+    """
+    from quartet_conductor.simulators.dio import get_simulator
+    backend = conductor_settings.DIO_BACKEND
+    conductor_settings.DIO_BACKEND = 'simulator'
+    image = get_simulator()
+    printer = VideojetSimulator().start_in_thread()
+    scanner = MicroscanSimulator().start_in_thread()
+    monitor = None
+    outputs = image.output_count
+    try:
+        create_rules(printer, scanner)
+        trigger(SESSION_INPUT)
+        before = metrics.metrics.snapshot()
+        start_ns = time.monotonic_ns()
+        start = time.perf_counter()
+        # the monitor prints every trigger it handles
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            monitor, thread = start_monitor(image, poll_period)
+            image.start_edges(PRINT_INPUT, rate, count, width).join()
+            handled = wait_until_idle(before)
+            elapsed = time.perf_counter() - start
+            monitor.stop()
+            thread.join()
+        after = metrics.metrics.snapshot()
+    finally:
+        conductor_settings.DIO_BACKEND = backend
+        if monitor is not None:
+            monitor.stop()
+            monitor.process_image.close()
+        image.stop()
+        serials.release_buffers()
+        connections.pool.close()
+        protocol.client_thread.close()
+        printer.stop_in_thread()
+        scanner.stop_in_thread()
+    latencies = edge_latencies(
+        start_ns, dio.input_key(dio.default_module(), PRINT_INPUT))
+    return {
+        'triggers': count,
+        'handled': handled,
+        'rate': rate,
+        'seconds': round(elapsed, 3),
+        'handled_per_second': round(handled / elapsed, 1)
+        if elapsed else 0.0,
+        'latency_ms': latency_summary(latencies),
+        'stages_ms': stage_means(before, after),
+        'errors': error_counts(before, after),
+        'outputs': image.output_count - outputs,
+        'cycles': monitor.stats(),
+        'settings': get_settings(),
+        'python': platform.python_version(),
+        'database': connection.vendor,
+    }
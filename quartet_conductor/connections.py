@@ -0,0 +1,202 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import threading
+from logging import getLogger
+from telnetlib import Telnet
+
+from quartet_conductor import metrics
+from quartet_conductor import recording
+from quartet_conductor import settings as conductor_settings
+
+logger = getLogger(__name__)
+
+
+class PooledConnection:
+    """
+    A telnet connection to a single host and port that is kept open
+    between rule executions.  All writes to the connection are serialized
+    so that two rules can never interleave commands (and replies) on the
+    same device.
+    """
+
+    def __init__(self, pool: 'ConnectionPool', host: str, port: int,
+                 timeout: float):
+        self.pool = pool
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.lock = threading.RLock()
+        self.client = None
+
+    @property
+    def connected(self):
+        return self.client is not None
+
+    def connect(self):
+        """
+        Opens the underlying telnet connection if it is not already open.
+        """
+        if self.client is None:
+            logger.debug('Opening connection to %s:%s', self.host, self.port)
+            with metrics.timer('connect'):
+                self.client = Telnet(self.host, self.port,
+                                     timeout=self.timeout)
+            self.pool.misses += 1
+        else:
+            self.pool.hits += 1
+
+    def close(self):
+        """
+        Closes the underlying telnet connection.  The next write will
+        open a new one.
+        """
+        with self.lock:
+            if self.client is not None:
+                try:
+                    self.client.close()
+                except OSError:
+                    logger.debug('Error closing connection to %s:%s',
+                                 self.host, self.port)
+                self.client = None
+
+    def send(self, data: bytes, read_until: bytes = None) -> bytes:
+        """
+        Writes the data to the host and, if a `read_until` terminator is
+        supplied, reads the reply up to and including the terminator.
+        If the connection turns out to be broken before the data was
+        written it is reopened and the data is written one more time.
+        Once the data was written it is never sent again, since commands
+        such as JDA are not idempotent- a broken connection while reading
+        the reply is closed and the error raised.
+        :param data: The bytes to write.
+        :param read_until: The reply terminator (typically a carriage
+            return) or None if no reply is expected.
+        :return: The reply bytes or an empty bytes instance if no reply
+            was requested.
+        """
+        with self.lock:
+            try:
+                try:
+                    self._write(data)
+                except (OSError, EOFError):
+                    logger.warning('The connection to %s:%s was broken, '
+                                   'reconnecting.', self.host, self.port)
+                    self.close()
+                    self.pool.reconnects += 1
+                    self._write(data)
+                return self._read(read_until)
+            except (OSError, EOFError):
+                self.close()
+                raise
+            finally:
+                if not conductor_settings.PERSISTENT_CONNECTIONS:
+                    self.close()
+
+    def _write(self, data: bytes):
+        self.connect()
+        # discard anything left over from a previous exchange- this will
+        # also raise an EOFError if the host has hung up on us
+        self.client.read_very_eager()
+        with metrics.timer('write'):
+            self.client.write(data)
+        recording.record_send(self.host, self.port, data)
+
+    def _read(self, read_until: bytes = None) -> bytes:
+        ret = b''
+        if read_until:
+            with metrics.timer('ack'):
+                ret = self.client.read_until(read_until,
+                                             timeout=self.timeout)
+            if not ret.endswith(read_until):
+                # a late reply would end up in front of the next one so
+                # start over with a clean connection next time
+                logger.warning('Timed out waiting for a reply from %s:%s.',
+                               self.host, self.port)
+                self.close()
+            if ret:
+                recording.record_receive(self.host, self.port, ret)
+        return ret
+
+
+class ConnectionPool:
+    """
+    Keeps one persistent connection per (host, port) pair and tracks how
+    often an open connection could be reused (hits) versus how often a new
+    one had to be established (misses).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+
+    def get_connection(self, host: str, port: int,
+                       timeout: float = 3) -> PooledConnection:
+        """
+        Returns the pooled connection for the host and port.  The socket
+        itself is opened lazily on the first write.
+        """
+        host, port = recording.resolve(host, port)
+        key = (host, int(port))
+        connection = self.connections.get(key)
+        if connection is None:
+            with self.lock:
+                connection = self.connections.get(key)
+                if connection is None:
+                    connection = PooledConnection(self, host, int(port),
+                                                  timeout)
+                    self.connections[key] = connection
+        return connection
+
+    def close(self, host: str = None, port: int = None):
+        """
+        Closes the connection for the host and port or all of the
+        connections if no host is supplied.
+        """
+        with self.lock:
+            if host is None:
+                connections = list(self.connections.values())
+            else:
+                connection = self.connections.get(
+                    recording.resolve(host, int(port)))
+                connections = [connection] if connection else []
+        for connection in connections:
+            connection.close()
+
+    def stats(self) -> dict:
+        """
+        :return: A dictionary with the pool hit, miss and reconnect counts
+            along with the number of currently open connections.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reconnects': self.reconnects,
+            'open': len([c for c in self.connections.values()
+                         if c.connected])
+        }
+
+
+pool = ConnectionPool()
+
+
+def get_connection(host: str, port: int,
+                   timeout: float = 3) -> PooledConnection:
+    """
+    Returns a connection for the host and port from the process-wide pool.
+    """
+    return pool.get_connection(host, port, timeout)
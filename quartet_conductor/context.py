@@ -0,0 +1,49 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+from collections import ChainMap
+from types import MappingProxyType
+
+
+class LayeredContext(ChainMap):
+    """
+    A rule context dictionary made of a writable layer for the current task
+    over a read-only view of a running session's context.  Lookups fall
+    through to the session layer, writes and deletes only ever touch the
+    task layer, so print tasks can use the session's data without copying
+    it and without being able to change it.
+
+    Values in the session layer are not copied- mutable values such as the
+    job fields dictionary must be treated as read-only by the steps.
+    """
+
+    def __init__(self, local: dict = None, session: dict = None):
+        super().__init__(
+            local if local is not None else {},
+            MappingProxyType(session if session is not None else {})
+        )
+
+    @property
+    def local(self) -> dict:
+        """
+        The writable layer of the current task.
+        """
+        return self.maps[0]
+
+    @property
+    def session(self):
+        """
+        The read-only session layer.
+        """
+        return self.maps[1]
@@ -0,0 +1,202 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from logging import getLogger
+from typing import Callable
+
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+_handlers = {}
+
+
+def get_control_dir() -> str:
+    directory = os.path.join(get_state_dir(), 'control')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def register(command: str, handler: Callable[..., dict]):
+    """
+    Registers the handler for a control command.  The handler is called
+    with the parameters of the request and returns a JSON serializable
+    result.
+    """
+    _handlers[command] = handler
+
+
+def _write_json(path: str, data: dict):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f)
+    os.replace(path + '.tmp', path)
+
+
+def request(command: str, pid: int = None, expires: float = 60,
+            **params) -> str:
+    """
+    Asks the running conductor processes to run a command, for example to
+    start the profiler.  The processes pick the request up within
+    CONTROL_POLL_INTERVAL seconds.
+    :param command: The command name.
+    :param pid: Only this process runs the command.  Default is every
+        process that is listening.
+    :param expires: Processes that see the request later than this many
+        seconds after it was made ignore it.
+    :param params: The parameters to pass to the command handler.
+    :return: The request id.
+    """
+    request_id = uuid.uuid4().hex
+    _write_json(os.path.join(get_control_dir(), '%s.request' % request_id), {
+        'id': request_id,
+        'command': command,
+        'pid': pid,
+        'created': time.time(),
+        'expires': expires,
+        'params': params,
+    })
+    return request_id
+
+
+def get_results(request_id: str) -> list:
+    """
+    :return: The results the processes reported for a request.
+    """
+    ret = []
+    pattern = os.path.join(get_control_dir(), '%s.*.result' % request_id)
+    for path in glob.glob(pattern):
+        with open(path) as f:
+            ret.append(json.load(f))
+    return ret
+
+
+def wait_for_results(request_id: str, timeout: float) -> list:
+    """
+    Waits up to timeout seconds for at least one result for a request.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        results = get_results(request_id)
+        if results or time.monotonic() >= deadline:
+            return results
+        time.sleep(.1)
+
+
+class ControlListener:
+    """
+    Polls the control directory for requests on a daemon thread and runs
+    the registered handler for each new request addressed to this process.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or conductor_settings.CONTROL_POLL_INTERVAL
+        self.handled = set()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run,
+                                           name='conductor-control',
+                                           daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def poll(self):
+        """
+        Handles any new requests.
+        """
+        directory = get_control_dir()
+        now = time.time()
+        for path in glob.glob(os.path.join(directory, '*.request')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            request_id = data['id']
+            age = now - data['created']
+            if age > data['expires'] * 10:
+                # nobody needs the request or its results any more
+                self._remove(path, request_id)
+                continue
+            if request_id in self.handled:
+                continue
+            self.handled.add(request_id)
+            if age > data['expires']:
+                continue
+            if data['pid'] is not None and data['pid'] != os.getpid():
+                continue
+            self.handle(data)
+
+    def handle(self, data: dict):
+        handler = _handlers.get(data['command'])
+        result = {'pid': os.getpid(), 'command': data['command']}
+        if handler is None:
+            result['error'] = 'Unknown command %s.' % data['command']
+        else:
+            try:
+                result['result'] = handler(**data['params'])
+            except Exception as e:
+                logger.exception('Control command %s failed.',
+                                 data['command'])
+                result['error'] = str(e)
+        _write_json(os.path.join(get_control_dir(), '%s.%s.result' % (
+            data['id'], os.getpid())), result)
+
+    def _remove(self, path: str, request_id: str):
+        for name in [path] + glob.glob(os.path.join(
+                get_control_dir(), '%s.*.result' % request_id)):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    def _run(self):
+        # requests made before the process started are not for it
+        self.handled.update(
+            os.path.basename(path).split('.')[0] for path in
+            glob.glob(os.path.join(get_control_dir(), '*.request'))
+        )
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Could not read the control requests.')
+
+
+listener = ControlListener()
+
+
+def start():
+    """
+    Starts listening for control requests in this process.
+    """
+    # the modules that provide commands register them when imported
+    from quartet_conductor import memory, profiler, recording, \
+        session  # noqa: F401
+    listener.start()
@@ -0,0 +1,268 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import mmap
+import os
+from logging import getLogger
+from typing import List, Tuple
+
+from quartet_conductor import settings as conductor_settings
+
+logger = getLogger(__name__)
+
+
+class InvalidAddressError(Exception):
+    """
+    Raised when an input or output address refers to a DIO module that is
+    not configured in DIO_MODULES or to a point the module does not have.
+    """
+    pass
+
+
+def default_module() -> str:
+    """
+    The module used when an address does not name one- the first module
+    in the DIO_MODULES setting.
+    """
+    return conductor_settings.DIO_MODULES[0]
+
+
+def parse_address(address) -> Tuple[str, int]:
+    """
+    Parses an input or output address.  Addresses are either a bare point
+    number, which refers to the default module, or `module:point`, for
+    example `right:3`.
+    :param address: An int, str or bytes address.
+    :return: A tuple of module name and point number.
+    """
+    if isinstance(address, bytes):
+        address = address.decode('ascii')
+    address = str(address).strip()
+    if ':' in address:
+        module, point = address.split(':', 1)
+        module = module.strip() or default_module()
+    else:
+        module, point = default_module(), address
+    try:
+        point = int(point)
+    except ValueError:
+        raise InvalidAddressError('%s is not a valid input or output '
+                                  'address.' % address)
+    check_address(module, point)
+    return module, point
+
+
+def format_address(module: str, point: int) -> str:
+    """
+    The inverse of parse_address.  Points on the default module are
+    formatted as a bare number so that single module installations see
+    the same rule data they always have.
+    """
+    if not module or module == default_module():
+        return str(point)
+    return '%s:%s' % (module, point)
+
+
+def check_address(module: str, point: int):
+    if module not in conductor_settings.DIO_MODULES:
+        raise InvalidAddressError('%s is not a configured DIO module.  '
+                                  'Check the DIO_MODULES setting.' % module)
+    if point < 1 or point > conductor_settings.DIO_INPUTS_PER_MODULE:
+        raise InvalidAddressError(
+            '%s is not a valid point on module %s.  The number must be '
+            'between one and %s.' % (point, module,
+                                     conductor_settings.DIO_INPUTS_PER_MODULE)
+        )
+
+
+def input_key(module: str, point: int) -> int:
+    """
+    Returns a single integer for a module and point which is used as the
+    origin input of sessions.  Points on the default module map to
+    themselves, points on the other modules are offset by the number of
+    inputs per module.
+    """
+    module = module or default_module()
+    index = conductor_settings.DIO_MODULES.index(module)
+    return index * conductor_settings.DIO_INPUTS_PER_MODULE + point
+
+
+def get_input_key(address) -> int:
+    """
+    Parses an address and returns its input key.
+    """
+    return input_key(*parse_address(address))
+
+
+def key_address(key: int) -> str:
+    """
+    The inverse of input_key, formatted by format_address.
+    """
+    index, point = divmod(key - 1, conductor_settings.DIO_INPUTS_PER_MODULE)
+    if key < 1 or index >= len(conductor_settings.DIO_MODULES):
+        raise InvalidAddressError('%s is not a valid input key.' % key)
+    return format_address(conductor_settings.DIO_MODULES[index], point + 1)
+
+
+def parse_address_list(addresses: str) -> List[Tuple[str, int]]:
+    """
+    Parses a comma delimited list of addresses.
+    """
+    return [parse_address(address) for address in addresses.split(',')
+            if address.strip()]
+
+
+def set_output(module: str, point: int, on: bool = True):
+    """
+    Sets an output on a DIO module.  With the DIO_BACKEND setting
+    'simulator' the output is set on the process image simulator instead.
+    """
+    if conductor_settings.DIO_BACKEND == 'simulator':
+        from quartet_conductor.simulators.dio import get_simulator
+        get_simulator().set_output(module, point, on)
+    else:
+        # revpy_dio needs the RevPi hardware so it is only imported here
+        from revpy_dio import outputs
+        outputs.set_output(point, on=on, left=(module == 'left'))
+
+
+class ProcessImage:
+    """
+    Read access to the RevPi process image.  The image is memory mapped
+    when the device supports it so that reading all of a module's inputs
+    is a single slice of memory.  If the driver does not support mmap, a
+    single `pread` call per read is used instead.
+    """
+
+    def __init__(self, path: str = None, size: int = None):
+        if path is None and conductor_settings.DIO_BACKEND == 'simulator':
+            from quartet_conductor.simulators.dio import get_image_path
+            path = get_image_path()
+        self.path = path or conductor_settings.PROCESS_IMAGE
+        self.size = size or conductor_settings.PROCESS_IMAGE_SIZE
+        self.fd = os.open(self.path, os.O_RDONLY)
+        try:
+            self.map = mmap.mmap(self.fd, self.size,
+                                 access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            logger.info('%s can not be memory mapped, using pread.',
+                        self.path)
+            self.map = None
+
+    def read_word(self, offset: int, length: int = 2) -> int:
+        """
+        Reads `length` bytes at `offset` as a little endian integer- one
+        bit per input.
+        """
+        if self.map is not None:
+            data = self.map[offset:offset + length]
+        else:
+            data = os.pread(self.fd, length, offset)
+        return int.from_bytes(data, 'little')
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class Debouncer:
+    """
+    Tracks the stable state of an input word and reports rising and
+    falling edges once a changed input has held its new level for its
+    debounce window.
+    """
+
+    def __init__(self, inputs: int = 16, debounce: dict = None,
+                 default_debounce: float = 0.0, initial: int = 0):
+        self.inputs = inputs
+        self.stable = initial
+        self.windows = [debounce.get(i + 1, default_debounce)
+                        if debounce else default_debounce
+                        for i in range(inputs)]
+        self.pending = [None] * inputs
+        self.idle = [None] * inputs
+
+    def update(self, word: int, now: float):
+        """
+        Compares the word that was just read to the stable state.
+        :param word: The input word.
+        :param now: The current monotonic time.
+        :return: A tuple of lists of rising and falling input numbers
+            (1 based).
+        """
+        rising = []
+        falling = []
+        changed = word ^ self.stable
+        pending = self.pending
+        if not changed and pending == self.idle:
+            return rising, falling
+        for i in range(self.inputs):
+            bit = 1 << i
+            if not changed & bit:
+                pending[i] = None
+                continue
+            if pending[i] is None:
+                pending[i] = now
+            if now - pending[i] >= self.windows[i]:
+                pending[i] = None
+                self.stable ^= bit
+                if word & bit:
+                    rising.append(i + 1)
+                else:
+                    falling.append(i + 1)
+        return rising, falling
+
+
+class CycleStats:
+    """
+    Running statistics for the input polling loop.  Jitter is the standard
+    deviation of the measured cycle period from the target period.
+    """
+
+    def __init__(self, target: float):
+        self.target = target
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.deviation = 0.0
+
+    def add(self, period: float):
+        self.count += 1
+        delta = period - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (period - self.mean)
+        self.deviation += (period - self.target) ** 2
+        self.min = period if self.min is None else min(self.min, period)
+        self.max = period if self.max is None else max(self.max, period)
+
+    def stats(self) -> dict:
+        return {
+            'cycles': self.count,
+            'target': self.target,
+            'mean': self.mean,
+            'min': self.min,
+            'max': self.max,
+            'stddev': (self.m2 / self.count) ** .5 if self.count else 0.0,
+            'jitter': (self.deviation / self.count) ** .5
+            if self.count else 0.0,
+        }
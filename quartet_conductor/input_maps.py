@@ -0,0 +1,81 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import threading
+from logging import getLogger
+
+from quartet_conductor import dio
+from quartet_conductor.invalidation import VersionStamp
+from quartet_conductor.models import InputMap
+
+logger = getLogger(__name__)
+
+
+class InputMapCache:
+    """
+    All of the input maps, loaded in a single query along with their rules
+    and keyed by (module, input number).  The cache is reloaded whenever an
+    input map is saved or deleted in any process on the controller (see
+    quartet_conductor.signals).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stamp = VersionStamp('input_maps')
+        self.input_maps = None
+        self.loads = 0
+
+    def get(self, module: str, input_number: int):
+        """
+        Returns the input map for an input.
+        :param module: The DIO module of the input.
+        :param input_number: The input number.
+        :return: An InputMap instance or None if the input is not mapped.
+        """
+        changed = self.stamp.changed()
+        input_maps = self.input_maps
+        if changed or input_maps is None:
+            input_maps = self.load()
+        return input_maps.get((module or dio.default_module(),
+                               int(input_number)))
+
+    def load(self) -> dict:
+        with self.lock:
+            input_maps = {
+                (input_map.module, input_map.input_number): input_map
+                for input_map in InputMap.objects.select_related('rule')
+            }
+            self.input_maps = input_maps
+            self.loads += 1
+            logger.debug('Loaded %s input maps.', len(input_maps))
+            return input_maps
+
+    def invalidate(self, *args, **kwargs):
+        """
+        Clears the cache here and in the other conductor processes.  The
+        signature allows this to be used directly as a signal receiver.
+        """
+        with self.lock:
+            self.input_maps = None
+        self.stamp.bump()
+
+
+input_map_cache = InputMapCache()
+
+
+def get_input_map(module: str, input_number: int):
+    """
+    Returns the input map for an input or None if the input is not mapped.
+    """
+    return input_map_cache.get(module, input_number)
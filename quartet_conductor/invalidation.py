@@ -0,0 +1,117 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import fcntl
+import os
+import time
+from logging import getLogger
+
+from quartet_conductor import settings as conductor_settings
+
+logger = getLogger(__name__)
+
+# the state directory this process last created- CONDUCTOR_STATE_DIR can
+# be changed at runtime (see benchmarks.temporary_state_dir)
+_created = None
+
+
+def get_state_dir() -> str:
+    """
+    Returns the directory the conductor processes on a controller use to
+    share state, creating it the first time it is used by this process.
+    """
+    global _created
+    state_dir = conductor_settings.CONDUCTOR_STATE_DIR
+    if state_dir != _created:
+        os.makedirs(state_dir, exist_ok=True)
+        _created = state_dir
+    return state_dir
+
+
+class VersionStamp:
+    """
+    A counter kept in a small file in the state directory so that caches
+    in other processes (web workers, the input monitor) can tell that the
+    data they cached has changed.  Every bump moves the modification time
+    of the file forward so checking for a change only takes a stat call.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seen = None
+        self.state_dir = None
+        self._path = None
+
+    @property
+    def path(self) -> str:
+        # checking for a change must not cost more than the stat call-
+        # the directory is only created when the counter is bumped
+        state_dir = conductor_settings.CONDUCTOR_STATE_DIR
+        if state_dir != self.state_dir:
+            self._path = os.path.join(state_dir, '%s.version' % self.name)
+            self.state_dir = state_dir
+        return self._path
+
+    def _stat(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def bump(self) -> int:
+        """
+        Increments the counter.
+        :return: The new value.
+        """
+        get_state_dir()
+        path = self.path
+        with open(path, 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                value = int(f.read() or 0) + 1
+                f.seek(0)
+                f.truncate()
+                f.write(str(value).encode('ascii'))
+                f.flush()
+                # two bumps within the timestamp resolution of the file
+                # system must still look like two changes
+                mtime = max(time.time_ns(), os.fstat(f.fileno()).st_mtime_ns
+                            + 1, (self.seen or 0) + 1)
+                os.utime(path, ns=(mtime, mtime))
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self.seen = mtime
+        return value
+
+    def read(self) -> int:
+        """
+        :return: The current value of the counter.
+        """
+        try:
+            with open(self.path, 'rb') as f:
+                return int(f.read() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def changed(self) -> bool:
+        """
+        Returns True if the counter was bumped since the last call.  The
+        first call always returns True.
+        """
+        current = self._stat()
+        if current != self.seen:
+            self.seen = current
+            return True
+        return False
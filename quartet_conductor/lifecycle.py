@@ -0,0 +1,273 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import sys
+import threading
+import time
+from logging import getLogger
+from typing import Callable
+
+from django.db import connection as db_connection
+
+from quartet_conductor import connections
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.models import Session
+from quartet_conductor.videojet import protocol
+
+logger = getLogger(__name__)
+
+
+def _get_context(session: Session) -> dict:
+    return getattr(session.context, 'context', None) or {}
+
+
+def _get_serial_identifier(session: Session):
+    return _get_context(session).get('SERIAL_IDENTIFIER')
+
+
+def _get_printer(session: Session):
+    context = _get_context(session)
+    host = context.get('PRINTER_HOST')
+    port = context.get('PRINTER_PORT')
+    if host and port:
+        return host, int(port)
+
+
+def release_printer_queue(origin_input: int, session: Session):
+    """
+    Stops the session's printer queue, if any.
+    """
+    # the printer queue and the serial number buffers import serialbox,
+    # which is only needed once a session prints
+    from quartet_conductor.videojet import queue as printer_queue
+    printer_queue.stop_queue(origin_input)
+
+
+def hold_printer_queue(origin_input: int, session: Session):
+    """
+    Stops the session's printer queue, if any, while the session is paused.
+    """
+    from quartet_conductor.videojet import queue as printer_queue
+    printer_queue.pause_queue(origin_input)
+
+
+def resume_printer_queue(origin_input: int, session: Session):
+    """
+    Restarts the printer queue of a session that was paused.
+    """
+    from quartet_conductor.videojet import queue as printer_queue
+    printer_queue.resume_queue(origin_input)
+
+
+def has_printer_queue(origin_input: int) -> bool:
+    """
+    :return: Whether the session has a printer queue, running or held.
+    """
+    from quartet_conductor.videojet import queue as printer_queue
+    return printer_queue.get_queue(origin_input) is not None
+
+
+def release_serial_numbers(origin_input: int, session: Session):
+    """
+    Releases the serial number buffer used by the session unless another
+    running session prints from the same pool.
+    """
+    from quartet_conductor.videojet import serials
+    serial_identifier = _get_serial_identifier(session)
+    if not serial_identifier:
+        return
+    in_use = [s for s in Session.get_sessions()
+              if _get_serial_identifier(s) == serial_identifier]
+    if not in_use:
+        serials.release_buffers(serial_identifier)
+
+
+def release_connections(origin_input: int, session: Session):
+    """
+    Closes the pooled connections to the session's printer unless another
+    running session uses the same printer.
+    """
+    printer = _get_printer(session)
+    if not printer:
+        return
+    if any(_get_printer(s) == printer for s in Session.get_sessions()):
+        return
+    connections.pool.close(*printer)
+    protocol.client_thread.close_client(*printer)
+
+
+def estimate_size(obj, seen: set = None) -> int:
+    """
+    Returns a rough estimate of the memory held by an object and everything
+    it refers to through dictionaries, sequences and instance attributes.
+    """
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        size += estimate_size(vars(obj), seen)
+    return size
+
+
+class LifecycleManager:
+    """
+    Releases everything a session holds- its entry in the session registry,
+    its rule context and any printer queues, pooled connections and serial
+    number buffers nobody else needs- when it is finished or when it has
+    not been used for SESSION_IDLE_TTL seconds.
+
+    An evicted session is not finished.  It stays RUNNING in the database
+    and is restored from its snapshot the next time its input is used.
+    Sessions with a printer queue are never evicted.
+    Idle times are tracked by the process that prints, normally the input
+    monitor.
+    """
+
+    def __init__(self, ttl: float = None, interval: float = None):
+        self.ttl = conductor_settings.SESSION_IDLE_TTL if ttl is None \
+            else ttl
+        self.interval = interval or max(min(self.ttl / 4, 60), 1)
+        self.lock = threading.Lock()
+        self.last_used = {}
+        self.hooks = [release_printer_queue, release_serial_numbers,
+                      release_connections]
+        self.evictions = 0
+        self.reaper = None
+        self.stop_event = threading.Event()
+
+    def add_release_hook(self, hook: Callable[[int, Session], None]):
+        """
+        Registers a callable that is passed the origin input and session
+        whenever a session is finished or evicted.
+        """
+        self.hooks.append(hook)
+
+    def touch(self, origin_input: int):
+        """
+        Records that the session for an origin input was used.
+        """
+        self.last_used[origin_input] = time.monotonic()
+        if self.reaper is None and self.ttl > 0:
+            self.start()
+
+    def release(self, origin_input: int, session: Session):
+        """
+        Runs the release hooks for a session that has been removed from
+        the registry.
+        """
+        self.last_used.pop(origin_input, None)
+        for hook in self.hooks:
+            try:
+                hook(origin_input, session)
+            except Exception:
+                logger.exception('Could not release %s for session %s.',
+                                 hook.__name__, session.lot)
+
+    def evict_idle(self, now: float = None) -> list:
+        """
+        Evicts the sessions that have been idle for longer than the TTL.
+        Sessions that were never used in this process start their idle
+        time now.
+        :return: The lots of the evicted sessions.
+        """
+        now = now if now is not None else time.monotonic()
+        evicted = []
+        with self.lock:
+            for session in Session.get_sessions():
+                origin_input = session.origin_input
+                last_used = self.last_used.setdefault(origin_input, now)
+                if now - last_used < self.ttl:
+                    continue
+                if has_printer_queue(origin_input):
+                    # the queue is only started by the session start rule
+                    # so it could not be restored with the session
+                    logger.debug('Not evicting session %s, it has a '
+                                 'printer queue.', session.lot)
+                    continue
+                Session.evict_session(origin_input)
+                self.release(origin_input, session)
+                self.evictions += 1
+                evicted.append(session.lot)
+                logger.info('Evicted session %s after %s idle seconds.',
+                            session.lot, int(now - last_used))
+        return evicted
+
+    def memory_usage(self) -> dict:
+        """
+        :return: The estimated number of bytes held by each running
+            session, by lot, including its buffered serial numbers and
+            printer queue.
+        """
+        from quartet_conductor.videojet import queue as printer_queue
+        from quartet_conductor.videojet import serials
+        ret = {}
+        for session in Session.get_sessions():
+            if session.origin_input is None:
+                continue
+            size = estimate_size(session.context)
+            serial_identifier = _get_serial_identifier(session)
+            for buffer in serials.get_buffers(serial_identifier):
+                size += estimate_size(buffer.queue)
+            queue = printer_queue.get_queue(session.origin_input)
+            if queue is not None:
+                size += estimate_size(queue.sent)
+            ret[session.lot] = size
+        return ret
+
+    def stats(self) -> dict:
+        memory = self.memory_usage()
+        return {
+            'sessions': len(memory),
+            'evictions': self.evictions,
+            'memory': memory,
+            'total_memory': sum(memory.values()),
+        }
+
+    def start(self):
+        """
+        Starts the thread that evicts idle sessions.
+        """
+        with self.lock:
+            if self.reaper is not None:
+                return
+            self.stop_event.clear()
+            self.reaper = threading.Thread(target=self._run,
+                                           name='session-reaper',
+                                           daemon=True)
+            self.reaper.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.reaper is not None:
+            self.reaper.join()
+            self.reaper = None
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.evict_idle()
+            except Exception:
+                logger.exception('Could not evict idle sessions.')
+            finally:
+                db_connection.close()
+
+
+manager = LifecycleManager()
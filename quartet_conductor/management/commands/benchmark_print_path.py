@@ -0,0 +1,183 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.translation import gettext as _
+
+from quartet_conductor import benchmarks
+from quartet_conductor import query_budget
+from quartet_conductor.simulators.base import Faults
+
+
+class Command(BaseCommand):
+    help = _('Benchmarks the print path.  A session is started with the '
+             'Initialize Microscan rule and labels are printed with the '
+             'VideoJet Print rule against local printer and scanner '
+             'simulators, in a throwaway test database.  Labels per '
+             'second, trigger to ACK latency percentiles and database '
+             'queries per label are written as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--labels',
+            action='store',
+            type=int,
+            help='The number of labels to print.',
+            default=1000
+        )
+        parser.add_argument(
+            '-w',
+            '--warmup',
+            action='store',
+            type=int,
+            help='The number of labels printed before timing starts.',
+            default=20
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            action='store',
+            help='Write the results to this file instead of stdout.'
+        )
+        parser.add_argument(
+            '--pipeline',
+            action='store_true',
+            help='Drive the edge triggered input monitor with inputs on the '
+                 'DIO process image simulator instead of triggering the '
+                 'rules directly.'
+        )
+        parser.add_argument(
+            '-r',
+            '--rate',
+            action='store',
+            type=float,
+            help='With --pipeline, the number of triggers per second.',
+            default=1000
+        )
+        parser.add_argument(
+            '-p',
+            '--period',
+            action='store',
+            type=float,
+            help='With --pipeline, the input monitor cycle time in '
+                 'milliseconds.',
+            default=.2
+        )
+        parser.add_argument(
+            '--queries',
+            action='store_true',
+            help='Count the database queries of each rule trigger by step '
+                 'and fail if a rule is over its budget in the '
+                 'QUERY_BUDGETS setting.  --labels is the number of print '
+                 'triggers counted.'
+        )
+        add_fault_arguments(parser)
+        parser.add_argument(
+            '--nak-rate',
+            action='store',
+            type=float,
+            help='The probability of the printer answering a label with '
+                 'NAK.',
+            default=0.0
+        )
+
+    def handle(self, *args, **options):
+        if options['labels'] < 1:
+            raise CommandError('--labels must be at least one.')
+        # the rules log every step at info level which would swamp the
+        # timings
+        logging.disable(logging.INFO)
+        # nothing the run writes may reach the running conductor
+        with benchmarks.temporary_state_dir():
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                               serialize=False)
+            try:
+                if options['queries']:
+                    results = query_budget.run_query_budget(
+                        options['labels'], raise_exception=False)
+                elif options['pipeline']:
+                    results = benchmarks.run_pipeline_benchmark(
+                        options['rate'], options['labels'],
+                        options['period'] / 1000)
+                else:
+                    results = benchmarks.run_benchmark(options['labels'],
+                                                       options['warmup'],
+                                                       get_faults(options),
+                                                       options['nak_rate'])
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                logging.disable(logging.NOTSET)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+        if options['queries'] and results['violations']:
+            raise CommandError('\n\n'.join(results['violations']))
+
+
+def add_fault_arguments(parser):
+    """
+    Adds the simulator latency and fault options to a command.
+    """
+    parser.add_argument(
+        '--latency',
+        action='store',
+        type=float,
+        help='The printer reply latency in milliseconds.',
+        default=0.0
+    )
+    parser.add_argument(
+        '--jitter',
+        action='store',
+        type=float,
+        help='A random extra latency of up to this many milliseconds.',
+        default=0.0
+    )
+    parser.add_argument(
+        '--drop-rate',
+        action='store',
+        type=float,
+        help='The probability of the connection being dropped instead '
+             'of a reply.',
+        default=0.0
+    )
+    parser.add_argument(
+        '--malformed-rate',
+        action='store',
+        type=float,
+        help='The probability of a reply being malformed.',
+        default=0.0
+    )
+    parser.add_argument(
+        '--seed',
+        action='store',
+        type=int,
+        help='Seeds the fault injection for repeatable runs.'
+    )
+
+
+def get_faults(options: dict) -> Faults:
+    return Faults(latency=options['latency'] / 1000,
+                  jitter=options['jitter'] / 1000,
+                  drop_rate=options['drop_rate'],
+                  malformed_rate=options['malformed_rate'],
+                  seed=options['seed'])
@@ -0,0 +1,111 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from quartet_conductor import dio
+from quartet_conductor import traces
+
+
+class Command(BaseCommand):
+    help = _('Prints the most recent per-trigger traces of all of the '
+             'conductor processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-n',
+            '--last',
+            action='store',
+            type=int,
+            help='The number of traces to print.',
+            default=20
+        )
+        parser.add_argument(
+            '-i',
+            '--input',
+            action='store',
+            help='Only print the traces of this input- a point on the '
+                 'default DIO module or a module:point address, for '
+                 'example right:3.'
+        )
+        parser.add_argument(
+            '-l',
+            '--lot',
+            action='store',
+            help='Only print the traces of this lot.'
+        )
+        parser.add_argument(
+            '--failed',
+            action='store_true',
+            help='Only print the traces of failed triggers.'
+        )
+        parser.add_argument(
+            '-s',
+            '--slower-than',
+            action='store',
+            type=float,
+            help='Only print traces that took longer than this many '
+                 'milliseconds.'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Print the traces as JSON.'
+        )
+
+    def handle(self, *args, **options):
+        slower_than = options['slower_than']
+        input_key = None
+        if options['input']:
+            try:
+                input_key = dio.get_input_key(options['input'])
+            except dio.InvalidAddressError as e:
+                raise CommandError(str(e))
+        found = traces.get_traces(
+            last=options['last'],
+            input=input_key,
+            lot=options['lot'],
+            failed=options['failed'],
+            slower_than=slower_than / 1000 if slower_than else None
+        )
+        if options['json']:
+            self.stdout.write(json.dumps([t.to_dict() for t in found],
+                                         indent=2))
+            return
+        for trace in found:
+            data = trace.to_dict()
+            stages = ' '.join('%s=%.3f' % (stage, seconds * 1000)
+                              for stage, seconds in data['stages'].items())
+            self.stdout.write('%s input=%s lot=%s serial=%s %s%s '
+                              'total=%.3fms %s' % (
+                                  datetime.fromtimestamp(
+                                      trace.started).isoformat(),
+                                  self.format_input(trace.input),
+                                  trace.lot, trace.serial_number,
+                                  data['outcome'],
+                                  ' (%s)' % trace.error if trace.error
+                                  else '',
+                                  trace.total * 1000, stages
+                              ))
+
+    def format_input(self, key: int) -> str:
+        try:
+            return dio.key_address(key)
+        except dio.InvalidAddressError:
+            # not triggered by an input
+            return str(key)
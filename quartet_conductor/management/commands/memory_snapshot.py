@@ -0,0 +1,109 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from quartet_conductor import control
+
+
+class Command(BaseCommand):
+    help = _('Asks the running input monitor for a tracemalloc snapshot '
+             'of its memory or for the difference between two earlier '
+             'snapshots.  The first snapshot starts tracing, so take a '
+             'second one later and compare the two to find leaks.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-d',
+            '--diff',
+            action='store',
+            type=int,
+            nargs=2,
+            metavar=('FIRST', 'SECOND'),
+            help='Compare two snapshots instead of taking a new one.'
+        )
+        parser.add_argument(
+            '-n',
+            '--limit',
+            action='store',
+            type=int,
+            help='The number of allocation sites to report.',
+            default=10
+        )
+        parser.add_argument(
+            '--stop',
+            action='store_true',
+            help='Stop tracing and remove the snapshots.'
+        )
+        parser.add_argument(
+            '-p',
+            '--pid',
+            action='store',
+            type=int,
+            help='Only ask this process.'
+        )
+        parser.add_argument(
+            '--json',
+            action='store_true',
+            help='Write the results as JSON.'
+        )
+
+    def handle(self, *args, **options):
+        if options['stop']:
+            request_id = control.request('memory_stop', pid=options['pid'])
+        elif options['diff']:
+            first, second = options['diff']
+            request_id = control.request('memory_diff', pid=options['pid'],
+                                         first=first, second=second,
+                                         limit=options['limit'])
+        else:
+            request_id = control.request('memory_snapshot',
+                                         pid=options['pid'],
+                                         limit=options['limit'])
+        # a snapshot walks every allocation so give it some time
+        results = control.wait_for_results(request_id, 30)
+        if not results:
+            self.stderr.write('No conductor process answered.  Make sure '
+                              'the input monitor is running.')
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for result in results:
+            if 'error' in result:
+                self.stderr.write('%s: %s' % (result['pid'],
+                                              result['error']))
+            elif 'result' in result and 'top' in result['result']:
+                self.write_report(result['pid'], result['result'])
+            else:
+                self.stdout.write('Stopped tracing in process %s.' %
+                                  result['pid'])
+
+    def write_report(self, pid: int, report: dict):
+        if 'id' in report:
+            self.stdout.write('Process %s snapshot %s: %s bytes traced, '
+                              '%s peak' % (pid, report['id'],
+                                           report['traced'], report['peak']))
+            size_key, count_key = 'size', 'count'
+        else:
+            self.stdout.write('Process %s snapshot %s -> %s: %+d bytes' % (
+                pid, report['first'], report['second'], report['size_diff']))
+            size_key, count_key = 'size_diff', 'count_diff'
+        for site in report['top']:
+            self.stdout.write('  %+12d B %+8d  %s' % (
+                site[size_key], site[count_key], site['location']))
+        self.stdout.write('  objects: %s' % ', '.join(
+            '%s=%s' % item for item in report['objects'].items()))
@@ -0,0 +1,114 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import json
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils.translation import gettext as _
+
+from quartet_conductor import benchmarks
+from quartet_conductor import microbenchmarks
+
+
+class Command(BaseCommand):
+    help = _('Runs the microbenchmarks of the print path primitives- '
+             'session lookups under contending threads, the Get Session '
+             'and match string steps, printer command formatting and job '
+             'field parsing- against local printer and scanner simulators, '
+             'in a throwaway test database.  The nanoseconds per call of '
+             'each benchmark are written as JSON and can be compared with '
+             'an earlier run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-b',
+            '--benchmark',
+            action='append',
+            choices=list(microbenchmarks.BENCHMARKS),
+            help='Run only this benchmark, can be given more than once.'
+        )
+        parser.add_argument(
+            '-r',
+            '--repeat',
+            action='store',
+            type=int,
+            help='The number of timed rounds of each benchmark.',
+            default=20
+        )
+        parser.add_argument(
+            '-t',
+            '--min-time',
+            action='store',
+            type=float,
+            help='The minimum length of a round in milliseconds.',
+            default=50
+        )
+        parser.add_argument(
+            '--threads',
+            action='store',
+            help='The comma separated thread counts to look up the session '
+                 'with.',
+            default='1,2,4,8'
+        )
+        parser.add_argument(
+            '-o',
+            '--output',
+            action='store',
+            help='Write the results to this file instead of stdout.'
+        )
+        parser.add_argument(
+            '-c',
+            '--compare',
+            action='store',
+            help='The results file of an earlier run to compare with.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            threads = [int(count) for count in options['threads'].split(',')]
+        except ValueError:
+            raise CommandError('--threads must be a comma separated list of '
+                               'numbers.')
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+        # the rules log every step at info level
+        logging.disable(logging.INFO)
+        # nothing the run writes may reach the running conductor
+        with benchmarks.temporary_state_dir():
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                               serialize=False)
+            try:
+                results = microbenchmarks.run_microbenchmarks(
+                    options['benchmark'], options['repeat'],
+                    options['min_time'] / 1000, threads)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                logging.disable(logging.NOTSET)
+        if baseline:
+            results['comparison'] = microbenchmarks.compare(baseline,
+                                                            results)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+        if baseline:
+            self.stderr.write(microbenchmarks.format_comparison(
+                results['comparison']))
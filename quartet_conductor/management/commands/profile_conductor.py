@@ -0,0 +1,85 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from quartet_conductor import control
+from quartet_conductor import profiler
+
+
+class Command(BaseCommand):
+    help = _('Asks the running input monitor to profile itself for a '
+             'number of seconds or input triggers.  The collapsed stacks '
+             'are written to the PROFILE_DIR directory.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-s',
+            '--seconds',
+            action='store',
+            type=float,
+            help='Stop profiling after this many seconds.',
+            default=30
+        )
+        parser.add_argument(
+            '-t',
+            '--triggers',
+            action='store',
+            type=int,
+            help='Stop profiling after this many input triggers.'
+        )
+        parser.add_argument(
+            '-i',
+            '--interval',
+            action='store',
+            type=float,
+            help='The sampling interval in milliseconds.',
+            default=5
+        )
+        parser.add_argument(
+            '-p',
+            '--pid',
+            action='store',
+            type=int,
+            help='Only profile this process.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            profiler.check_profile(options['seconds'], options['triggers'],
+                                   options['interval'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        request_id = control.request(
+            'profile',
+            pid=options['pid'],
+            seconds=options['seconds'],
+            triggers=options['triggers'],
+            interval_ms=options['interval']
+        )
+        results = control.wait_for_results(request_id, 5)
+        if not results:
+            self.stderr.write('No conductor process answered.  Make sure '
+                              'the input monitor is running.')
+        for result in results:
+            if 'error' in result:
+                self.stderr.write('%s: %s' % (result['pid'],
+                                              result['error']))
+            else:
+                self.stdout.write('Profiling process %s for up to %s '
+                                  'seconds, writing to %s.' % (
+                                      result['pid'],
+                                      result['result']['seconds'],
+                                      result['result']['directory']))
@@ -0,0 +1,93 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils.translation import gettext as _
+
+from quartet_conductor import benchmarks, recording, replay
+
+
+class Command(BaseCommand):
+    help = _('Replays a traffic log recorded by the input monitor (see '
+             'inputs.py --record).  The input edges are fed to the DIO '
+             'process image simulator at the recorded times, or faster, '
+             'while the edge triggered input monitor runs the rules, and '
+             'the recorded printers and scanners are replaced with '
+             'simulators that answer like they did.  The rules, number '
+             'pools, input maps and sessions are copied into a throwaway '
+             'test database for the replay so nothing it allocates or '
+             'records reaches the database or the running conductor.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'log',
+            help='The traffic log to replay.'
+        )
+        parser.add_argument(
+            '-x',
+            '--speed',
+            action='store',
+            type=float,
+            help='Replay this many times faster than recorded.  Default '
+                 'is real time.',
+            default=1.0
+        )
+        parser.add_argument(
+            '-p',
+            '--period',
+            action='store',
+            type=float,
+            help='The input monitor cycle time in milliseconds.',
+            default=.5
+        )
+        parser.add_argument(
+            '-w',
+            '--width',
+            action='store',
+            type=float,
+            help='How long each replayed edge stays high in milliseconds.',
+            default=2
+        )
+        parser.add_argument(
+            '--dump',
+            action='store_true',
+            help='Print the records of the log as JSON lines instead of '
+                 'replaying it.'
+        )
+
+    def handle(self, *args, **options):
+        if options['dump']:
+            for record in recording.read_log(options['log']):
+                self.stdout.write(json.dumps(record.to_dict()))
+            return
+        logging.disable(logging.INFO)
+        configuration = replay.copy_configuration()
+        # nothing the replay writes may reach the running conductor
+        with benchmarks.temporary_state_dir():
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                               serialize=False)
+            try:
+                replay.load_configuration(configuration)
+                results = replay.replay(options['log'], options['speed'],
+                                        options['period'] / 1000,
+                                        options['width'] / 1000)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+                logging.disable(logging.NOTSET)
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,90 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from quartet_conductor.management.commands.benchmark_print_path import \
+    add_fault_arguments, get_faults
+from quartet_conductor.simulators.microscan import MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+
+
+class Command(BaseCommand):
+    help = _('Runs a simulated Videojet printer and Microscan reader until '
+             'interrupted so the conductor can be load tested without '
+             'devices.  Point the Host and Port step parameters of the '
+             'rules at the simulators.  The latency and fault options '
+             'apply to both.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--host',
+            action='store',
+            help='The address to listen on.',
+            default='127.0.0.1'
+        )
+        parser.add_argument(
+            '-p',
+            '--printer-port',
+            action='store',
+            type=int,
+            help='The printer port.',
+            default=777
+        )
+        parser.add_argument(
+            '-s',
+            '--scanner-port',
+            action='store',
+            type=int,
+            help='The scanner port.',
+            default=2001
+        )
+        add_fault_arguments(parser)
+        parser.add_argument(
+            '--nak-rate',
+            action='store',
+            type=float,
+            help='The probability of the printer answering JDA with NAK.',
+            default=0.0
+        )
+
+    def handle(self, *args, **options):
+        printer = VideojetSimulator(options['host'], options['printer_port'],
+                                    faults=get_faults(options),
+                                    nak_rate=options['nak_rate'])
+        scanner = MicroscanSimulator(options['host'], options['scanner_port'],
+                                     faults=get_faults(options))
+        printer.start_in_thread()
+        scanner.start_in_thread()
+        self.stdout.write('Printer listening on %s:%s, scanner on %s:%s.  '
+                          'Press Ctrl+C to stop.' % (
+                              printer.host, printer.port,
+                              scanner.host, scanner.port))
+        try:
+            while True:
+                time.sleep(10)
+                self.stdout.write(
+                    'printer: %s frames, %s connections, %s dropped, %s '
+                    'malformed; scanner: %s commands' % (
+                        len(printer.received), printer.connection_count,
+                        printer.dropped, printer.malformed,
+                        len(scanner.received)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            printer.stop_in_thread()
+            scanner.stop_in_thread()
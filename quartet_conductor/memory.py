@@ -0,0 +1,153 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import gc
+import glob
+import os
+import threading
+import tracemalloc
+from collections import Counter
+from logging import getLogger
+
+from quartet_conductor import control
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+# the conductor types whose live instances are counted in each snapshot
+TRACKED_TYPES = ('Session', 'InputMap', 'RuleContext', 'LayeredContext',
+                 'CompiledRule', 'PooledConnection', 'Telnet',
+                 'SyncVideojetClient', 'SerialNumberBuffer', 'PrinterQueue',
+                 'Task', 'TaskMessage')
+
+_lock = threading.Lock()
+_counts = {}
+
+
+def get_memory_dir() -> str:
+    directory = os.path.join(get_state_dir(), 'memory')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def count_objects() -> dict:
+    """
+    Counts the live instances of the conductor types.
+    """
+    counts = Counter()
+    for obj in gc.get_objects():
+        name = type(obj).__name__
+        if name in TRACKED_TYPES:
+            counts[name] += 1
+    return {name: counts.get(name, 0) for name in TRACKED_TYPES}
+
+
+def _snapshot_path(snapshot_id: int) -> str:
+    return os.path.join(get_memory_dir(),
+                        '%s-%s.snapshot' % (os.getpid(), snapshot_id))
+
+
+def _top(stats, limit: int) -> list:
+    return [{
+        'location': '%s:%s' % (stat.traceback[0].filename,
+                               stat.traceback[0].lineno),
+        'size': stat.size,
+        'count': stat.count,
+        'size_diff': getattr(stat, 'size_diff', stat.size),
+        'count_diff': getattr(stat, 'count_diff', stat.count),
+    } for stat in stats[:limit]]
+
+
+def take_snapshot(limit: int = 10, frames: int = 1, keep: int = 10) -> dict:
+    """
+    Takes a tracemalloc snapshot of this process and counts the live
+    instances of the conductor types.  The first call starts tracemalloc,
+    so only allocations made after it are seen.  Snapshots are written to
+    the memory directory of CONDUCTOR_STATE_DIR and only the last `keep`
+    are kept.
+    :param limit: The number of top allocation sites to report.
+    :param frames: The number of frames tracemalloc keeps per allocation
+        if it has to be started.
+    :param keep: The number of snapshot files to keep.
+    :return: The snapshot id, the traced memory, the top allocation sites
+        and the object counts.
+    """
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+        logger.info('Started tracemalloc.')
+    gc.collect()
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ))
+    with _lock:
+        snapshot_id = max(_counts or [0]) + 1
+        _counts[snapshot_id] = count_objects()
+        snapshot.dump(_snapshot_path(snapshot_id))
+        for old_id in sorted(_counts)[:-keep]:
+            _counts.pop(old_id)
+            try:
+                os.remove(_snapshot_path(old_id))
+            except OSError:
+                pass
+    current, peak = tracemalloc.get_traced_memory()
+    return {
+        'id': snapshot_id,
+        'traced': current,
+        'peak': peak,
+        'top': _top(snapshot.statistics('lineno'), limit),
+        'objects': _counts[snapshot_id],
+    }
+
+
+def diff_snapshots(first: int, second: int, limit: int = 10) -> dict:
+    """
+    Compares two snapshots taken by this process.
+    :param first: The id of the older snapshot.
+    :param second: The id of the newer snapshot.
+    :param limit: The number of allocation sites to report.
+    :return: The allocation sites that grew the most and the change in the
+        object counts.
+    """
+    old = tracemalloc.Snapshot.load(_snapshot_path(first))
+    new = tracemalloc.Snapshot.load(_snapshot_path(second))
+    stats = new.compare_to(old, 'lineno')
+    old_counts = _counts.get(first, {})
+    new_counts = _counts.get(second, {})
+    return {
+        'first': first,
+        'second': second,
+        'size_diff': sum(stat.size_diff for stat in stats),
+        'top': _top(stats, limit),
+        'objects': {name: new_counts.get(name, 0) - old_counts.get(name, 0)
+                    for name in TRACKED_TYPES},
+    }
+
+
+def stop_tracing() -> dict:
+    """
+    Stops tracemalloc and removes the snapshots of this process.
+    """
+    tracemalloc.stop()
+    with _lock:
+        _counts.clear()
+        for path in glob.glob(os.path.join(get_memory_dir(),
+                                           '%s-*.snapshot' % os.getpid())):
+            os.remove(path)
+    return {'tracing': False}
+
+
+control.register('memory_snapshot', take_snapshot)
+control.register('memory_diff', diff_snapshots)
+control.register('memory_stop', stop_tracing)
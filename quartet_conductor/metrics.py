@@ -0,0 +1,266 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import glob
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from logging import getLogger
+
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor import traces
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+# upper bounds of the latency buckets in seconds
+BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25,
+           .5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    """
+    Counts observations in fixed latency buckets.
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        # one count per bucket plus one for +Inf, not cumulative
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self) -> dict:
+        return {'counts': list(self.counts), 'sum': self.sum,
+                'count': self.count}
+
+    def merge(self, data: dict):
+        for i, count in enumerate(data['counts']):
+            self.counts[i] += count
+        self.sum += data['sum']
+        self.count += data['count']
+
+
+class Timer:
+    """
+    Observes the time spent in a `with` block for a stage.
+    """
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.stage, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """
+    Latency histograms for each stage of the print path and error counts
+    by exception type.  Each process writes its own metrics to a file in
+    the metrics directory of CONDUCTOR_STATE_DIR every
+    METRICS_EXPORT_INTERVAL seconds, so the metrics endpoint in the web
+    process can report the metrics of the input monitor as well.  The
+    file is written by a daemon thread started on the first observation so
+    the print path never waits on the disk.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.errors = {}
+        self.exporter = None
+
+    def observe(self, stage: str, seconds: float):
+        """
+        Records the time a stage took.
+        """
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+        traces.record_stage(stage, seconds)
+        if self.exporter is None:
+            self._start_exporter()
+
+    def timer(self, stage: str) -> Timer:
+        """
+        Returns a context manager that records the time spent in it.
+        """
+        return Timer(self, stage)
+
+    def count_error(self, exc: BaseException):
+        """
+        Counts an exception by its type name.  An exception is only counted
+        once even if it is reported again further up the stack.
+        """
+        if getattr(exc, '_conductor_counted', False):
+            return
+        try:
+            exc._conductor_counted = True
+        except AttributeError:
+            pass
+        name = type(exc).__name__
+        with self.lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        if self.exporter is None:
+            self._start_exporter()
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'histograms': {stage: histogram.to_dict() for
+                               stage, histogram in self.histograms.items()},
+                'errors': dict(self.errors),
+            }
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.errors = {}
+
+    @property
+    def directory(self) -> str:
+        directory = os.path.join(get_state_dir(), 'metrics')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _start_exporter(self):
+        with self.lock:
+            if self.exporter is not None:
+                return
+            interval = conductor_settings.METRICS_EXPORT_INTERVAL
+            # with no interval there is nothing to start- the placeholder
+            # keeps observe from trying again
+            self.exporter = threading.Thread(
+                target=self._export_loop, args=(interval,), daemon=True,
+                name='metrics-exporter'
+            )
+            if interval:
+                self.exporter.start()
+
+    def _export_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            self.export()
+
+    def _forked(self):
+        # the exporter thread is not copied into a forked child and the
+        # lock may have been held by another thread while forking
+        self.lock = threading.Lock()
+        self.exporter = None
+
+    def export(self):
+        """
+        Writes the metrics of this process to the metrics directory.
+        """
+        path = os.path.join(self.directory, '%s.json' % os.getpid())
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception('Could not export the metrics.')
+
+    def collect(self) -> dict:
+        """
+        Merges the metrics of this process with those exported by the
+        other conductor processes that are still running.
+        """
+        histograms = {}
+        errors = {}
+        snapshots = [self.snapshot()]
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            pid = int(os.path.basename(path).split('.')[0])
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(path)
+                continue
+            except PermissionError:
+                pass
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                logger.warning('Could not read the metrics in %s.', path)
+        for snapshot in snapshots:
+            for stage, data in snapshot['histograms'].items():
+                histograms.setdefault(stage, Histogram()).merge(data)
+            for name, count in snapshot['errors'].items():
+                errors[name] = errors.get(name, 0) + count
+        return {'histograms': histograms, 'errors': errors}
+
+    def render(self) -> str:
+        """
+        :return: The metrics of all conductor processes in the Prometheus
+            text exposition format.
+        """
+        collected = self.collect()
+        lines = [
+            '# HELP quartet_conductor_stage_seconds Print path latency by '
+            'stage.',
+            '# TYPE quartet_conductor_stage_seconds histogram',
+        ]
+        for stage, histogram in sorted(collected['histograms'].items()):
+            cumulative = 0
+            bounds = [str(b) for b in histogram.buckets] + ['+Inf']
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append('quartet_conductor_stage_seconds_bucket'
+                             '{stage="%s",le="%s"} %s' %
+                             (stage, bound, cumulative))
+            lines.append('quartet_conductor_stage_seconds_sum{stage="%s"} %s'
+                         % (stage, histogram.sum))
+            lines.append('quartet_conductor_stage_seconds_count'
+                         '{stage="%s"} %s' % (stage, histogram.count))
+        lines += [
+            '# HELP quartet_conductor_errors_total Errors by exception type.',
+            '# TYPE quartet_conductor_errors_total counter',
+        ]
+        for name, count in sorted(collected['errors'].items()):
+            lines.append('quartet_conductor_errors_total{type="%s"} %s' %
+                         (name, count))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+os.register_at_fork(after_in_child=metrics._forked)
+
+
+def observe(stage: str, seconds: float):
+    metrics.observe(stage, seconds)
+
+
+def timer(stage: str) -> Timer:
+    return metrics.timer(stage)
+
+
+def count_error(exc: BaseException):
+    metrics.count_error(exc)
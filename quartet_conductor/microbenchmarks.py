@@ -0,0 +1,400 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import gc
+import platform
+import statistics
+import threading
+import time
+from datetime import datetime
+from logging import getLogger
+from typing import Callable
+
+from quartet_capture import models
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import benchmarks
+from quartet_conductor import connections
+from quartet_conductor import dio
+from quartet_conductor import session
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.microscan.utils import convert_command_value
+from quartet_conductor.rules import rule_cache
+from quartet_conductor.simulators.microscan import MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol, serials
+from quartet_conductor.videojet.steps import ContextFields, \
+    parse_job_fields
+
+logger = getLogger(__name__)
+
+# two sided 95% student t values by degrees of freedom- a value between
+# two entries uses the smaller (more conservative) one
+T_95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447,
+        7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228, 15: 2.131, 20: 2.086,
+        30: 2.042, 60: 2.000, 120: 1.980}
+
+# name -> function taking a Fixture and the run options and returning
+# the results of one or more benchmarks by name
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Registers a microbenchmark.
+    """
+
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+def t_value(df: int) -> float:
+    """
+    Returns the two sided 95% student t value for the degrees of freedom.
+    """
+    if df > 120:
+        return 1.96
+    for key in sorted(T_95, reverse=True):
+        if df >= key:
+            return T_95[key]
+    return T_95[1]
+
+
+def summarize(samples: list) -> dict:
+    """
+    Summarizes the per operation times of the rounds of a benchmark.
+    :param samples: The nanoseconds per operation of each round.
+    :return: The rounds, mean, median, standard deviation, minimum,
+        maximum, interquartile range, the half width of the 95% confidence
+        interval of the mean and the number of rounds outside of 1.5
+        interquartile ranges of the quartiles.  Times are in nanoseconds.
+    """
+    ordered = sorted(samples)
+    mean = statistics.mean(ordered)
+    stdev = statistics.stdev(ordered) if len(ordered) > 1 else 0.0
+    if len(ordered) > 1:
+        q1, _, q3 = statistics.quantiles(ordered, n=4)
+    else:
+        q1 = q3 = ordered[0]
+    iqr = q3 - q1
+    ci95 = (t_value(len(ordered) - 1) * stdev / len(ordered) ** .5
+            if len(ordered) > 1 else 0.0)
+    return {
+        'rounds': len(ordered),
+        'mean': round(mean, 2),
+        'median': round(statistics.median(ordered), 2),
+        'stdev': round(stdev, 2),
+        'min': round(ordered[0], 2),
+        'max': round(ordered[-1], 2),
+        'iqr': round(iqr, 2),
+        'ci95': round(ci95, 2),
+        'outliers': len([sample for sample in ordered
+                         if sample < q1 - 1.5 * iqr
+                         or sample > q3 + 1.5 * iqr]),
+    }
+
+
+def calibrate(func: Callable, min_time: float) -> int:
+    """
+    Returns the number of calls (1, 2, 5, 10, 20, 50...) that takes at
+    least min_time seconds, the way timeit.Timer.autorange does.
+    """
+    i = 1
+    while True:
+        for number in (i, i * 2, i * 5):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start >= min_time:
+                return number
+        i *= 10
+
+
+def measure(func: Callable, repeat: int = 20, min_time: float = .05,
+            warmup: int = 2) -> dict:
+    """
+    Times a function.  The number of calls per round is calibrated so a
+    round takes at least min_time, a few rounds are run to warm up and
+    then `repeat` rounds are timed with the garbage collector disabled.
+    :return: The summary (see summarize) of the nanoseconds per call along
+        with the calls per round.
+    """
+    number = calibrate(func, min_time)
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(warmup + repeat):
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                func()
+            elapsed = time.perf_counter_ns() - start
+            if i >= warmup:
+                samples.append(elapsed / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    ret = summarize(samples)
+    ret['number'] = number
+    return ret
+
+
+def measure_threads(func: Callable, threads: int, repeat: int = 20,
+                    min_time: float = .05, warmup: int = 2) -> dict:
+    """
+    Times a function called by several threads at once.  Each round the
+    threads are released together and each one times its own calls- the
+    round's sample is the mean time per call across the threads.
+    :return: The summary (see summarize) of the nanoseconds per call along
+        with the calls per thread per round.
+    """
+    number = calibrate(func, min_time)
+    samples = []
+
+    def run(barrier, elapsed):
+        barrier.wait()
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            func()
+        elapsed.append(time.perf_counter_ns() - start)
+
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(warmup + repeat):
+            barrier = threading.Barrier(threads)
+            elapsed = []
+            workers = [threading.Thread(target=run, args=(barrier, elapsed))
+                       for _ in range(threads)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            if i >= warmup:
+                samples.append(sum(elapsed) / len(elapsed) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    ret = summarize(samples)
+    ret['number'] = number
+    ret['threads'] = threads
+    return ret
+
+
+def _no_message(*args, **kwargs):
+    pass
+
+
+class Fixture:
+    """
+    A running session for the Initialize Microscan and VideoJet Print rules
+    against the device simulators, with compiled instances of the rules'
+    steps to benchmark.  The steps' task messages are switched off so only
+    the steps' own work is timed- the message inserts are covered by the
+    query budgets (see quartet_conductor.query_budget).  The current
+    database is used, so run this against a test database.
+    """
+
+    def __init__(self):
+        self.printer = VideojetSimulator().start_in_thread()
+        self.scanner = MicroscanSimulator().start_in_thread()
+        self.output_control = conductor_settings.OUTPUT_CONTROL
+        conductor_settings.OUTPUT_CONTROL = False
+        try:
+            benchmarks.create_rules(self.printer, self.scanner)
+            benchmarks.trigger(benchmarks.SESSION_INPUT)
+            self.module = dio.default_module()
+            self.session_key = dio.input_key(self.module,
+                                             benchmarks.SESSION_INPUT)
+            self.steps = {}
+            for name in ('Initialize Microscan', 'VideoJet Print'):
+                self.compile(name)
+            self.gjd_reply = self.steps['Get Job Fields'].send_command(
+                b'GJD\r')
+        except Exception:
+            self.close()
+            raise
+
+    def compile(self, name: str):
+        rule = models.Rule.objects.get(name=name)
+        task = models.Task(rule=rule, type='Benchmark', status='RUNNING')
+        task.save(force_insert=True)
+        compiled = rule_cache.acquire(rule.id, task)
+        for step in compiled.steps.values():
+            step._create_task_message = _no_message
+            self.steps[step.db_step.name] = step
+
+    def close(self):
+        conductor_settings.OUTPUT_CONTROL = self.output_control
+        serials.release_buffers()
+        connections.pool.close()
+        protocol.client_thread.close()
+        self.printer.stop_in_thread()
+        self.scanner.stop_in_thread()
+
+
+@benchmark('get_session')
+def bench_get_session(fixture: Fixture, options: dict) -> dict:
+    session_key = fixture.session_key
+    return {
+        'get_session[threads=%s]' % threads: measure_threads(
+            lambda: session.get_session(session_key), threads,
+            options['repeat'], options['min_time'])
+        for threads in options['threads']
+    }
+
+
+@benchmark('get_session_step')
+def bench_get_session_step(fixture: Fixture, options: dict) -> dict:
+    step = fixture.steps['Get Session']
+    data = dio.format_address(fixture.module, benchmarks.PRINT_INPUT)
+
+    def execute():
+        # a fresh context each time, as for every trigger
+        step.execute(data, RuleContext('VideoJet Print', 'benchmark'))
+
+    return {'get_session_step': measure(execute, options['repeat'],
+                                        options['min_time'])}
+
+
+@benchmark('match_string_step')
+def bench_match_string_step(fixture: Fixture, options: dict) -> dict:
+    step = fixture.steps['Create Match String']
+    job_fields = parse_job_fields(fixture.gjd_reply)
+    rule_context = RuleContext('Initialize Microscan', 'benchmark')
+    rule_context.context[ContextFields.JOB_FIELDS.value] = job_fields
+    match_string = '*%s*' % '*'.join(job_fields.get(key, '').strip()
+                                     for key in step.match_string_keys)
+    return {
+        'match_string_step': measure(
+            lambda: step.execute(None, rule_context), options['repeat'],
+            options['min_time']),
+        'convert_command_value': measure(
+            lambda: convert_command_value(match_string), options['repeat'],
+            options['min_time']),
+    }
+
+
+@benchmark('print_command')
+def bench_print_command(fixture: Fixture, options: dict) -> dict:
+    step = fixture.steps['Send Printer Commands']
+    printer_command = step.printer_command
+    serial_number_field = step.serial_number_field
+    return {'print_command': measure(
+        lambda: serials.format_command(printer_command, serial_number_field,
+                                       '100000000001'),
+        options['repeat'], options['min_time'])}
+
+
+@benchmark('job_fields')
+def bench_job_fields(fixture: Fixture, options: dict) -> dict:
+    reply = fixture.gjd_reply
+    # the asyncio client parses the same reply into a protocol Frame
+    raw = reply.rstrip(protocol.TERMINATOR)
+    return {
+        'job_fields_parse': measure(lambda: parse_job_fields(reply),
+                                    options['repeat'], options['min_time']),
+        'job_fields_frame': measure(lambda: protocol.Frame(raw).fields,
+                                    options['repeat'], options['min_time']),
+    }
+
+
+def run_microbenchmarks(names: list = None, repeat: int = 20,
+                        min_time: float = .05,
+                        threads: tuple = (1, 2, 4, 8)) -> dict:
+    """
+    Runs the microbenchmarks.  The current database is used, so run this
+    against a test database.
+    :param names: The benchmarks to run (see BENCHMARKS), default is all.
+    :param repeat: The timed rounds of each benchmark.
+    :param min_time: The minimum seconds per round.
+    :param threads: The thread counts get_session is run with.
+    :return: The summary of the nanoseconds per call of each benchmark,
+        see measure, along with the run's settings.
+    """
+    for name in names or ():
+        if name not in BENCHMARKS:
+            raise ValueError('There is no microbenchmark named %s, choose '
+                             'from %s.' % (name, ', '.join(BENCHMARKS)))
+    options = {'repeat': repeat, 'min_time': min_time,
+               'threads': list(threads)}
+    results = {}
+    fixture = Fixture()
+    try:
+        for name, func in BENCHMARKS.items():
+            if names and name not in names:
+                continue
+            logger.debug('Running the %s microbenchmark.', name)
+            results.update(func(fixture, options))
+    finally:
+        fixture.close()
+    return {
+        'started': datetime.utcnow().isoformat(),
+        'options': options,
+        'settings': benchmarks.get_settings(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'unit': 'ns',
+        'benchmarks': results,
+    }
+
+
+def compare(baseline: dict, results: dict) -> dict:
+    """
+    Compares the medians of two microbenchmark runs.  A change counts as
+    significant when the 95% confidence intervals of the means do not
+    overlap.
+    :param baseline: The results of the earlier run.
+    :param results: The results of the later run.
+    :return: The baseline and current medians, their ratio and whether the
+        change is significant by benchmark name, for the benchmarks in both
+        runs.
+    """
+    ret = {}
+    for name, current in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+        significant = (
+            current['mean'] - current['ci95'] >
+            previous['mean'] + previous['ci95'] or
+            current['mean'] + current['ci95'] <
+            previous['mean'] - previous['ci95']
+        )
+        ret[name] = {
+            'baseline': previous['median'],
+            'current': current['median'],
+            'ratio': round(current['median'] / previous['median'], 3)
+            if previous['median'] else None,
+            'significant': significant,
+        }
+    return ret
+
+
+def format_comparison(comparison: dict) -> str:
+    """
+    Formats a comparison (see compare) as a table.
+    """
+    lines = ['%-32s %12s %12s %8s' % ('benchmark', 'baseline ns',
+                                      'current ns', 'ratio')]
+    for name, row in comparison.items():
+        lines.append('%-32s %12.1f %12.1f %8s%s' % (
+            name, row['baseline'], row['current'], row['ratio'],
+            ' *' if row['significant'] else ''
+        ))
+    lines.append('* the 95% confidence intervals do not overlap')
+    return '\n'.join(lines)
@@ -14,6 +14,7 @@
 # Copyright 2020 SerialLab Corp.  All rights reserved.
 import os
 import sys
+import time
 
 sys.path.append('/srv/qu4rtet')
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.production')
@@ -28,9 +29,15 @@ from typing import Optional, Callable, Any, Iterable, Mapping
 from quartet_capture.models import Rule
 from quartet_capture.tasks import create_and_queue_task
 from quartet_conductor.models import InputMap
-from quartet_conductor import settings as conductor_settings
-from revpy_dio.inputs import InputMonitor as IM
-from revpy_dio.outputs import set_output
+from quartet_conductor import control, dio, input_maps, metrics, \
+    recording, rules, traces, settings as conductor_settings
+
+try:
+    from revpy_dio.inputs import InputMonitor as IM
+except ImportError:
+    # without the RevPi libraries the monitors run against the process
+    # image simulator (DIO_BACKEND = 'simulator')
+    from quartet_conductor.simulators.dio import InputMonitor as IM
 
 logger = getLogger()
 
@@ -49,54 +56,70 @@ class ThreadedInputMonitor(IM):
                  left=conductor_settings.DIO_LEFT):
         super().__init__(sleep_interval, left=left)
         self.session = None
-        self.input_maps = {}
 
-    def handle_input(self, input_number: int):
+    def handle_input(self, input_number: int, module: str = None,
+                     detected: float = 0.0):
         """
         Will look for an input 1 to start a session and input 2 to send
         the the label information.
         :param input_number: The input that was triggered
+        :param module: The DIO module of the input.  Default is the first
+            module in the DIO_MODULES setting.
+        :param detected: The seconds between the start of the cycle that
+            read the input and the detection of its edge.  The revpy_dio
+            monitor calls this as soon as it sees the edge.
         :return: None
         """
-        # get the IO map if it is not already loaded and execute it's rule
+        # get the IO map from the shared cache and execute it's rule
+        module = module or dio.default_module()
+        recording.record_edge(module, input_number)
+        traces.begin(dio.input_key(module, input_number))
+        metrics.observe('input', detected)
+        error = None
         try:
             print('Handling input %s' % input_number)
-            input_map = self.input_maps.get(input_number)
+            with metrics.timer('input_map'):
+                input_map = input_maps.get_input_map(module, input_number)
             print('input map %s' % input_map)
             if not input_map:
-                try:
-                    print('looking up the input map')
-                    input_map = InputMap.objects.select_related('rule').get(
-                        input_number=input_number
-                    )
-                    self.input_maps[input_number] = input_map
-                    print('set the input map now executing the task.')
-                except InputMap.DoesNotExist:
-                    s = 'There was no input map for input %s' % input_number
-                    print(s)
-                    logger.exception(s)
+                s = 'There was no input map for input %s' % \
+                    dio.format_address(module, input_number)
+                print(s)
+                logger.error(s)
             print('Executing task...')
-            self.execute_task(input_map, input_number)
+            self.execute_task(input_map, input_number, module)
             print('Task executed...')
-        except:
+        except Exception as e:
+            error = e
+            metrics.count_error(e)
             logger.exception('Unexpected error.')
+        finally:
+            traces.end(error)
 
-    def execute_task(self, input_map, input_number):
+    def execute_task(self, input_map, input_number, module: str = None):
+        address = dio.format_address(module, input_number)
         if not input_map:
             raise NoInputMapError(
                 'There is no input map defined for input %s, therefor no '
-                'rule can be executed when this input is triggered.' % input_number
+                'rule can be executed when this input is triggered.' % address
             )
         else:
             print('Starting the thread...')
-            Thread(
-                target=create_and_queue_task,
-                args=(str(input_number)),
-                kwargs={'rule_name': input_map.rule.name,
-                        'run_immediately': True,
-                        'initial_status': 'RUNNING',
-                        'rule': input_map.rule}
-            ).run()
+            with metrics.timer('rule'):
+                if conductor_settings.COMPILED_RULES:
+                    Thread(
+                        target=rules.execute_rule,
+                        args=(address, input_map.rule)
+                    ).run()
+                else:
+                    Thread(
+                        target=create_and_queue_task,
+                        args=(address,),
+                        kwargs={'rule_name': input_map.rule.name,
+                                'run_immediately': True,
+                                'initial_status': 'RUNNING',
+                                'rule': input_map.rule}
+                    ).run()
 
     @abstractmethod
     def get_session_data(self):
@@ -107,6 +130,129 @@ class ThreadedInputMonitor(IM):
         pass
 
 
+class EdgeInputMonitor(ThreadedInputMonitor):
+    """
+    Reads the whole input word of each configured DIO module from the RevPi
+    process image once per cycle and compares it with the previous word to
+    find rising and falling edges.  Rising edges are handled by
+    `handle_input` just like the ThreadedInputMonitor, falling edges are
+    passed to `handle_falling_input`.
+
+    The loop is scheduled against absolute deadlines so a slow cycle does
+    not push every following cycle back.  For poll periods below two
+    milliseconds the end of each cycle is spent spinning rather than
+    sleeping since the OS sleep granularity is too coarse.
+    """
+
+    def __init__(self, poll_period: float = .001,
+                 left=conductor_settings.DIO_LEFT,
+                 debounce: dict = None,
+                 process_image: dio.ProcessImage = None,
+                 modules: dict = None,
+                 stats_interval: float = 60.0):
+        """
+        :param poll_period: The target cycle time in seconds.
+        :param left: Whether the DIO is to the left of the RevPi.
+        :param debounce: A dictionary of input number to debounce window
+            in seconds.  Inputs not in the dictionary use the
+            INPUT_DEBOUNCE setting.  Keys can be input numbers on the
+            default module or `module:point` addresses.
+        :param process_image: The process image to read from.
+        :param modules: A dictionary of DIO module name to the byte offset
+            of its input word in the process image.  Default is the
+            DIO_INPUT_OFFSETS setting.
+        :param stats_interval: How often, in seconds, to log the cycle
+            time statistics.
+        """
+        super().__init__(sleep_interval=poll_period, left=left)
+        self.poll_period = poll_period
+        self.process_image = process_image or dio.ProcessImage()
+        modules = modules or conductor_settings.DIO_INPUT_OFFSETS
+        inputs = conductor_settings.DIO_INPUTS_PER_MODULE
+        self.modules = []
+        for module, offset in modules.items():
+            windows = {}
+            for address, window in (debounce or {}).items():
+                address_module, point = dio.parse_address(address)
+                if address_module == module:
+                    windows[point] = window
+            self.modules.append((
+                module, offset,
+                dio.Debouncer(inputs, windows,
+                              conductor_settings.INPUT_DEBOUNCE,
+                              initial=self.process_image.read_word(offset))
+            ))
+        self.cycle_stats = dio.CycleStats(poll_period)
+        self.stats_interval = stats_interval
+        self.running = False
+
+    def read_inputs(self, offset: int) -> int:
+        return self.process_image.read_word(offset)
+
+    def handle_falling_input(self, input_number: int, module: str = None):
+        """
+        Override to act on inputs going low.
+        """
+        pass
+
+    def poll(self, now: float):
+        """
+        Reads the inputs of every module and then handles any edges.
+        """
+        words = [self.read_inputs(offset) for module, offset, d in
+                 self.modules]
+        edges = [(module, debouncer.update(word, now))
+                 for (module, offset, debouncer), word
+                 in zip(self.modules, words)]
+        # every edge of the cycle was detected by now- later edges must not
+        # include the rules run for the earlier ones
+        detected = time.perf_counter() - now
+        for module, (rising, falling) in edges:
+            for input_number in rising:
+                self.handle_input(input_number, module, detected)
+            for input_number in falling:
+                self.handle_falling_input(input_number, module)
+
+    def run(self):
+        self.running = True
+        period = self.poll_period
+        spin = period < .002
+        last = time.perf_counter()
+        deadline = last
+        next_report = last + self.stats_interval
+        while self.running:
+            now = time.perf_counter()
+            self.cycle_stats.add(now - last)
+            last = now
+            self.poll(now)
+            if now >= next_report:
+                logger.info('Input cycle statistics: %s',
+                            self.cycle_stats.stats())
+                self.cycle_stats.reset()
+                next_report = now + self.stats_interval
+            deadline += period
+            remaining = deadline - time.perf_counter()
+            if remaining < 0:
+                # we overran- start counting from now instead of trying
+                # to catch up with a burst of cycles
+                deadline = time.perf_counter()
+                continue
+            if spin:
+                while time.perf_counter() < deadline:
+                    pass
+            else:
+                time.sleep(remaining)
+
+    def stop(self):
+        self.running = False
+
+    def stats(self) -> dict:
+        """
+        :return: The cycle time statistics since the last report.
+        """
+        return self.cycle_stats.stats()
+
+
 class TaskThread(Thread):
     """
     Will run a task outside of celery to improve performance.
@@ -131,13 +277,17 @@ class TaskThread(Thread):
     def run(self) -> None:
         try:
             print('Executing task')
-            create_and_queue_task(str(self.input),
-                                  rule_name=self.input_map.rule.name,
-                                  run_immediately=True,
-                                  initial_status='RUNNING',
-                                  rule=self.input_map.rule
-                                  )
-        except:
+            if conductor_settings.COMPILED_RULES:
+                rules.execute_rule(str(self.input), self.input_map.rule)
+            else:
+                create_and_queue_task(str(self.input),
+                                      rule_name=self.input_map.rule.name,
+                                      run_immediately=True,
+                                      initial_status='RUNNING',
+                                      rule=self.input_map.rule
+                                      )
+        except Exception as e:
+            metrics.count_error(e)
             logger.exception('Could not execute the rule.')
             raise
 
@@ -153,16 +303,37 @@ if __name__ == '__main__':
                              'the revpi, set this to true to change the '
                              'offset.'
                         )
+    parser.add_argument('-e', '--edge', required=False, action='store_true',
+                        help='Use the edge triggered monitor that reads '
+                             'the process image directly.')
+    parser.add_argument('-c', '--record', required=False,
+                        nargs='?', const='', default=None,
+                        help='Record the input edges and device traffic '
+                             'to this file, or to TRAFFIC_LOG or a file '
+                             'in CONDUCTOR_STATE_DIR if no file is given.')
+    parser.add_argument('-p', '--period', required=False, type=float,
+                        default=.001,
+                        help='The poll period in seconds for the edge '
+                             'triggered monitor.  Default is .001.')
     args = parser.parse_args()
     if not args.stop:
         if args.readyOutput != '-1':
             print('Setting output %s' % args.readyOutput)
-            set_output(int(args.readyOutput), on=True,
-                       left=not args.right)
-        input = ThreadedInputMonitor(sleep_interval=.10, left=not args.right)
+            dio.set_output('right' if args.right else 'left',
+                           int(args.readyOutput), on=True)
+        # listen for profiling and diagnostic requests
+        control.start()
+        if args.record is not None or conductor_settings.TRAFFIC_LOG:
+            recording.start(args.record or None)
+        if args.edge:
+            input = EdgeInputMonitor(poll_period=args.period,
+                                     left=not args.right)
+        else:
+            input = ThreadedInputMonitor(sleep_interval=.10,
+                                         left=not args.right)
         input.run()
     else:
         print('Setting output %s OFF' % args.readyOutput)
-        set_output(int(args.readyOutput), on=False,
-                   left=not args.right)
+        dio.set_output('right' if args.right else 'left',
+                       int(args.readyOutput), on=False)
     # test sync
@@ -16,7 +16,8 @@
 from enum import Enum
 
 from quartet_capture import models
-from quartet_capture.rules import RuleContext, Step
+from quartet_capture.rules import RuleContext
+from quartet_conductor.rules import Step
 from quartet_conductor.videojet.steps import ContextFields
 from quartet_conductor.microscan.utils import convert_command_value
 
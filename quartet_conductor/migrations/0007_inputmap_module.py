@@ -0,0 +1,29 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quartet_conductor', '0006_auto_20200413_1240'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputmap',
+            name='module',
+            field=models.CharField(blank=True, choices=[('left', 'Left'), ('right', 'Right')], default='', help_text='The DIO module the input is on.  Leave blank for the first module in the DIO_MODULES setting.', max_length=10, verbose_name='Module'),
+        ),
+        migrations.AddField(
+            model_name='inputmap',
+            name='related_session_module',
+            field=models.CharField(blank=True, choices=[('left', 'Left'), ('right', 'Right')], default='', help_text='The DIO module of the related session input.  Leave blank if it is on the same module as this input.', max_length=10, verbose_name='Related Session Module'),
+        ),
+        migrations.AlterModelOptions(
+            name='inputmap',
+            options={'ordering': ['module', 'input_number'], 'verbose_name': 'Input Map'},
+        ),
+        migrations.AlterUniqueTogether(
+            name='inputmap',
+            unique_together={('module', 'input_number')},
+        ),
+    ]
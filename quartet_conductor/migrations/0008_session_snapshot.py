@@ -0,0 +1,21 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quartet_conductor', '0007_inputmap_module'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='session',
+            name='origin_input',
+            field=models.PositiveIntegerField(blank=True, help_text='The input that started the session.', null=True, verbose_name='Origin Input'),
+        ),
+        migrations.AddField(
+            model_name='session',
+            name='snapshot',
+            field=models.TextField(blank=True, editable=False, help_text='The rule context of the running session.  Used to resume the session after a restart.', null=True, verbose_name='Snapshot'),
+        ),
+    ]
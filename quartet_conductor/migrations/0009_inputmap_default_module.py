@@ -0,0 +1,33 @@
+from django.db import migrations
+
+from quartet_conductor import settings as conductor_settings
+
+
+def set_default_module(apps, schema_editor):
+    """
+    Input maps with a blank module were on the default module- store them
+    as such.  Where the same input was also mapped with the default module
+    named explicitly, that map was the one in use and the blank one is
+    removed.
+    """
+    InputMap = apps.get_model('quartet_conductor', 'InputMap')
+    default = conductor_settings.DIO_MODULES[0]
+    for input_map in InputMap.objects.filter(module=''):
+        if InputMap.objects.filter(module=default,
+                                   input_number=input_map.input_number
+                                   ).exists():
+            input_map.delete()
+        else:
+            input_map.module = default
+            input_map.save(update_fields=['module'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('quartet_conductor', '0008_session_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_default_module, migrations.RunPython.noop),
+    ]
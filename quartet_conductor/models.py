@@ -1,17 +1,18 @@
 # -*- coding: utf-8 -*-
-import threading
 from django.db import models
 from django.utils.translation import gettext as _
 
 from quartet_capture.models import Rule
 from quartet_capture.rules import RuleContext
+from quartet_conductor.registry import get_registry, dump_context, \
+    load_context
 
 from logging import getLogger
 
 logger = getLogger()
 
-_session_locks = threading.Lock()
-_sessions = {}
+# the origin inputs this process has already tried to restore a session for
+_restore_attempted = set()
 
 
 class Session(models.Model):
@@ -54,47 +55,133 @@ class Session(models.Model):
         choices=STATE_CHOICES,
         default='RUNNING'
     )
+    origin_input = models.PositiveIntegerField(
+        null=True,
+        blank=True,
+        verbose_name=_('Origin Input'),
+        help_text=_('The input that started the session.')
+    )
+    snapshot = models.TextField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_('Snapshot'),
+        help_text=_('The rule context of the running session.  Used to '
+                    'resume the session after a restart.')
+    )
 
     @classmethod
     def create_session(cls, session, origin_input: int,
                        rule_context: RuleContext = None,
                        ):
-        with _session_locks:
-            logger.debug(
-                'Adding session with origin input %s and rule_context %s',
-                origin_input, rule_context.context)
-            session.context = rule_context
-            _sessions[origin_input] = session
-            session.save()
+        logger.debug(
+            'Adding session with origin input %s and rule_context %s',
+            origin_input, getattr(rule_context, 'context', None))
+        session.context = rule_context
+        session.origin_input = origin_input
+        session.snapshot = dump_context(rule_context)
+        session.save()
+        # only one session per input may be restored after a restart
+        cls.objects.filter(
+            origin_input=origin_input,
+            state__in=['RUNNING', 'PAUSED']
+        ).exclude(pk=session.pk).update(state='FINISHED')
+        get_registry().put(origin_input, session)
+        _restore_attempted.add(origin_input)
+
+    @classmethod
+    def update_session(cls, session):
+        """
+        Stores a changed session in the registry, for example after its
+        state has changed.
+        """
+        get_registry().put(session.origin_input, session)
 
     @classmethod
     def clear_session(cls, origin_input: int):
-        with _session_locks:
-            logger.debug('Clearing session with origin input %s', int)
-            _sessions.pop(origin_input, None)
-            logger.debug('Session clear.')
+        logger.debug('Clearing session with origin input %s',
+                     origin_input)
+        get_registry().remove(origin_input)
+        _restore_attempted.add(origin_input)
+        logger.debug('Session clear.')
+
+    @classmethod
+    def evict_session(cls, origin_input: int):
+        """
+        Removes a session from the registry without finishing it.  The
+        session is restored from its snapshot the next time it is needed.
+        """
+        logger.debug('Evicting session with origin input %s', origin_input)
+        get_registry().remove(origin_input)
+        _restore_attempted.discard(origin_input)
+
+    @classmethod
+    def get_origin_input(cls, lot: str):
+        """
+        Returns the origin input of the running session with the lot or
+        None if there is no running session with that lot.
+        """
+        return get_registry().find(lot)
+
+    @classmethod
+    def get_sessions(cls):
+        """
+        Returns a list of the running sessions.
+        """
+        return get_registry().all()
 
     @classmethod
     def get_session(cls, origin_input: int):
-        try:
-            logger.debug('Acquiring lock...there are currently %s sessions',
-                         len(_sessions))
-            _session_locks.acquire(blocking=True, timeout=1)
-            ret = _sessions.get(origin_input, None)
-            logger.debug('Returning session %s', ret)
-            return ret
-        finally:
-            _session_locks.release()
+        ret = get_registry().get(origin_input)
+        if ret is None and origin_input not in _restore_attempted:
+            ret = cls.restore_session(origin_input)
+        logger.debug('Returning session %s', ret)
+        return ret
+
+    @classmethod
+    def restore_session(cls, origin_input: int):
+        """
+        Restores the running session for an origin input from its snapshot,
+        for example after the controller lost power.  Each origin input is
+        only tried once per process.
+        :param origin_input: The origin input of the session.
+        :return: The restored session or None.
+        """
+        _restore_attempted.add(origin_input)
+        session = cls.objects.filter(
+            origin_input=origin_input,
+            state__in=['RUNNING', 'PAUSED']
+        ).order_by('-created').first()
+        if session is None or not session.snapshot:
+            return None
+        session.context = load_context(session.snapshot)
+        get_registry().put(origin_input, session)
+        logger.info('Restored session %s for origin input %s.',
+                    session.lot, origin_input)
+        return session
 
 
 class InputMap(models.Model):
+    MODULE_CHOICES = [
+        ('left', 'Left'),
+        ('right', 'Right')
+    ]
+    module = models.CharField(
+        max_length=10,
+        blank=True,
+        null=False,
+        default='',
+        choices=MODULE_CHOICES,
+        verbose_name=_('Module'),
+        help_text=_('The DIO module the input is on.  Leave blank for the '
+                    'first module in the DIO_MODULES setting.')
+    )
     input_number = models.PositiveSmallIntegerField(
         blank=False,
         null=False,
         verbose_name=_('Input Number'),
         help_text=_('The input number to map the rule and input text to.'),
-        default=7,
-        unique=True
+        default=7
     )
     rule = models.ForeignKey(
         Rule,
@@ -119,7 +206,56 @@ class InputMap(models.Model):
                     'session contains data necessary for this mapping input '
                     'map\'s rule to run then assign that input here.')
     )
+    related_session_module = models.CharField(
+        max_length=10,
+        blank=True,
+        null=False,
+        default='',
+        choices=MODULE_CHOICES,
+        verbose_name=_('Related Session Module'),
+        help_text=_('The DIO module of the related session input.  Leave '
+                    'blank if it is on the same module as this input.')
+    )
+
+    def clean(self):
+        super().clean()
+        self.normalize_module()
+
+    def save(self, *args, **kwargs):
+        self.normalize_module()
+        super().save(*args, **kwargs)
+
+    def normalize_module(self):
+        """
+        A blank module means the default module- it is stored as the
+        default module so that an input can only be mapped once.
+        """
+        from quartet_conductor import dio
+        if not self.module:
+            self.module = dio.default_module()
+
+    @property
+    def address(self) -> str:
+        """
+        The input address in the `module:point` format used for rule data.
+        """
+        from quartet_conductor import dio
+        return dio.format_address(self.module, self.input_number)
+
+    @property
+    def related_session_address(self) -> str:
+        """
+        The address of the related session input or None.
+        """
+        from quartet_conductor import dio
+        if self.related_session_input is None:
+            return None
+        return dio.format_address(
+            self.related_session_module or self.module,
+            self.related_session_input
+        )
 
     class Meta:
         verbose_name = _('Input Map')
-        ordering = ['input_number']
+        ordering = ['module', 'input_number']
+        unique_together = ['module', 'input_number']
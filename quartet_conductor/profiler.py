@@ -0,0 +1,173 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from logging import getLogger
+
+from quartet_conductor import control
+from quartet_conductor import metrics
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+
+class ProfilerRunningError(Exception):
+    """
+    Raised when a profile is requested while one is already running.
+    """
+    pass
+
+
+def get_profile_dir() -> str:
+    directory = conductor_settings.PROFILE_DIR or os.path.join(
+        get_state_dir(), 'profiles')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _triggers() -> int:
+    histogram = metrics.metrics.histograms.get('rule')
+    return histogram.count if histogram else 0
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every other thread in the process (the input
+    monitor loop and the rules it runs) at a fixed interval and counts
+    identical stacks.  The profiler stops by itself after a number of
+    seconds or a number of input triggers, whichever comes first, and
+    writes the counts in the collapsed stack format used by flame graph
+    tools: one `thread;outer;...;inner count` line per stack.
+    """
+
+    def __init__(self, seconds: float = 30, triggers: int = None,
+                 interval: float = .005):
+        self.seconds = min(seconds or conductor_settings.PROFILE_MAX_SECONDS,
+                           conductor_settings.PROFILE_MAX_SECONDS)
+        self.triggers = triggers
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.path = None
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run,
+                                       name='conductor-profiler',
+                                       daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def join(self, timeout: float = None):
+        self.thread.join(timeout)
+
+    def sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s:%s:%s' % (
+                    os.path.basename(code.co_filename), code.co_name,
+                    frame.f_lineno))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[';'.join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        start = time.monotonic()
+        deadline = start + self.seconds
+        first_trigger = _triggers()
+        while not self.stop_event.is_set():
+            self.sample()
+            if time.monotonic() >= deadline:
+                break
+            if self.triggers and _triggers() - first_trigger >= self.triggers:
+                break
+            self.stop_event.wait(self.interval)
+        self.write(time.monotonic() - start)
+
+    def write(self, elapsed: float):
+        self.path = os.path.join(get_profile_dir(), 'profile-%s-%s.collapsed'
+                                 % (os.getpid(),
+                                    time.strftime('%Y%m%d-%H%M%S')))
+        with open(self.path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write('%s %s\n' % (stack, count))
+        logger.info('Wrote %s samples taken over %.1f seconds to %s.',
+                    self.samples, elapsed, self.path)
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+# sampling more often would take the GIL from the threads being profiled
+MIN_INTERVAL_MS = 1
+
+
+def check_profile(seconds: float = None, triggers: int = None,
+                  interval_ms: float = 5):
+    """
+    Raises a ValueError if the limits of a profile do not make sense.
+    """
+    if interval_ms is None or interval_ms < MIN_INTERVAL_MS:
+        raise ValueError('The sampling interval must be at least %s '
+                         'millisecond(s), not %s.' % (MIN_INTERVAL_MS,
+                                                      interval_ms))
+    if seconds is not None and seconds <= 0:
+        raise ValueError('A profile must run for more than 0 seconds.')
+    if triggers is not None and triggers < 1:
+        raise ValueError('A profile must run for at least one trigger.')
+
+
+def start_profile(seconds: float = 30, triggers: int = None,
+                  interval_ms: float = 5) -> dict:
+    """
+    Starts profiling this process.  Only one profile can run at a time.
+    :param seconds: Stop after this many seconds.  The PROFILE_MAX_SECONDS
+        setting caps it.
+    :param triggers: Stop after this many input triggers.
+    :param interval_ms: The time between samples in milliseconds, at least
+        MIN_INTERVAL_MS.
+    :return: A dictionary describing the profile.
+    """
+    global _profiler
+    check_profile(seconds, triggers, interval_ms)
+    with _profiler_lock:
+        if _profiler is not None and _profiler.thread.is_alive():
+            raise ProfilerRunningError('A profile is already running.')
+        _profiler = SamplingProfiler(seconds, triggers, interval_ms / 1000)
+        _profiler.start()
+    return {'seconds': _profiler.seconds, 'triggers': triggers,
+            'interval_ms': interval_ms, 'directory': get_profile_dir()}
+
+
+def get_profiler():
+    return _profiler
+
+
+control.register('profile', start_profile)
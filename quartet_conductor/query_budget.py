@@ -0,0 +1,223 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import sys
+from collections import Counter
+from logging import getLogger
+
+from django.db import connection
+from quartet_capture import rules
+
+from quartet_conductor import benchmarks
+from quartet_conductor import connections
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.input_maps import InputMapCache
+from quartet_conductor.rules import RuleCache, execute_rule
+from quartet_conductor.simulators.microscan import MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol, serials
+
+logger = getLogger(__name__)
+
+# the queries a trigger of each rule may cost, either a number for the
+# whole trigger or a dictionary of step name (or 'total') to number
+DEFAULT_BUDGETS = {
+    'Initialize Microscan': 50,
+    'VideoJet Print': 25,
+}
+
+# queries issued outside of a step are labelled by the function that
+# issued them
+_FUNCTIONS = {
+    execute_rule.__code__: 'task',
+    RuleCache.acquire.__code__: 'compile',
+    InputMapCache.load.__code__: 'input_map',
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised when a rule trigger costs more queries than its budget.  The
+    message contains the query breakdown.
+    """
+    pass
+
+
+class QueryCounter:
+    """
+    Counts the queries run on the default database connection while it is
+    active, by the rule step that ran them.  Queries run by a rule outside
+    of its steps are counted as `rule`, the task record writes as `task`,
+    the compiling of a rule as `compile` and anything else as `other`.
+
+    Usage::
+
+        with QueryCounter() as counter:
+            execute_rule('2', rule)
+        print(counter.total, counter.counts)
+    """
+
+    def __init__(self):
+        self.counts = Counter()
+        self.queries = []
+
+    def __enter__(self):
+        self.wrapper = connection.execute_wrapper(self)
+        self.wrapper.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self.wrapper.__exit__(*args)
+
+    def __call__(self, execute, sql, params, many, context):
+        label = self.label(sys._getframe(1))
+        self.counts[label] += 1
+        self.queries.append((label, sql))
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def label(frame) -> str:
+        while frame is not None:
+            owner = frame.f_locals.get('self')
+            if isinstance(owner, rules.Step):
+                db_step = getattr(owner, 'db_step', None)
+                return db_step.name if db_step else type(owner).__name__
+            if isinstance(owner, rules.Rule):
+                return 'rule'
+            label = _FUNCTIONS.get(frame.f_code)
+            if label:
+                return label
+            frame = frame.f_back
+        return 'other'
+
+    @property
+    def total(self) -> int:
+        return len(self.queries)
+
+    def breakdown(self, sql: bool = True) -> str:
+        """
+        Formats the query counts by step and, optionally, the queries.
+        """
+        lines = ['%5d  %s' % (count, label)
+                 for label, count in self.counts.most_common()]
+        lines.append('%5d  total' % self.total)
+        if sql:
+            lines.append('')
+            lines += ['[%s] %s' % query for query in self.queries]
+        return '\n'.join(lines)
+
+
+def check_budget(name: str, counter: QueryCounter, budget=None):
+    """
+    Compares the queries of a trigger with the budget of its rule.
+    :param name: The rule name.
+    :param counter: The queries of the trigger.
+    :param budget: A number for the whole trigger or a dictionary of step
+        name (or 'total') to number.  Default is the rule's entry in the
+        QUERY_BUDGETS setting or DEFAULT_BUDGETS.
+    :raises QueryBudgetExceeded: With the query breakdown.
+    """
+    if budget is None:
+        budget = get_budgets().get(name)
+    if budget is None:
+        return
+    if not isinstance(budget, dict):
+        budget = {'total': budget}
+    over = []
+    for label, limit in budget.items():
+        count = counter.total if label == 'total' else counter.counts[label]
+        if count > limit:
+            over.append('%s: %s queries, the budget is %s' % (label, count,
+                                                              limit))
+    if over:
+        raise QueryBudgetExceeded(
+            'A trigger of the %s rule is over its query budget.\n%s\n\n%s' %
+            (name, '\n'.join(over), counter.breakdown())
+        )
+
+
+def get_budgets() -> dict:
+    return conductor_settings.QUERY_BUDGETS or DEFAULT_BUDGETS
+
+
+def measure(input_number: int, triggers: int = 1) -> list:
+    """
+    Triggers an input and counts the queries of each trigger.
+    :return: A QueryCounter per trigger.
+    """
+    ret = []
+    for i in range(triggers):
+        with QueryCounter() as counter:
+            benchmarks.trigger(input_number)
+        ret.append(counter)
+    return ret
+
+
+def run_query_budget(triggers: int = 5, budgets: dict = None,
+                     raise_exception: bool = True) -> dict:
+    """
+    Creates the Initialize Microscan and VideoJet Print rules against the
+    device simulators, starts a session and prints labels, counting the
+    queries of each trigger by step.  The first trigger of each rule also
+    compiles it and creates any missing step parameters so it is reported
+    but only the later triggers are held to the budget.  The current
+    database is used, so run this against a test database.
+    :param triggers: The number of print triggers to count, at least one.
+    :param budgets: The budgets by rule name, default is the QUERY_BUDGETS
+        setting or DEFAULT_BUDGETS.
+    :param raise_exception: Raise QueryBudgetExceeded for the first
+        trigger over its budget, otherwise the violations are reported in
+        the results.
+    :return: The query counts by step of the first and of the most
+        expensive later trigger of each rule and any budget violations.
+    """
+    if triggers < 1:
+        raise ValueError('At least one print trigger must be counted, '
+                         'not %s.' % triggers)
+    budgets = budgets or get_budgets()
+    printer = VideojetSimulator().start_in_thread()
+    scanner = MicroscanSimulator().start_in_thread()
+    output_control = conductor_settings.OUTPUT_CONTROL
+    conductor_settings.OUTPUT_CONTROL = False
+    results = {}
+    violations = []
+    try:
+        benchmarks.create_rules(printer, scanner)
+        for name, input_number, count in (
+                ('Initialize Microscan', benchmarks.SESSION_INPUT, 2),
+                ('VideoJet Print', benchmarks.PRINT_INPUT, triggers + 1)):
+            counters = measure(input_number, count)
+            first, later = counters[0], counters[1:]
+            worst = max(later, key=lambda c: c.total)
+            results[name] = {
+                'first': dict(first.counts, total=first.total),
+                'per_trigger': dict(worst.counts, total=worst.total),
+                'mean': round(sum(c.total for c in later) / len(later), 2),
+                'budget': budgets.get(name),
+            }
+            try:
+                check_budget(name, worst, budgets.get(name))
+            except QueryBudgetExceeded as e:
+                if raise_exception:
+                    raise
+                violations.append(str(e))
+    finally:
+        conductor_settings.OUTPUT_CONTROL = output_control
+        serials.release_buffers()
+        connections.pool.close()
+        protocol.client_thread.close()
+        printer.stop_in_thread()
+        scanner.stop_in_thread()
+    results['violations'] = violations
+    return results
@@ -0,0 +1,229 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import os
+import struct
+import threading
+import time
+from logging import getLogger
+from typing import Iterator, NamedTuple
+
+from quartet_conductor import control
+from quartet_conductor import dio
+from quartet_conductor import settings as conductor_settings
+
+logger = getLogger(__name__)
+
+MAGIC = b'QCRL'
+VERSION = 1
+# magic, version and the wall clock time the log was started in ns
+HEADER = struct.Struct('<4sHq')
+# kind, input key or device id, ns since the log was started and the
+# length of the payload that follows
+RECORD = struct.Struct('<BHqI')
+
+DEVICE = 0
+EDGE = 1
+SEND = 2
+RECEIVE = 3
+KINDS = {DEVICE: 'device', EDGE: 'edge', SEND: 'send', RECEIVE: 'receive'}
+
+_lock = threading.Lock()
+_recorder = None
+# (host, port) of recorded devices to the (host, port) to actually use-
+# set by the replayer to point the conductor at the simulators
+redirects = {}
+
+
+class Record(NamedTuple):
+    kind: int
+    id: int
+    time: float
+    data: bytes
+
+    def to_dict(self) -> dict:
+        return {'kind': KINDS.get(self.kind, self.kind), 'id': self.id,
+                'time': self.time, 'data': self.data.decode('latin-1')}
+
+
+class TrafficRecorder:
+    """
+    Writes every input edge and every byte sent to or received from a
+    device to a binary log, each with the monotonic time since the log was
+    started.  Devices are given a small id the first time they are seen
+    and a DEVICE record maps the id to `host:port`.  Writes are buffered
+    so recording costs a struct pack and a memory copy per event, and the
+    log is flushed about once a second while events arrive.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = open(path, 'wb', buffering=65536)
+        self.file.write(HEADER.pack(MAGIC, VERSION, time.time_ns()))
+        self.start = time.monotonic_ns()
+        self.flushed = 0
+        self.devices = {}
+        self.count = 0
+
+    def write(self, kind: int, id: int, data: bytes):
+        offset = time.monotonic_ns() - self.start
+        with self.lock:
+            self._write(kind, id, offset, data)
+
+    def _write(self, kind: int, id: int, offset: int, data: bytes):
+        # the caller holds the lock
+        if self.file is None:
+            return
+        self.file.write(RECORD.pack(kind, id, offset, len(data)))
+        self.file.write(data)
+        self.count += 1
+        if offset - self.flushed > 1000000000:
+            self.file.flush()
+            self.flushed = offset
+
+    def device(self, host: str, port: int) -> int:
+        key = (host, int(port))
+        id = self.devices.get(key)
+        if id is None:
+            with self.lock:
+                id = self.devices.get(key)
+                if id is None:
+                    # the DEVICE record is written before the id is
+                    # published so that no other thread can write a
+                    # record for the id ahead of it
+                    id = len(self.devices)
+                    self._write(DEVICE, id, time.monotonic_ns() - self.start,
+                                ('%s:%s' % key).encode('utf-8'))
+                    self.devices[key] = id
+        return id
+
+    def edge(self, module: str, point: int):
+        self.write(EDGE, dio.input_key(module, point),
+                   dio.format_address(module, point).encode('ascii'))
+
+    def send(self, host: str, port: int, data: bytes):
+        self.write(SEND, self.device(host, port), data)
+
+    def receive(self, host: str, port: int, data: bytes):
+        self.write(RECEIVE, self.device(host, port), data)
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+
+def read_log(path: str) -> Iterator[Record]:
+    """
+    Reads the records of a traffic log.  The time of each record is in
+    seconds since the log was started.
+    """
+    with open(path, 'rb') as f:
+        magic, version, started = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not a conductor traffic log.' % path)
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                # the log ends here or with a partly written record
+                break
+            kind, id, offset, length = RECORD.unpack(header)
+            data = f.read(length)
+            if len(data) < length:
+                break
+            yield Record(kind, id, offset / 1e9, data)
+
+
+def start(path: str = None) -> dict:
+    """
+    Starts recording to a new log, closing any log that is being written.
+    :param path: The log file.  Default is the TRAFFIC_LOG setting or a
+        traffic-<pid>-<time>.log file in CONDUCTOR_STATE_DIR.  `{pid}` in
+        the path is replaced with the process id.
+    """
+    global _recorder
+    path = path or conductor_settings.TRAFFIC_LOG
+    if not path:
+        from quartet_conductor.invalidation import get_state_dir
+        path = os.path.join(get_state_dir(), 'traffic-{pid}-%d.log' %
+                            time.time())
+    path = path.replace('{pid}', str(os.getpid()))
+    with _lock:
+        if _recorder is not None:
+            _recorder.close()
+        _recorder = TrafficRecorder(path)
+    logger.info('Recording input and device traffic to %s.', path)
+    return {'path': path}
+
+
+def start_from_control(name: str = None) -> dict:
+    """
+    The record_start control command.  Requests can be written by other
+    processes, so only the name of a .log file in CONDUCTOR_STATE_DIR can
+    be given rather than a path.
+    :param name: The log file name.  Default is as for start.
+    """
+    path = None
+    if name is not None:
+        if os.path.basename(name) != name or not name.endswith('.log'):
+            raise ValueError('%s is not the name of a .log file.' % name)
+        from quartet_conductor.invalidation import get_state_dir
+        path = os.path.join(get_state_dir(), name)
+    return start(path)
+
+
+def stop() -> dict:
+    """
+    Stops recording and closes the log.
+    """
+    global _recorder
+    with _lock:
+        recorder, _recorder = _recorder, None
+    if recorder is None:
+        return {'path': None, 'records': 0}
+    recorder.close()
+    return {'path': recorder.path, 'records': recorder.count}
+
+
+def record_edge(module: str, point: int):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.edge(module, point)
+
+
+def record_send(host: str, port: int, data: bytes):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.send(host, port, data)
+
+
+def record_receive(host: str, port: int, data: bytes):
+    recorder = _recorder
+    if recorder is not None:
+        recorder.receive(host, port, data)
+
+
+def resolve(host: str, port: int):
+    """
+    Returns the host and port to connect to for a device.
+    """
+    if redirects:
+        return redirects.get((host, int(port)), (host, port))
+    return host, port
+
+
+control.register('record_start', start_from_control)
+control.register('record_stop', stop)
@@ -0,0 +1,434 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import fcntl
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from logging import getLogger
+
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+MAGIC = b'QCSR'
+FILE_HEADER = struct.Struct('<4sII')
+# seq, state, origin input, payload length
+SLOT_HEADER = struct.Struct('<IIII')
+EMPTY = 0
+USED = 1
+DELETED = 2
+
+
+class SessionRegistryError(Exception):
+    """
+    Raised when a session can not be stored in or read from the registry.
+    """
+    pass
+
+
+class TimedLock:
+    """
+    A lock that records how often and how long threads had to wait for it
+    so that contention between lines can be measured.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def __enter__(self):
+        if not self.lock.acquire(blocking=False):
+            start = time.perf_counter()
+            self.lock.acquire()
+            self.record_wait(time.perf_counter() - start)
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, *args):
+        self.lock.release()
+
+    def record_wait(self, wait: float):
+        """
+        Records a wait.  Must be called while holding the lock.
+        """
+        self.contended += 1
+        self.wait_time += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        """
+        :return: The number of acquisitions, how many of them had to wait
+            and the total and longest waits in seconds.
+        """
+        return {
+            'acquisitions': self.acquisitions,
+            'contended': self.contended,
+            'wait_time': self.wait_time,
+            'max_wait': self.max_wait,
+        }
+
+
+class LocalSessionRegistry:
+    """
+    Keeps the running sessions in a dictionary in the memory of the
+    process.  Only the process that started a session can see it.
+
+    Lookups take no lock.  Writers serialize on a lock, copy the dictionary,
+    change the copy and swap it in, so a lookup always sees a complete
+    dictionary.
+    """
+
+    def __init__(self):
+        self.lock = TimedLock()
+        self.sessions = {}
+
+    def put(self, origin_input: int, session):
+        with self.lock:
+            sessions = dict(self.sessions)
+            sessions[origin_input] = session
+            self.sessions = sessions
+
+    def remove(self, origin_input: int):
+        with self.lock:
+            sessions = dict(self.sessions)
+            ret = sessions.pop(origin_input, None)
+            self.sessions = sessions
+            return ret
+
+    def get(self, origin_input: int):
+        return self.sessions.get(origin_input)
+
+    def find(self, lot: str):
+        """
+        :return: The origin input of the session with the lot or None.
+        """
+        for origin_input, session in self.sessions.items():
+            if session.lot == lot:
+                return origin_input
+
+    def all(self) -> list:
+        return list(self.sessions.values())
+
+    def stats(self) -> dict:
+        """
+        :return: The write lock statistics and the number of sessions.
+        """
+        ret = self.lock.stats()
+        ret['sessions'] = len(self.sessions)
+        return ret
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return {'__bytes__': value.decode('latin-1')}
+    logger.warning('Storing %r in the session registry as a string.', value)
+    return str(value)
+
+
+def _decode(value: dict):
+    if '__bytes__' in value and len(value) == 1:
+        return value['__bytes__'].encode('latin-1')
+    return value
+
+
+def _context_to_dict(context: RuleContext):
+    if not isinstance(context, RuleContext):
+        return None
+    return {
+        'rule_name': context.rule_name,
+        'task_name': context.task_name,
+        'context': context.context,
+    }
+
+
+def _context_from_dict(data: dict):
+    if data is None:
+        return None
+    return RuleContext(data['rule_name'], data['task_name'], data['context'])
+
+
+def dump_context(context: RuleContext) -> str:
+    """
+    Serializes a rule context to compact JSON.  Bytes values, such as the
+    IO_PORT the capture rules receive, are preserved.
+    """
+    return json.dumps(_context_to_dict(context), default=_encode,
+                      separators=(',', ':'))
+
+
+def load_context(text: str) -> RuleContext:
+    """
+    Rebuilds a rule context serialized by dump_context.
+    """
+    return _context_from_dict(json.loads(text, object_hook=_decode))
+
+
+def dump_session(session) -> bytes:
+    """
+    Serializes a session and its rule context.
+    """
+    data = {
+        'id': session.id,
+        'lot': session.lot,
+        'expiry': session.expiry,
+        'state': session.state,
+        'origin_input': session.origin_input,
+        'context': _context_to_dict(session.context),
+    }
+    return json.dumps(data, default=_encode,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def load_session(payload: bytes):
+    """
+    Rebuilds a session serialized by dump_session.
+    """
+    from quartet_conductor.models import Session
+    data = json.loads(payload.decode('utf-8'), object_hook=_decode)
+    context = data.pop('context')
+    session = Session(**data)
+    session.context = _context_from_dict(context)
+    return session
+
+
+class SharedSessionRegistry:
+    """
+    Keeps the running sessions in a memory mapped file so that every
+    conductor process on the controller (web workers, the input monitor,
+    rule threads) sees the same sessions.
+
+    The file holds a fixed number of slots addressed by origin input.  Each
+    slot is guarded by a sequence number: writers, which serialize on a
+    lock on the file, make it odd while they change the slot and even again
+    when they are done.  Readers take no lock- they retry if the sequence
+    number was odd or changed while they read.  The last session decoded
+    from each slot is kept, so a lookup of a session that has not changed
+    only reads the slot header.
+    """
+
+    def __init__(self, path: str = None, slots: int = None,
+                 slot_size: int = None):
+        self.path = path or os.path.join(get_state_dir(), 'sessions.mmap')
+        self.slots = slots or conductor_settings.SESSION_REGISTRY_SLOTS
+        self.slot_size = slot_size or \
+            conductor_settings.SESSION_REGISTRY_SLOT_SIZE
+        self.size = FILE_HEADER.size + self.slots * self.slot_size
+        self.lock = TimedLock()
+        self.decoded = {}
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self._write_lock():
+            header = os.pread(self.fd, FILE_HEADER.size, 0)
+            expected = FILE_HEADER.pack(MAGIC, self.slots, self.slot_size)
+            if header != expected:
+                if header.strip(b'\0'):
+                    logger.warning('Reinitializing the session registry at '
+                                   '%s- the slot layout changed.', self.path)
+                os.ftruncate(self.fd, 0)
+                os.ftruncate(self.fd, self.size)
+                os.pwrite(self.fd, expected, 0)
+            self.mm = mmap.mmap(self.fd, self.size)
+            self._recover()
+
+    def _recover(self):
+        """
+        Clears the slots a writer that died while changing them left with
+        an odd sequence number- readers would wait on them forever.  Must
+        be called while holding the write lock, when no writer can be
+        active.
+        """
+        for index in range(self.slots):
+            offset = self._offset(index)
+            seq = SLOT_HEADER.unpack_from(self.mm, offset)[0]
+            if seq & 1:
+                logger.warning('Clearing slot %s of the session registry at '
+                               '%s- a writer died while changing it.',
+                               index, self.path)
+                SLOT_HEADER.pack_into(self.mm, offset, seq + 1, DELETED,
+                                      0, 0)
+
+    @contextmanager
+    def _write_lock(self):
+        with self.lock:
+            try:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # another process is writing
+                start = time.perf_counter()
+                fcntl.flock(self.fd, fcntl.LOCK_EX)
+                self.lock.record_wait(time.perf_counter() - start)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _offset(self, index: int) -> int:
+        return FILE_HEADER.size + index * self.slot_size
+
+    def _probe(self, origin_input: int):
+        """
+        Yields the slot indexes to search for an origin input.
+        """
+        start = origin_input % self.slots
+        for i in range(self.slots):
+            yield (start + i) % self.slots
+
+    def _read_header(self, index: int):
+        offset = self._offset(index)
+        for attempt in range(10000):
+            header = SLOT_HEADER.unpack_from(self.mm, offset)
+            if not header[0] & 1:
+                return header
+            os.sched_yield()
+        raise SessionRegistryError('Slot %s of the session registry is '
+                                   'locked.' % index)
+
+    def _read_session(self, index: int, header: tuple):
+        seq, state, key, length = header
+        cached = self.decoded.get(index)
+        if cached and cached[0] == seq:
+            return cached[1]
+        offset = self._offset(index)
+        while True:
+            start = offset + SLOT_HEADER.size
+            payload = self.mm[start:start + length]
+            if SLOT_HEADER.unpack_from(self.mm, offset) == header:
+                break
+            # the slot changed while it was read
+            header = self._read_header(index)
+            seq, state, key, length = header
+            if state != USED:
+                return None
+        session = load_session(payload)
+        self.decoded[index] = (seq, session)
+        return session
+
+    def _find_slot(self, origin_input: int):
+        for index in self._probe(origin_input):
+            header = self._read_header(index)
+            state, key = header[1], header[2]
+            if state == EMPTY:
+                return None, None
+            if state == USED and key == origin_input:
+                return index, header
+        return None, None
+
+    def _write_slot(self, index: int, state: int, origin_input: int,
+                    payload: bytes):
+        offset = self._offset(index)
+        seq = SLOT_HEADER.unpack_from(self.mm, offset)[0]
+        struct.pack_into('<I', self.mm, offset, seq + 1)
+        start = offset + SLOT_HEADER.size
+        self.mm[start:start + len(payload)] = payload
+        SLOT_HEADER.pack_into(self.mm, offset, seq + 2, state,
+                              origin_input, len(payload))
+
+    def put(self, origin_input: int, session):
+        payload = dump_session(session)
+        if len(payload) > self.slot_size - SLOT_HEADER.size:
+            raise SessionRegistryError(
+                'The session %s is %s bytes which is too large for the '
+                'session registry.  Increase SESSION_REGISTRY_SLOT_SIZE.' %
+                (session.lot, len(payload)))
+        with self._write_lock():
+            index, header = self._find_slot(origin_input)
+            if index is None:
+                for index in self._probe(origin_input):
+                    if self._read_header(index)[1] != USED:
+                        break
+                else:
+                    raise SessionRegistryError('The session registry is '
+                                               'full.')
+            self._write_slot(index, USED, origin_input, payload)
+
+    def remove(self, origin_input: int):
+        with self._write_lock():
+            index, header = self._find_slot(origin_input)
+            if index is None:
+                return None
+            session = self._read_session(index, header)
+            self._write_slot(index, DELETED, 0, b'')
+            self.decoded.pop(index, None)
+            return session
+
+    def get(self, origin_input: int):
+        index, header = self._find_slot(origin_input)
+        if index is None:
+            return None
+        return self._read_session(index, header)
+
+    def _items(self):
+        for index in range(self.slots):
+            header = self._read_header(index)
+            if header[1] != USED:
+                # drop sessions removed by other processes
+                self.decoded.pop(index, None)
+            else:
+                session = self._read_session(index, header)
+                if session is not None:
+                    yield header[2], session
+
+    def find(self, lot: str):
+        """
+        :return: The origin input of the session with the lot or None.
+        """
+        for origin_input, session in self._items():
+            if session.lot == lot:
+                return origin_input
+
+    def all(self) -> list:
+        return [session for origin_input, session in self._items()]
+
+    def stats(self) -> dict:
+        """
+        :return: The write lock statistics, including waits for writers in
+            other processes, and the number of sessions.
+        """
+        ret = self.lock.stats()
+        ret['sessions'] = len(self.all())
+        return ret
+
+    def close(self):
+        self.mm.close()
+        os.close(self.fd)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    """
+    Returns the session registry selected by the SESSION_REGISTRY setting:
+    'local' (default) or 'shared'.
+    """
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                if conductor_settings.SESSION_REGISTRY == 'shared':
+                    _registry = SharedSessionRegistry()
+                else:
+                    _registry = LocalSessionRegistry()
+    return _registry
@@ -0,0 +1,261 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import os
+import platform
+import time
+from contextlib import redirect_stdout
+from logging import getLogger
+
+from django.apps import apps
+from django.core import serializers
+from django.db import connection, transaction
+
+from quartet_conductor import benchmarks
+from quartet_conductor import connections
+from quartet_conductor import metrics
+from quartet_conductor import recording
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.simulators.base import Faults
+from quartet_conductor.simulators.microscan import COMMAND, \
+    MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol, serials
+
+logger = getLogger(__name__)
+
+# the commands that identify a device as a Videojet printer
+VIDEOJET_COMMANDS = {b'GJD', b'JDA', b'SLA', b'GST', b'QAD', b'GQD', b'QCL'}
+
+# the rows the rules read, in the order they are loaded.  Models of apps
+# that are not installed are skipped.
+CONFIGURATION_MODELS = (
+    'quartet_capture.rule',
+    'quartet_capture.ruleparameter',
+    'quartet_capture.step',
+    'quartet_capture.stepparameter',
+    'quartet_templates.template',
+    'serialbox.pool',
+    'serialbox.sequentialregion',
+    'serialbox.responserule',
+    'serialbox.responsetemplate',
+    'random_flavorpack.randomizedregion',
+    'list_based_flavorpack.listbasedregion',
+    'quartet_conductor.inputmap',
+    'quartet_conductor.session',
+)
+
+
+def copy_configuration() -> str:
+    """
+    Serializes the rules, templates, number pools, input maps and sessions
+    of the current database- what a replay needs from production- so that
+    they can be loaded into a test database with load_configuration.
+    """
+    objects = []
+    for label in CONFIGURATION_MODELS:
+        try:
+            model = apps.get_model(label)
+        except LookupError:
+            continue
+        objects += list(model._default_manager.order_by('pk'))
+    return serializers.serialize('json', objects)
+
+
+def load_configuration(data: str):
+    """
+    Loads the rows serialized by copy_configuration into the current
+    database.
+    """
+    with transaction.atomic(), connection.constraint_checks_disabled():
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+    connection.check_constraints()
+
+
+class Device:
+    """
+    What a traffic log says about one device: its address, the frames it
+    was sent and how long it took to answer.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.sent = []
+        self.received = []
+        self.delays = []
+        self.pending = None
+
+    @property
+    def is_printer(self) -> bool:
+        return any(data.lstrip()[:3] in VIDEOJET_COMMANDS
+                   for t, data in self.sent[:10])
+
+    def frames(self) -> int:
+        """
+        The number of commands the device was sent.
+        """
+        data = b''.join(data for t, data in self.sent)
+        if self.is_printer:
+            return len(protocol.FrameParser().feed(data))
+        return len(COMMAND.findall(data))
+
+    def job_fields(self) -> dict:
+        """
+        The job fields of the first job data reply.
+        """
+        for t, data in self.received:
+            frames = protocol.FrameParser().feed(data)
+            for frame in frames:
+                if frame.command == 'JDL':
+                    return frame.fields
+        return None
+
+    def faults(self) -> Faults:
+        """
+        A latency and jitter that match the recorded reply times.
+        """
+        if not self.delays:
+            return Faults()
+        delays = sorted(self.delays)
+        latency = benchmarks.percentile(delays, 50)
+        return Faults(latency=latency,
+                      jitter=benchmarks.percentile(delays, 95) - latency)
+
+
+def load_log(path: str):
+    """
+    Reads a traffic log.  Traffic for a device id that has no DEVICE
+    record before it cannot be replayed and is skipped with a warning.
+    :return: A list of (seconds, address) input edges and a dictionary of
+        device id to Device.
+    """
+    edges = []
+    devices = {}
+    unknown = {}
+    for record in recording.read_log(path):
+        if record.kind == recording.DEVICE:
+            host, port = record.data.decode('utf-8').rsplit(':', 1)
+            devices[record.id] = Device(host, int(port))
+        elif record.kind == recording.EDGE:
+            edges.append((record.time, record.data.decode('ascii')))
+        elif record.id not in devices:
+            unknown[record.id] = unknown.get(record.id, 0) + 1
+        elif record.kind == recording.SEND:
+            device = devices[record.id]
+            device.sent.append((record.time, record.data))
+            if device.pending is None:
+                device.pending = record.time
+        elif record.kind == recording.RECEIVE:
+            device = devices[record.id]
+            device.received.append((record.time, record.data))
+            if device.pending is not None:
+                device.delays.append(record.time - device.pending)
+                device.pending = None
+    for id, count in sorted(unknown.items()):
+        logger.warning('Skipped %s records of the unknown device %s in %s.',
+                       count, id, path)
+    return edges, devices
+
+
+def replay(path: str, speed: float = 1.0, poll_period: float = .0005,
+           width: float = .002) -> dict:
+    """
+    Replays the input edges of a traffic log into the DIO process image
+    simulator while the edge triggered input monitor runs the rules of the
+    current database.  Each recorded device is replaced by a simulator-
+    printers answer with the job fields and reply times that were
+    recorded- and the conductor's connections to the device are
+    redirected to it.  The rules allocate serial numbers and record tasks
+    as usual so run this against a test database with the configuration
+    of production loaded by load_configuration, and in a
+    benchmarks.temporary_state_dir, as the replay_traffic command does.
+    :param path: The traffic log.
+    :param speed: How much faster than recorded to replay the edges, 1 is
+        real time.
+    :param poll_period: The input monitor cycle time in seconds.
+    :param width: How long each replayed edge stays high in seconds.
+    :return: The edges replayed and handled, the errors, the edge to
+        completion latency percentiles, how far behind schedule the edges
+        were replayed and the commands each device was sent in the log
+        and in the replay.
+    """
+    from quartet_conductor.simulators.dio import get_simulator
+    edges, devices = load_log(path)
+    simulators = {}
+    for id, device in devices.items():
+        if device.is_printer:
+            simulator = VideojetSimulator(job_fields=device.job_fields(),
+                                          faults=device.faults())
+        else:
+            simulator = MicroscanSimulator(faults=device.faults())
+        simulators[id] = simulator.start_in_thread()
+        recording.redirects[(device.host, device.port)] = (
+            simulator.host, simulator.port)
+    script = []
+    for offset, address in edges:
+        script.append((offset / speed, address, True))
+        script.append((offset / speed + width, address, False))
+    backend = conductor_settings.DIO_BACKEND
+    conductor_settings.DIO_BACKEND = 'simulator'
+    image = get_simulator()
+    monitor = None
+    try:
+        before = metrics.metrics.snapshot()
+        start_ns = time.monotonic_ns()
+        start = time.perf_counter()
+        # the monitor prints every trigger it handles
+        with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+            monitor, thread = benchmarks.start_monitor(image, poll_period)
+            image.play(script).join()
+            lag = time.perf_counter() - start - (script[-1][0]
+                                                 if script else 0)
+            handled = benchmarks.wait_until_idle(before)
+            monitor.stop()
+            thread.join()
+        after = metrics.metrics.snapshot()
+    finally:
+        conductor_settings.DIO_BACKEND = backend
+        if monitor is not None:
+            monitor.stop()
+            monitor.process_image.close()
+        image.stop()
+        serials.release_buffers()
+        connections.pool.close()
+        protocol.client_thread.close()
+        for simulator in simulators.values():
+            simulator.stop_in_thread()
+        recording.redirects.clear()
+    latencies = benchmarks.edge_latencies(start_ns)
+    return {
+        'log': path,
+        'speed': speed,
+        'edges': len(edges),
+        'handled': handled,
+        'duration': round(edges[-1][0] / speed, 3) if edges else 0.0,
+        'lag': round(lag, 3),
+        'latency_ms': benchmarks.latency_summary(latencies),
+        'stages_ms': benchmarks.stage_means(before, after),
+        'errors': benchmarks.error_counts(before, after),
+        'devices': {
+            '%s:%s' % (device.host, device.port): {
+                'type': 'videojet' if device.is_printer else 'microscan',
+                'recorded': device.frames(),
+                'replayed': len(simulators[id].received),
+                'latency_ms': round(simulators[id].faults.latency * 1000, 3),
+            } for id, device in devices.items()
+        },
+        'python': platform.python_version(),
+    }
@@ -13,8 +13,10 @@
 #
 # Copyright 2020 SerialLab Corp.  All rights reserved.
 
+from django.urls import path
 from rest_framework import routers
 from quartet_conductor import viewsets
+from quartet_conductor import views
 
 router = routers.DefaultRouter()
 
@@ -24,4 +26,14 @@ router.register(
     basename='input-maps'
 )
 
-urlpatterns = router.urls
+router.register(
+    r'sessions',
+    viewsets.SessionViewSet,
+    basename='sessions'
+)
+
+urlpatterns = router.urls + [
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('traces/', views.traces_view, name='traces'),
+    path('control/<str:command>/', views.control_view, name='control'),
+]
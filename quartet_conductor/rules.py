@@ -0,0 +1,222 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import math
+import threading
+import time
+from datetime import datetime
+from logging import getLogger
+
+from quartet_capture import models
+from quartet_capture import rules
+
+from quartet_conductor import metrics
+from quartet_conductor.invalidation import VersionStamp
+
+logger = getLogger(__name__)
+
+_versions_lock = threading.Lock()
+_versions = {}
+_local = threading.local()
+# tells the other conductor processes that some rule has changed
+_stamp = VersionStamp('rules')
+
+
+class ParameterSnapshotMixin:
+    """
+    Serves `get_or_create_parameter` from the parameters the rule loaded
+    for the step (all of a rule's step parameters are loaded up front) and
+    only goes to the database for parameters that do not exist yet.  The
+    values are kept so repeated lookups, for example in `execute`, never
+    hit the database.
+
+    A parameter created with its default value does not change what the
+    step does, so creating one while the rule is compiled does not
+    invalidate the compiled rule (see creating_defaults).
+    """
+
+    def get_or_create_parameter(self, name: str, default: str,
+                                description: str = "Default value."):
+        try:
+            return self.parameters[name]
+        except KeyError:
+            _local.creating_defaults = True
+            try:
+                value = super().get_or_create_parameter(name, default,
+                                                        description)
+            finally:
+                _local.creating_defaults = False
+            self.parameters[name] = value
+            return value
+
+
+def creating_defaults() -> bool:
+    """
+    Whether a step of a rule being compiled on this thread is creating a
+    missing parameter with its default value.
+    """
+    return getattr(_local, 'creating_defaults', False)
+
+
+class Step(ParameterSnapshotMixin, rules.Step):
+    """
+    Base class for the conductor steps.
+    """
+    pass
+
+
+def get_version(rule_id: int) -> int:
+    """
+    Returns the version stamp of a rule.  The stamp changes whenever the
+    rule, its parameters, its steps or its step parameters are saved or
+    deleted.
+    """
+    return _versions.get(rule_id, 0)
+
+
+def bump_version(rule_id: int):
+    with _versions_lock:
+        _versions[rule_id] = _versions.get(rule_id, 0) + 1
+    _stamp.bump()
+
+
+class CompiledRule(rules.Rule):
+    """
+    A rule whose steps have been instantiated once and can be executed for
+    any number of tasks.  Each execution gets a fresh RuleContext; the step
+    instances (and any state they loaded in their initializers) are
+    reused.
+    """
+
+    def __init__(self, rule: models.Rule, task: models.Task, version: int):
+        self.version = version
+        super().__init__(rule, task)
+        self.rule_parameters = self.context.context['RULE_PARAMETERS']
+
+    def _load_step(self, db_step: models.Step):
+        step = super()._load_step(db_step)
+        # the capture rule sets db_step on the step class- pin it to the
+        # instance since the class attribute changes as other rules load
+        step.db_step = db_step
+        return step
+
+    def reset(self, task: models.Task):
+        """
+        Prepares the rule to be executed for a new task.
+        """
+        self.db_task = task
+        self.task = task
+        self.data = None
+        self.start_time = datetime.utcnow()
+        self.context = rules.RuleContext(self.db_rule.name, task.name)
+        self.context.context['RULE_PARAMETERS'] = dict(self.rule_parameters)
+        for step in self.steps.values():
+            step.task = task
+
+
+class RuleCache:
+    """
+    Keeps compiled rules by rule id.  Several threads can execute the same
+    rule at once (two lines printing through one print rule, for example)
+    so each rule has a list of idle compiled instances- a trigger takes one
+    and puts it back when it is done.  Instances compiled for an older
+    version of the rule are discarded, as is everything when a rule was
+    changed by another process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_version(self, rule_id: int) -> tuple:
+        if _stamp.changed():
+            self.clear()
+        return self.generation, get_version(rule_id)
+
+    def acquire(self, rule_id: int, task: models.Task) -> CompiledRule:
+        version = self.get_version(rule_id)
+        with self.lock:
+            instances = self.idle.get(rule_id, [])
+            while instances:
+                compiled = instances.pop()
+                if compiled.version == version:
+                    self.hits += 1
+                    compiled.reset(task)
+                    return compiled
+            self.misses += 1
+        db_rule = models.Rule.objects.prefetch_related(
+            'step_set__stepparameter_set', 'ruleparameter_set'
+        ).get(id=rule_id)
+        return CompiledRule(db_rule, task, version)
+
+    def release(self, compiled: CompiledRule):
+        if compiled.version != self.get_version(compiled.db_rule.id):
+            return
+        with self.lock:
+            self.idle.setdefault(compiled.db_rule.id, []).append(compiled)
+
+    def clear(self):
+        with self.lock:
+            self.generation += 1
+            self.idle = {}
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'rules': len(self.idle),
+        }
+
+
+rule_cache = RuleCache()
+
+
+def execute_rule(data, rule: models.Rule, task_type: str = 'Input'):
+    """
+    Executes a rule inline using a cached, compiled copy of it.  A Task
+    is still recorded for every execution but, unlike
+    quartet_capture.tasks.create_and_queue_task, the inbound data is not
+    written to file storage.
+    :param data: The data to pass to the rule.  Strings are encoded to
+        bytes, which is what the rule receives from
+        create_and_queue_task.
+    :param rule: The rule model instance.
+    :param task_type: The type of the task record.
+    :return: The rule context.
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    start = time.monotonic()
+    task = models.Task(rule=rule, type=task_type, status='RUNNING')
+    task.start = datetime.now()
+    task.save(force_insert=True)
+    compiled = rule_cache.acquire(rule.id, task)
+    try:
+        compiled.execute(data)
+        task.status = 'FINISHED'
+        return compiled.context
+    except Exception as e:
+        task.status = 'FAILED'
+        metrics.count_error(e)
+        raise
+    finally:
+        task.end = datetime.now()
+        # the field is in whole seconds- rounded up so that a task that
+        # ran is never recorded as taking no time
+        task.execution_time = math.ceil(time.monotonic() - start)
+        task.save()
+        rule_cache.release(compiled)
@@ -24,3 +24,11 @@ class InputMapSerializer(ModelSerializer):
         model = models.InputMap
         fields = '__all__'
 
+
+class SessionSerializer(ModelSerializer):
+    '''
+    Default serializer for the Session model.
+    '''
+    class Meta:
+        model = models.Session
+        exclude = ['snapshot']
@@ -1,7 +1,12 @@
+import time
 from enum import Enum
 from logging import getLogger
 from django.db.utils import IntegrityError
 from quartet_conductor.models import Session
+from quartet_conductor.registry import dump_session, load_session
+from quartet_conductor import control
+from quartet_conductor import lifecycle
+from quartet_conductor import settings as conductor_settings
 from quartet_capture.rules import RuleContext
 
 logger = getLogger(__name__)
@@ -54,6 +59,13 @@ class SessionStateError(Exception):
     pass
 
 
+class SessionPausedError(Exception):
+    """
+    Raised when a label is requested for a session that is paused.
+    """
+    pass
+
+
 def start_session(lot: str, expiry: str, origin_input: int,
                   rule_context: RuleContext = None,
                   ) -> Session:
@@ -97,13 +109,156 @@ def get_session(origin_input: int) -> Session:
     return cur_session
 
 
+def _get_running_session(lot: str) -> Session:
+    origin_input = Session.get_origin_input(lot)
+    cur_session = None
+    if origin_input is not None:
+        cur_session = Session.get_session(origin_input)
+    if not cur_session:
+        raise SessionNotActiveError('There is no currently running session '
+                                    'for lot %s.' % lot)
+    return cur_session
+
+
+def _set_state(cur_session: Session, from_state: SessionState,
+               to_state: SessionState) -> Session:
+    if cur_session.state != from_state.value:
+        raise SessionStateError('The session for lot %s is %s, not %s.' %
+                                (cur_session.lot, cur_session.state,
+                                 from_state.value))
+    cur_session.state = to_state.value
+    cur_session.save(update_fields=['state'])
+    # republish the session so every process sees the new state
+    Session.update_session(cur_session)
+    logger.info('Session %s is now %s.', cur_session.lot, to_state.value)
+    return cur_session
+
+
+def _apply_state(cur_session: Session):
+    # the printer queue only exists in the process that started it
+    if cur_session.state == SessionState.PAUSED.value:
+        lifecycle.hold_printer_queue(cur_session.origin_input, cur_session)
+    else:
+        lifecycle.resume_printer_queue(cur_session.origin_input,
+                                       cur_session)
+
+
+def _state_timeout() -> float:
+    # long enough for every listening process to poll once or twice
+    return 3 * conductor_settings.CONTROL_POLL_INTERVAL
+
+
+def _change_state(lot: str, from_state: SessionState,
+                  to_state: SessionState) -> Session:
+    """
+    Changes the state of a session in this process and asks the other
+    conductor processes to do the same, so that the process that started
+    the session- normally the input monitor- holds or restarts its printer
+    queue.  If this process does not know the session, which is the case
+    for web workers with the local session registry, the change is left to
+    the process that does.
+    """
+    try:
+        cur_session = _get_running_session(lot)
+    except SessionNotActiveError:
+        return _change_state_remotely(lot, to_state)
+    _set_state(cur_session, from_state, to_state)
+    _apply_state(cur_session)
+    control.request('session_state', expires=_state_timeout(), lot=lot,
+                    state=to_state.value, strict=False)
+    return cur_session
+
+
+def _change_state_remotely(lot: str, to_state: SessionState) -> Session:
+    timeout = _state_timeout()
+    request_id = control.request('session_state', expires=timeout, lot=lot,
+                                 state=to_state.value, strict=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        for result in control.get_results(request_id):
+            if 'error' in result:
+                raise SessionStateError(result['error'])
+            if result['result']['found']:
+                return load_session(
+                    result['result']['session'].encode('utf-8'))
+        if time.monotonic() >= deadline:
+            raise SessionNotActiveError('There is no currently running '
+                                        'session for lot %s in any '
+                                        'conductor process.' % lot)
+        time.sleep(.05)
+
+
+def change_state_from_control(lot: str, state: str,
+                              strict: bool = True) -> dict:
+    """
+    The session_state control command.  Changes the state of a session
+    this process knows and holds or restarts its printer queue.
+    :param lot: The lot of the session.
+    :param state: PAUSED or RUNNING.
+    :param strict: Fail if the session is already in the state.  Other
+        processes that already changed the state send False.
+    :return: Whether this process knows the session and, if it does, the
+        session.
+    """
+    to_state = SessionState(state)
+    from_state = SessionState.RUNNING if to_state == SessionState.PAUSED \
+        else SessionState.PAUSED
+    origin_input = Session.get_origin_input(lot)
+    if origin_input is None:
+        return {'found': False}
+    cur_session = Session.get_session(origin_input)
+    if strict or cur_session.state != to_state.value:
+        _set_state(cur_session, from_state, to_state)
+    _apply_state(cur_session)
+    return {'found': True,
+            'session': dump_session(cur_session).decode('utf-8')}
+
+
+def pause_session(lot: str) -> Session:
+    """
+    Pauses a running session.  Labels can not be printed for a paused
+    session but its context, printer connections and serial numbers are
+    kept so that it can be resumed immediately.  If the session fills a
+    printer queue, the queue is stopped and cleared until it is resumed.
+    The session can be paused from any conductor process that listens for
+    control requests or can see it.
+    :param lot: The lot of the session to pause.
+    :return: The paused session.
+    """
+    return _change_state(lot, SessionState.RUNNING, SessionState.PAUSED)
+
+
+def resume_session(lot: str) -> Session:
+    """
+    Resumes a paused session.  The job fields and everything else that was
+    gathered when the session was started are reused- the printer and
+    scanner are not initialized again, only its printer queue, if any, is
+    filled again.
+    :param lot: The lot of the session to resume.
+    :return: The running session.
+    """
+    return _change_state(lot, SessionState.PAUSED, SessionState.RUNNING)
+
+
 def finish_session(lot: str) -> None:
     """
     Will mark a session state to FINISHED and remove the session from memory.
+    Everything the session holds is released by the lifecycle manager (see
+    quartet_conductor.lifecycle): its printer queue, if any, and any pooled
+    printer connections and buffered serial numbers that are not needed by
+    another running session.
     :param lot: The lot of the session to finish.
     :return: None.
     """
-    cur_session = Session.get_session() or Session.objects.get(lot=lot)
+    origin_input = Session.get_origin_input(lot)
+    cur_session = None
+    if origin_input is not None:
+        cur_session = Session.get_session(origin_input)
+        Session.clear_session(origin_input)
+        lifecycle.manager.release(origin_input, cur_session)
+    cur_session = cur_session or Session.objects.get(lot=lot)
     cur_session.state = SessionState.FINISHED.value
     cur_session.save()
-    Session.clear_session()
+
+
+control.register('session_state', change_state_from_control)
@@ -13,9 +13,43 @@
 #
 # Copyright 2020 SerialLab Corp.  All rights reserved.
 
+import os
+import tempfile
+
 from django.conf import settings
 
 DEFAULT_PAGESIZE = getattr(settings, 'DEFAULT_PAGESIZE', 25)
 OUTPUT_CONTROL=getattr(settings, 'OUTPUT_CONTROL', True)
 DIO_LEFT=getattr(settings, 'DIO_LEFT', True)
-
+PERSISTENT_CONNECTIONS = getattr(settings, 'PERSISTENT_CONNECTIONS', True)
+SERIAL_BUFFER_SIZE = getattr(settings, 'SERIAL_BUFFER_SIZE', 0)
+SERIAL_BUFFER_LOW_WATERMARK = getattr(settings, 'SERIAL_BUFFER_LOW_WATERMARK',
+                                      None)
+VIDEOJET_CLIENT = getattr(settings, 'VIDEOJET_CLIENT', 'telnet')
+PROCESS_IMAGE = getattr(settings, 'PROCESS_IMAGE', '/dev/piControl0')
+DIO_BACKEND = getattr(settings, 'DIO_BACKEND', 'revpi')
+DIO_SIMULATOR_IMAGE = getattr(settings, 'DIO_SIMULATOR_IMAGE', None)
+PROCESS_IMAGE_SIZE = getattr(settings, 'PROCESS_IMAGE_SIZE', 4096)
+DIO_INPUT_OFFSET = getattr(settings, 'DIO_INPUT_OFFSET', 0)
+INPUT_DEBOUNCE = getattr(settings, 'INPUT_DEBOUNCE', 0.0)
+DIO_MODULES = getattr(settings, 'DIO_MODULES',
+                      ['left'] if DIO_LEFT else ['right'])
+DIO_INPUT_OFFSETS = getattr(settings, 'DIO_INPUT_OFFSETS',
+                            {DIO_MODULES[0]: DIO_INPUT_OFFSET})
+DIO_INPUTS_PER_MODULE = getattr(settings, 'DIO_INPUTS_PER_MODULE', 16)
+COMPILED_RULES = getattr(settings, 'COMPILED_RULES', True)
+CONDUCTOR_STATE_DIR = getattr(settings, 'CONDUCTOR_STATE_DIR',
+                              os.path.join(tempfile.gettempdir(),
+                                           'quartet_conductor'))
+SESSION_REGISTRY = getattr(settings, 'SESSION_REGISTRY', 'local')
+SESSION_REGISTRY_SLOTS = getattr(settings, 'SESSION_REGISTRY_SLOTS', 64)
+SESSION_REGISTRY_SLOT_SIZE = getattr(settings, 'SESSION_REGISTRY_SLOT_SIZE',
+                                     16384)
+SESSION_IDLE_TTL = getattr(settings, 'SESSION_IDLE_TTL', 0)
+METRICS_EXPORT_INTERVAL = getattr(settings, 'METRICS_EXPORT_INTERVAL', 5)
+TRACE_BUFFER_SIZE = getattr(settings, 'TRACE_BUFFER_SIZE', 1024)
+CONTROL_POLL_INTERVAL = getattr(settings, 'CONTROL_POLL_INTERVAL', 1.0)
+PROFILE_DIR = getattr(settings, 'PROFILE_DIR', None)
+PROFILE_MAX_SECONDS = getattr(settings, 'PROFILE_MAX_SECONDS', 300)
+TRAFFIC_LOG = getattr(settings, 'TRAFFIC_LOG', None)
+QUERY_BUDGETS = getattr(settings, 'QUERY_BUDGETS', None)
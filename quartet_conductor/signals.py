@@ -0,0 +1,86 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from quartet_capture.models import Rule, RuleParameter, Step, StepParameter
+
+from quartet_conductor import rules
+from quartet_conductor.input_maps import input_map_cache
+from quartet_conductor.models import InputMap
+
+
+def pool_changed(sender, **kwargs):
+    """
+    Drops any cached serialbox generator resolutions when a pool changes.
+    """
+    # serialbox is only imported once it is known to be installed
+    from quartet_conductor.videojet.serials import generator_cache
+    transaction.on_commit(generator_cache.invalidate)
+
+
+if apps.is_installed('serialbox'):
+    post_save.connect(pool_changed, sender='serialbox.Pool')
+    post_delete.connect(pool_changed, sender='serialbox.Pool')
+
+
+@receiver(post_save, sender=InputMap)
+@receiver(post_delete, sender=InputMap)
+def input_map_changed(sender, **kwargs):
+    """
+    Reloads the input maps in every conductor process when one changes.
+    The caches are invalidated once the change is committed- a process
+    that reloaded before the commit would otherwise keep the old maps.
+    """
+    transaction.on_commit(input_map_cache.invalidate)
+
+
+def _bump_version(rule_id: int):
+    # as for the input maps, only once the change is committed
+    transaction.on_commit(lambda: rules.bump_version(rule_id))
+
+
+@receiver(post_save, sender=Rule)
+@receiver(post_delete, sender=Rule)
+def rule_changed(sender, instance, **kwargs):
+    """
+    Bumps the version stamp of a rule when it or any of its parts change
+    so that compiled copies of it are rebuilt.
+    """
+    _bump_version(instance.id)
+
+
+@receiver(post_save, sender=Step)
+@receiver(post_delete, sender=Step)
+@receiver(post_save, sender=RuleParameter)
+@receiver(post_delete, sender=RuleParameter)
+def rule_part_changed(sender, instance, **kwargs):
+    _bump_version(instance.rule_id)
+
+
+@receiver(post_save, sender=StepParameter)
+@receiver(post_delete, sender=StepParameter)
+def step_parameter_changed(sender, instance, created=False, **kwargs):
+    if created and rules.creating_defaults():
+        # a step created a missing parameter with its default value while
+        # its rule was compiled
+        return
+    try:
+        _bump_version(instance.step.rule_id)
+    except Step.DoesNotExist:
+        # the step is being deleted along with its parameters
+        pass
@@ -0,0 +1,182 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import asyncio
+import random
+import threading
+from logging import getLogger
+
+logger = getLogger(__name__)
+
+
+class Faults:
+    """
+    Describes how badly a simulated device behaves.  Every reply is
+    delayed by `latency` plus a random amount of up to `jitter` seconds,
+    the connection is dropped before a reply with a probability of
+    `drop_rate` and a reply is replaced with a malformed one with a
+    probability of `malformed_rate`.  Pass a seed for repeatable runs.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 drop_rate: float = 0.0, malformed_rate: float = 0.0,
+                 seed: int = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+
+    def delay(self) -> float:
+        if not self.jitter:
+            return self.latency
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def drop(self) -> bool:
+        return self.drop_rate > 0 and self.random.random() < self.drop_rate
+
+    def malform(self) -> bool:
+        return (self.malformed_rate > 0 and
+                self.random.random() < self.malformed_rate)
+
+    def malformed(self, reply: bytes) -> bytes:
+        """
+        Returns a corrupted copy of a reply- either truncated or noise.
+        """
+        if len(reply) > 1 and self.random.random() < .5:
+            return reply[:self.random.randrange(1, len(reply))]
+        return bytes(self.random.randrange(33, 127) for i in range(8))
+
+
+class Simulator:
+    """
+    Base class for the local TCP device stand-ins.  Subclasses implement
+    `handle_client` and the simulator can either be awaited on an existing
+    event loop via `start` or run on its own daemon thread via
+    `start_in_thread`, which is what the unit tests and benchmarks use.
+
+    Replies should be written with `send_reply` so that the latency and
+    faults configured on the simulator are applied to them.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 faults: Faults = None):
+        self.host = host
+        self.port = port
+        self.faults = faults or Faults()
+        self.server = None
+        self.loop = None
+        self.thread = None
+        self.writers = set()
+        self.connection_count = 0
+        self.dropped = 0
+        self.malformed = 0
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client,
+                                                 self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.debug('%s listening on %s:%s', self.__class__.__name__,
+                     self.host, self.port)
+
+    async def _handle_client(self, reader: asyncio.StreamReader,
+                             writer: asyncio.StreamWriter):
+        self.connection_count += 1
+        self.writers.add(writer)
+        try:
+            await self.handle_client(reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.writers.discard(writer)
+            writer.close()
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+        raise NotImplementedError()
+
+    async def send_reply(self, writer: asyncio.StreamWriter, reply: bytes,
+                         terminator: bytes = b''):
+        """
+        Writes a reply after the configured latency.  The connection may
+        be dropped instead, in which case a ConnectionResetError ends the
+        client handler, or the reply may be replaced with a malformed one.
+        The terminator is appended after any corruption so that the
+        malformed reply still reads as a complete frame.
+        """
+        faults = self.faults
+        delay = faults.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        if faults.drop():
+            self.dropped += 1
+            writer.close()
+            raise ConnectionResetError('Dropped by the simulator.')
+        if faults.malform():
+            self.malformed += 1
+            reply = faults.malformed(reply)
+        writer.write(reply + terminator)
+        await writer.drain()
+
+    async def drop_connections(self):
+        """
+        Closes every client connection, as a device reboot would.
+        """
+        writers = list(self.writers)
+        self.dropped += len(writers)
+        for writer in writers:
+            writer.close()
+
+    async def stop(self):
+        if self.server:
+            self.server.close()
+            for writer in list(self.writers):
+                writer.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    def start_in_thread(self) -> 'Simulator':
+        """
+        Starts the simulator on a new event loop running on a daemon
+        thread and returns once the server is listening.
+        """
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.start())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True,
+                                       name=self.__class__.__name__)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def call(self, coroutine):
+        """
+        Runs a coroutine on the simulator's thread and waits for it.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine,
+                                                self.loop).result()
+
+    def stop_in_thread(self):
+        if self.loop:
+            self.call(self.stop())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
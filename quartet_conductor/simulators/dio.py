@@ -0,0 +1,277 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from logging import getLogger
+
+from quartet_conductor import dio
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+_lock = threading.Lock()
+_simulator = None
+# the edge processes only need the image file so there is no need to
+# start a fresh interpreter for them where fork is available
+_context = multiprocessing.get_context(
+    'fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+
+def _pulse(path: str, size: int, offset: int, point: int, period: float,
+           width: float, count: int = None):
+    """
+    Runs in the edge process started by start_edges.
+    """
+    fd = os.open(path, os.O_RDWR)
+    image = mmap.mmap(fd, size)
+    bit = 1 << (point - 1)
+
+    def wait(until: float):
+        # sleeping rather than spinning leaves the CPU to the monitor on
+        # small machines, at the cost of pulses up to ~100us long
+        remaining = until - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def set_bit(on: bool):
+        word = int.from_bytes(image[offset:offset + 2], 'little')
+        word = word | bit if on else word & ~bit
+        image[offset:offset + 2] = word.to_bytes(2, 'little')
+
+    deadline = time.perf_counter()
+    sent = 0
+    try:
+        while count is None or sent < count:
+            set_bit(True)
+            wait(deadline + width)
+            set_bit(False)
+            sent += 1
+            deadline += period
+            wait(deadline)
+    finally:
+        image.close()
+        os.close(fd)
+
+
+class ProcessImageSimulator:
+    """
+    Stands in for the RevPi process image and DIO modules.  The image is a
+    memory mapped file, so a ProcessImage opened on `path` (for example by
+    the edge triggered input monitor, in this or another process) reads
+    the inputs set here.  Each module has a two byte input word at its
+    DIO_INPUT_OFFSETS offset and a two byte output word right after it.
+
+    Inputs are set with `set_input`, pulsed with `pulse`, set on a
+    schedule with `play` or pulsed at a fixed rate from a separate process
+    with `start_edges`.  Every output
+    write is recorded with its time.time() timestamp in `outputs`.
+    """
+
+    def __init__(self, path: str = None, size: int = None,
+                 offsets: dict = None, history: int = 100000):
+        """
+        :param path: The image file.  Default is the DIO_SIMULATOR_IMAGE
+            setting or a process_image file in CONDUCTOR_STATE_DIR.
+        :param size: The image size in bytes.  Default is the
+            PROCESS_IMAGE_SIZE setting.
+        :param offsets: A dictionary of module name to input word offset.
+            Default is the DIO_INPUT_OFFSETS setting.
+        :param history: The number of output writes to keep.
+        """
+        self.path = path or get_image_path()
+        self.size = size or conductor_settings.PROCESS_IMAGE_SIZE
+        self.offsets = offsets or conductor_settings.DIO_INPUT_OFFSETS
+        with open(self.path, 'a+b') as f:
+            if os.fstat(f.fileno()).st_size < self.size:
+                f.truncate(self.size)
+        self.fd = os.open(self.path, os.O_RDWR)
+        self.map = mmap.mmap(self.fd, self.size)
+        self.lock = threading.Lock()
+        self.outputs = deque(maxlen=history)
+        self.output_count = 0
+        self.edge_count = 0
+        self.threads = []
+        self.processes = []
+        self.running = True
+
+    def _set_bit(self, offset: int, point: int, on: bool):
+        with self.lock:
+            word = int.from_bytes(self.map[offset:offset + 2], 'little')
+            bit = 1 << (point - 1)
+            word = word | bit if on else word & ~bit
+            self.map[offset:offset + 2] = word.to_bytes(2, 'little')
+
+    def _get_bit(self, offset: int, point: int) -> bool:
+        word = int.from_bytes(self.map[offset:offset + 2], 'little')
+        return bool(word & 1 << (point - 1))
+
+    def set_input(self, module: str, point: int, on: bool = True):
+        self._set_bit(self.offsets[module or dio.default_module()], point,
+                      on)
+
+    def get_input(self, module: str, point: int) -> bool:
+        return self._get_bit(self.offsets[module or dio.default_module()],
+                             point)
+
+    def set_output(self, module: str, point: int, on: bool = True):
+        """
+        Sets an output bit and records the write.
+        """
+        module = module or dio.default_module()
+        self._set_bit(self.offsets[module] + 2, point, on)
+        self.outputs.append((time.time(), module, point, on))
+        self.output_count += 1
+
+    def get_output(self, module: str, point: int) -> bool:
+        return self._get_bit(
+            self.offsets[module or dio.default_module()] + 2, point)
+
+    def pulse(self, module: str, point: int, width: float = .001):
+        """
+        Raises an input for `width` seconds.  The monitor has to poll at
+        least that often to see the edge.
+        """
+        self.set_input(module, point, True)
+        self.edge_count += 1
+        # sleep rather than spin so a monitor thread can run meanwhile
+        time.sleep(width)
+        self.set_input(module, point, False)
+
+    def start_edges(self, address, rate: float, count: int = None,
+                    width: float = None) -> multiprocessing.Process:
+        """
+        Pulses an input `rate` times per second.  The pulses are driven by
+        a separate process, through the image file, so that they keep
+        their timing while this process is busy handling them.
+        :param address: The input address, for example 2 or right:3.
+        :param rate: The number of pulses per second.
+        :param count: Stop after this many pulses.  Default is to run until
+            `stop` is called.
+        :param width: How long each pulse stays high.  Default is half of
+            the pulse period.
+        :return: The process, join it to wait for the last pulse.
+        """
+        module, point = dio.parse_address(address)
+        period = 1 / rate
+        width = period / 2 if width is None else width
+        process = _context.Process(
+            target=_pulse, name='dio-edges-%s' % address,
+            args=(self.path, self.size, self.offsets[module], point, period,
+                  width, count),
+            daemon=True
+        )
+        process.start()
+        self.processes.append(process)
+        if count:
+            self.edge_count += count
+        return process
+
+    def play(self, script: list) -> threading.Thread:
+        """
+        Sets inputs on a daemon thread according to a script of
+        (seconds from start, address, on) tuples.
+        """
+
+        def run():
+            start = time.perf_counter()
+            for offset, address, on in sorted(script, key=lambda s: s[0]):
+                if not self.running:
+                    break
+                remaining = start + offset - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+                module, point = dio.parse_address(address)
+                self.set_input(module, point, on)
+                if on:
+                    self.edge_count += 1
+
+        thread = threading.Thread(target=run, daemon=True,
+                                  name='dio-script')
+        self.threads.append(thread)
+        thread.start()
+        return thread
+
+    def stop(self):
+        """
+        Stops any scripts and edge processes.
+        """
+        self.running = False
+        for thread in self.threads:
+            thread.join()
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self.threads = []
+        self.processes = []
+        self.running = True
+
+    def close(self):
+        self.stop()
+        self.map.close()
+        os.close(self.fd)
+
+
+class InputMonitor:
+    """
+    Stands in for the revpy_dio InputMonitor when the revpy_dio package is
+    not installed.  `run` polls the simulated process image every
+    `sleep_interval` seconds and calls `handle_input` for each input that
+    went high.
+    """
+
+    def __init__(self, sleep_interval: float = .1, left: bool = True):
+        self.sleep_interval = sleep_interval
+        self.left = left
+
+    def handle_input(self, input_number: int, module: str = None):
+        raise NotImplementedError()
+
+    def run(self):
+        image = dio.ProcessImage()
+        module = dio.default_module()
+        offset = conductor_settings.DIO_INPUT_OFFSETS[module]
+        last = image.read_word(offset)
+        while True:
+            word = image.read_word(offset)
+            rising = word & ~last
+            last = word
+            for i in range(conductor_settings.DIO_INPUTS_PER_MODULE):
+                if rising & 1 << i:
+                    self.handle_input(i + 1, module)
+            time.sleep(self.sleep_interval)
+
+
+def get_image_path() -> str:
+    return (conductor_settings.DIO_SIMULATOR_IMAGE or
+            os.path.join(get_state_dir(), 'process_image'))
+
+
+def get_simulator() -> ProcessImageSimulator:
+    """
+    Returns the process-wide simulator the DIO_BACKEND 'simulator' writes
+    outputs to.
+    """
+    global _simulator
+    if _simulator is None:
+        with _lock:
+            if _simulator is None:
+                _simulator = ProcessImageSimulator()
+    return _simulator
@@ -0,0 +1,83 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import asyncio
+import re
+
+from quartet_conductor.simulators.base import Faults, Simulator
+
+COMMAND = re.compile(rb'<([^<>]*)>')
+
+
+class MicroscanSimulator(Simulator):
+    """
+    A local stand-in for a Microscan reader's TCP port.
+
+    * `<Knnn,...>` configuration commands are stored in `settings` by
+      command, for example `K231h`, and are not answered.
+    * `<Knnn?>` is answered with the stored command, for example
+      `<K231h,1,*W6G*>`, or `<Knnn>` if it was never set.
+    * `<K?>` is answered with every stored command.
+    * Anything else, for example `<Z>` or `<A>`, is not answered.
+
+    Every command received is kept, in order, in `received`.  The latency,
+    dropped connections and malformed replies described by `faults` are
+    applied to the query replies and a connection may also be dropped
+    when a configuration command arrives.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 faults: Faults = None):
+        super().__init__(host, port, faults)
+        self.received = []
+        self.settings = {}
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+        buffer = b''
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            buffer += data
+            end = 0
+            for match in COMMAND.finditer(buffer):
+                end = match.end()
+                command = match.group(1).decode('ascii', errors='replace')
+                self.received.append(command)
+                reply = self.reply(command)
+                if reply:
+                    await self.send_reply(writer, reply)
+                elif self.faults.drop():
+                    self.dropped += 1
+                    return
+            buffer = buffer[end:]
+
+    def reply(self, command: str) -> bytes:
+        """
+        Applies a command and returns its reply or None.
+        """
+        if command == 'K?':
+            return ''.join('<%s>' % value
+                           for value in self.settings.values()
+                           ).encode('ascii')
+        if command.startswith('K') and command.endswith('?'):
+            code = command[:-1]
+            for key, value in self.settings.items():
+                if key == code or key.rstrip('h') == code:
+                    return ('<%s>' % value).encode('ascii')
+            return ('<%s>' % code).encode('ascii')
+        if command.startswith('K'):
+            self.settings[command.split(',', 1)[0]] = command
+        return None
@@ -0,0 +1,132 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import asyncio
+from collections import deque
+
+from quartet_conductor.videojet.protocol import Frame, FrameParser
+from quartet_conductor.simulators.base import Faults, Simulator
+
+DEFAULT_JOB_FIELDS = {
+    'LOT': 'W6G',
+    'EXPIRY': '221100',
+    'GTIN': '00377713123456',
+    'SERIAL_NUMBER': '',
+}
+
+
+class VideojetSimulator(Simulator):
+    """
+    A local stand-in for a Videojet printer's text communications port.
+
+    * GJD is answered with a JDL frame containing the job fields.
+    * JDA updates the job fields and is answered with ACK.
+    * SLA selects a job and is answered with ACK.
+    * GST is answered with an STS frame.
+    * QAD adds a record to the external data queue (NAK when full), GQD
+      returns the queue depth in a QDR frame and QCL clears the queue.
+    * Anything else is answered with NAK.
+
+    Call `print_labels` to simulate the printer consuming queued records.
+
+    Every frame received is kept in `received` for inspection.  JDA is
+    answered with NAK with a probability of `nak_rate` and the latency,
+    dropped connections and malformed replies described by `faults` are
+    applied to every reply.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 job_fields: dict = None, queue_capacity: int = 100,
+                 faults: Faults = None, nak_rate: float = 0.0):
+        super().__init__(host, port, faults)
+        self.nak_rate = nak_rate
+        self.job_fields = dict(job_fields or DEFAULT_JOB_FIELDS)
+        self.job_name = 'CONDUCTOR'
+        self.received = []
+        self.queue = deque()
+        self.queue_capacity = queue_capacity
+        self.printed = []
+
+    async def handle_client(self, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+        parser = FrameParser()
+        while True:
+            data = await reader.read(4096)
+            if not data:
+                break
+            for frame in parser.feed(data):
+                self.received.append(frame)
+                reply = self.reply(frame)
+                if reply:
+                    await self.send_reply(writer, reply, b'\r')
+
+    def reply(self, frame: Frame) -> bytes:
+        """
+        Returns the reply for a request frame.
+        """
+        if frame.command == 'GJD':
+            return self.job_data()
+        elif frame.command == 'JDA':
+            if self.nak_rate and self.faults.random.random() < self.nak_rate:
+                return b'NAK'
+            self.job_fields.update(frame.fields)
+            return b'ACK'
+        elif frame.command == 'SLA':
+            items = frame.raw.decode('ascii').split('|')
+            if len(items) < 2 or not items[1]:
+                return b'NAK'
+            self.job_name = items[1]
+            return b'ACK'
+        elif frame.command == 'GST':
+            return self.status()
+        elif frame.command == 'QAD':
+            if len(self.queue) >= self.queue_capacity:
+                return b'NAK'
+            self.queue.append(frame.fields)
+            return b'ACK'
+        elif frame.command == 'GQD':
+            return ('QDR|COUNT=%s|' % len(self.queue)).encode('ascii')
+        elif frame.command == 'QCL':
+            self.queue.clear()
+            return b'ACK'
+        return b'NAK'
+
+    def print_labels(self, count: int = 1) -> list:
+        """
+        Consumes records from the data queue as if labels were printed.
+        :return: The records that were printed.
+        """
+        ret = []
+        for i in range(min(count, len(self.queue))):
+            record = self.queue.popleft()
+            self.job_fields.update(record)
+            ret.append(record)
+        self.printed += ret
+        return ret
+
+    def job_data(self) -> bytes:
+        fields = '|'.join('%s=%s' % (name, value)
+                          for name, value in self.job_fields.items())
+        return ('JDL|%s|' % fields).encode('ascii')
+
+    def status(self) -> bytes:
+        return ('STS|JOB=%s|STATE=RUNNING|' % self.job_name).encode('ascii')
+
+    async def push(self, frame: bytes):
+        """
+        Sends an unsolicited frame to every connected client.
+        """
+        for writer in list(self.writers):
+            writer.write(frame + b'\r')
+            await writer.drain()
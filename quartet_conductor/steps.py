@@ -13,14 +13,20 @@
 #
 # Copyright 2020 SerialLab Corp.  All rights reserved.
 
-from quartet_capture import rules, models
+from quartet_capture import models
 from quartet_capture.rules import RuleContext
 from quartet_templates.steps import TemplateStep as TS
-from telnetlib import Telnet
-from revpy_dio import outputs
-from quartet_conductor.session import get_session
+from quartet_conductor import connections
+from quartet_conductor.rules import ParameterSnapshotMixin, Step
+from quartet_conductor import dio
+from quartet_conductor.context import LayeredContext
+from quartet_conductor import lifecycle
+from quartet_conductor import metrics
+from quartet_conductor import traces
+from quartet_conductor.session import get_session, SessionState, \
+    SessionPausedError
 from quartet_conductor import settings as conductor_settings
-from quartet_conductor.models import InputMap
+from quartet_conductor.input_maps import get_input_map
 from django.conf import settings
 from enum import Enum
 
@@ -38,13 +44,14 @@ class ContextKeys(Enum):
 
 class InvalidInputError(Exception):
     """
-    Raised when a bad input (above or below the avialable number of inputs (16))
-    has been sent into the rule.
+    Raised when a bad input (a module that is not configured or a point
+    above or below the available number of inputs on the module) has been
+    sent into the rule.
     """
     pass
 
 
-class TemplateStep(TS):
+class TemplateStep(ParameterSnapshotMixin, TS):
 
     def execute(self, data, rule_context: RuleContext):
         ret = super().execute(data, rule_context)
@@ -52,32 +59,44 @@ class TemplateStep(TS):
         return ret.encode('ascii')
 
 
-class GetSessionStep(rules.Step):
+class GetSessionStep(Step):
     """
     This step assumes that the data passed into the capture
-    rule contains a single digit representing an IO port on a DIO
-    module.  This digit will be placed on the context under the
-    INPUT_NUMBER context key.
+    rule contains an input address on a DIO module- either a single
+    number for the default module or `module:point`, for example `right:3`.
+    The input's key (see quartet_conductor.dio.input_key) will be placed on
+    the context under the INPUT_NUMBER context key.
     """
 
     def execute(self, data, rule_context: RuleContext):
         self.info('Processing data %s', data)
-        input = int(data)
-        self.check_input(input)
-        input_map = self.get_input_map(input)
-        self.check_input(input_map.related_session_input)
-        session = get_session(input_map.related_session_input)
-        rule_context.context.update(session.context.context)
-        rule_context.context[ContextKeys.INPUT_NUMBER.value] = input
+        module, point = self.check_input(data)
+        input_map = self.get_input_map(module, point)
+        session_module, session_point = self.check_input(
+            input_map.related_session_address)
+        session_key = dio.input_key(session_module, session_point)
+        with metrics.timer('session'):
+            session = get_session(session_key)
+        lifecycle.manager.touch(session_key)
+        traces.annotate(lot=session.lot)
+        if session.state == SessionState.PAUSED.value:
+            raise SessionPausedError('The session for lot %s is paused.' %
+                                     session.lot)
+        # layer the task's context over the session's instead of copying it
+        rule_context.context = LayeredContext(rule_context.context,
+                                              session.context.context)
+        rule_context.context[ContextKeys.INPUT_NUMBER.value] = dio.input_key(
+            module, point)
         self.info('Session context %s', rule_context)
         return data
 
     def check_input(self, input):
-        if input < 1 or input > 16:
+        try:
+            return dio.parse_address(input)
+        except dio.InvalidAddressError as e:
             raise InvalidInputError('%s is not a valid input.  Check your '
                                     'inbound input and your related input '
-                                    'on your input map to ensure that the '
-                                    'number is between one and 16.' % input)
+                                    'on your input map. %s' % (input, e))
 
     @property
     def declared_parameters(self):
@@ -86,44 +105,49 @@ class GetSessionStep(rules.Step):
     def on_failure(self):
         pass
 
-    def get_input_map(self, input: int):
-        try:
-            input_map = InputMap.objects.get(
-                input_number=input
-            )
-            if input_map.related_session_input == None:
-                raise InvalidInputError(
-                    'The Input Map defined for this input (%s), does not '
-                    'have a related session input defined.  Please define '
-                    'the input that is responsible for starting a print '
-                    'session.' % input
-                )
-            return input_map
-        except InputMap.DoesNotExist:
+    def get_input_map(self, module: str, input: int):
+        with metrics.timer('input_map'):
+            input_map = get_input_map(module, input)
+        if input_map is None:
             raise InvalidInputError('There is no input map defined for input '
-                                    '%s' % input)
+                                    '%s' % dio.format_address(module, input))
+        if input_map.related_session_input == None:
+            raise InvalidInputError(
+                'The Input Map defined for this input (%s), does not '
+                'have a related session input defined.  Please define '
+                'the input that is responsible for starting a print '
+                'session.' % input
+            )
+        return input_map
 
 
-class TelnetStep(rules.Step):
+class TelnetStep(Step):
     """
-    Sends the data from the channel to a Telnet endpoint and disconnects.
+    Sends the data from the channel to a Telnet endpoint.  The connection
+    is taken from the conductor connection pool and is kept open for the
+    next execution unless PERSISTENT_CONNECTIONS is set to False.
     """
 
     def __init__(self, db_task: models.Task, **kwargs):
         super().__init__(db_task, **kwargs)
         self.timeout = getattr(settings, 'TELNET_TIMEOUT', 3)
-        self.error_output = int(self.get_or_create_parameter(
+        self.error_output = self.get_or_create_parameter(
             'Error Output Port', '8',
             'The output to raise high when the printer can not be reached, '
-            'default is 8.'
-        ))
+            'default is 8.  Use module:output, for example right:8, for an '
+            'output that is not on the default module.'
+        )
 
     def execute(self, data, rule_context: RuleContext):
         self.init_params()
-        with Telnet(self.host, self.port, timeout=self.timeout) as client:
-            self.info('Writing data %s', data)
-            client.write(data)  # only output matches
-            client.close()
+        self.info('Writing data %s', data)
+        self.get_connection().send(data)
+
+    def get_connection(self) -> connections.PooledConnection:
+        """
+        Returns the pooled connection for the step's host and port.
+        """
+        return connections.get_connection(self.host, self.port, self.timeout)
 
     def init_params(self):
         self.host = self.get_or_create_parameter(
@@ -135,11 +159,11 @@ class TelnetStep(rules.Step):
             'Port', '23',
             'The port to send data to.'
         ))
-        self.error_output = int(self.get_or_create_parameter(
+        self.error_output = self.get_or_create_parameter(
             'Error Output Port', '2',
             'The output to raise high when the printer can not be reached, '
             'default is 2.'
-        ))
+        )
         error_output_on = self.get_or_create_parameter(
             'Error Out On', 'False', 'Whether or not to set the error output '
                                      'hot or turn it off.  Default is turn '
@@ -159,11 +183,11 @@ class TelnetStep(rules.Step):
             'There was a problem...setting the error output of %s '
             'and exiting.', self.error_output)
         if conductor_settings.OUTPUT_CONTROL:
-            outputs.set_output(self.error_output, on=self.error_output_on,
-                               left=conductor_settings.DIO_LEFT)
+            module, point = dio.parse_address(self.error_output)
+            dio.set_output(module, point, on=self.error_output_on)
 
 
-class SetOutputsStep(rules.Step):
+class SetOutputsStep(Step):
     """
     Turns outputs on based on a comma delimited list of outputs.  To turn
     outputs on then off, consider using a delay step from the capture
@@ -177,19 +201,20 @@ class SetOutputsStep(rules.Step):
         on = on in ['True', 'true']
         output_list = self.get_parameter('Output List', '',
                                          raise_exception=True)
-        list = output_list.split(',')
+        list = dio.parse_address_list(output_list)
         self.info('Setting the outputs %s to %s.', output_list, on)
         if conductor_settings.OUTPUT_CONTROL:
-            left = conductor_settings.DIO_LEFT
-            [outputs.set_output(int(l.strip()), on=on, left=left) for l in
-             list]
+            [dio.set_output(module, point, on=on) for module, point in list]
 
     @property
     def declared_parameters(self):
         return {
             'On': 'Whether or not to turn the outputs on or off- default is '
                   'True for On.  To turn outputs off set On to False.',
-            'Output List': 'A comma delimited list of output number to set.'
+            'Output List': 'A comma delimited list of output number to set. '
+                           'Outputs on a module other than the default '
+                           'are given as module:output, for example '
+                           'right:3.'
         }
 
     def on_failure(self):
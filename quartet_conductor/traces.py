@@ -0,0 +1,298 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import glob
+import mmap
+import os
+import struct
+import threading
+import time
+from logging import getLogger
+
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.invalidation import get_state_dir
+
+logger = getLogger(__name__)
+
+# the print path stages recorded for each trace (see
+# quartet_conductor.metrics)
+STAGES = ('input', 'input_map', 'session', 'serial', 'connect', 'write',
+          'ack', 'rule')
+STAGE_INDEX = {stage: i for i, stage in enumerate(STAGES)}
+UNSET = 0xFFFFFFFF
+
+MAGIC = b'QCTR'
+HEADER = struct.Struct('<4sIIQ')
+# seq, wall clock start, monotonic start ns, input, lot, serial number,
+# outcome, error type and one duration per stage in microseconds
+RECORD = struct.Struct('<QdQi20s32sB31s%dI' % len(STAGES))
+
+OK = 0
+FAILED = 1
+OUTCOMES = {OK: 'OK', FAILED: 'FAILED'}
+
+_local = threading.local()
+
+
+class Trace:
+    """
+    The trace of a single trigger: the input, the session lot and serial
+    number it printed, how long each stage took and how it ended.
+    """
+    __slots__ = ('seq', 'started', 'start_ns', 'input', 'lot',
+                 'serial_number', 'outcome', 'error', 'durations')
+
+    def __init__(self, input: int = -1):
+        self.seq = 0
+        self.started = time.time()
+        self.start_ns = time.monotonic_ns()
+        self.input = input
+        self.lot = ''
+        self.serial_number = ''
+        self.outcome = OK
+        self.error = ''
+        self.durations = [UNSET] * len(STAGES)
+
+    def add(self, stage: str, seconds: float):
+        index = STAGE_INDEX.get(stage)
+        if index is None:
+            return
+        micros = int(seconds * 1000000)
+        current = self.durations[index]
+        self.durations[index] = min(
+            micros if current == UNSET else current + micros, UNSET - 1)
+
+    def pack(self, buffer, offset: int):
+        RECORD.pack_into(
+            buffer, offset, self.seq, self.started, self.start_ns,
+            self.input, str(self.lot).encode('utf-8')[:20],
+            str(self.serial_number).encode('utf-8')[:32], self.outcome,
+            self.error.encode('utf-8')[:31], *self.durations)
+
+    @classmethod
+    def unpack(cls, buffer, offset: int) -> 'Trace':
+        values = RECORD.unpack_from(buffer, offset)
+        trace = cls.__new__(cls)
+        (trace.seq, trace.started, trace.start_ns, trace.input, lot,
+         serial_number, trace.outcome, error) = values[:8]
+        trace.lot = lot.rstrip(b'\0').decode('utf-8', errors='replace')
+        trace.serial_number = serial_number.rstrip(b'\0').decode(
+            'utf-8', errors='replace')
+        trace.error = error.rstrip(b'\0').decode('utf-8', errors='replace')
+        trace.durations = list(values[8:])
+        return trace
+
+    @property
+    def total(self) -> float:
+        """
+        The time the whole trigger took in seconds.
+        """
+        rule = self.durations[STAGE_INDEX['rule']]
+        if rule != UNSET:
+            return rule / 1000000
+        return sum(d for d in self.durations if d != UNSET) / 1000000
+
+    def to_dict(self) -> dict:
+        return {
+            'started': self.started,
+            'monotonic_ns': self.start_ns,
+            'input': self.input,
+            'lot': self.lot,
+            'serial_number': self.serial_number,
+            'outcome': OUTCOMES.get(self.outcome, str(self.outcome)),
+            'error': self.error,
+            'stages': {stage: d / 1000000 for stage, d in
+                       zip(STAGES, self.durations) if d != UNSET},
+            'total': self.total,
+        }
+
+
+class TraceRing:
+    """
+    A fixed number of trace records preallocated in a memory mapped file,
+    one file per process, in the traces directory of CONDUCTOR_STATE_DIR.
+    The newest record overwrites the oldest.  Because the records live in a
+    file they can be read by other processes, and are still there after
+    the process exits.
+    """
+
+    def __init__(self, path: str, capacity: int):
+        self.path = path
+        self.capacity = capacity
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        size = HEADER.size + capacity * RECORD.size
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.mm, 0, MAGIC, capacity, RECORD.size, 0)
+        self.count = 0
+
+    def write(self, trace: Trace):
+        with self.lock:
+            self.count += 1
+            trace.seq = self.count
+            index = (self.count - 1) % self.capacity
+            trace.pack(self.mm, HEADER.size + index * RECORD.size)
+            HEADER.pack_into(self.mm, 0, MAGIC, self.capacity, RECORD.size,
+                             self.count)
+
+    def close(self):
+        self.mm.close()
+
+
+def read_ring(path: str) -> list:
+    """
+    Reads the traces from a ring file, oldest first.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, capacity, record_size, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or record_size != RECORD.size:
+        logger.warning('%s is not a trace file.', path)
+        return []
+    traces = []
+    for index in range(min(capacity, count)):
+        trace = Trace.unpack(data, HEADER.size + index * RECORD.size)
+        if trace.seq:
+            traces.append(trace)
+    traces.sort(key=lambda t: t.seq)
+    return traces
+
+
+def get_trace_dir() -> str:
+    directory = os.path.join(get_state_dir(), 'traces')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def _remove_stale_rings(max_age: float = 86400):
+    # keep the traces of processes that ended recently- they may be needed
+    # to find out why the process ended
+    for path in glob.glob(os.path.join(get_trace_dir(), '*.ring')):
+        try:
+            os.kill(int(os.path.basename(path).split('.')[0]), 0)
+        except ProcessLookupError:
+            if time.time() - os.path.getmtime(path) > max_age:
+                os.remove(path)
+        except (PermissionError, ValueError):
+            pass
+
+
+_ring = None
+_ring_lock = threading.Lock()
+
+
+def get_ring():
+    """
+    Returns the trace ring of this process or None if tracing is disabled
+    (TRACE_BUFFER_SIZE = 0).
+    """
+    global _ring
+    if _ring is None or _ring.pid != os.getpid():
+        if not conductor_settings.TRACE_BUFFER_SIZE:
+            return None
+        with _ring_lock:
+            if _ring is None or _ring.pid != os.getpid():
+                path = os.path.join(get_trace_dir(),
+                                    '%s.ring' % os.getpid())
+                _remove_stale_rings()
+                _ring = TraceRing(path, conductor_settings.TRACE_BUFFER_SIZE)
+    return _ring
+
+
+def begin(input: int = -1) -> Trace:
+    """
+    Starts the trace of a trigger on the current thread.  If the thread
+    already has a trace that has not ended it is returned instead.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        trace = _local.trace = Trace(input)
+    elif trace.input < 0:
+        trace.input = input
+    return trace
+
+
+def current():
+    """
+    :return: The trace of the current thread or None.
+    """
+    return getattr(_local, 'trace', None)
+
+
+def annotate(lot: str = None, serial_number: str = None):
+    """
+    Adds the session lot or the printed serial number to the current
+    trace, if any.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        if lot is not None:
+            trace.lot = lot
+        if serial_number is not None:
+            trace.serial_number = serial_number
+
+
+def record_stage(stage: str, seconds: float):
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def end(exc: BaseException = None):
+    """
+    Ends the trace of the current thread and writes it to the ring.
+    :param exc: The exception the trigger failed with, if any.
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return
+    _local.trace = None
+    if exc is not None:
+        trace.outcome = FAILED
+        trace.error = type(exc).__name__
+    ring = get_ring()
+    if ring is not None:
+        ring.write(trace)
+
+
+def get_traces(last: int = 20, input: int = None, lot: str = None,
+               failed: bool = False, slower_than: float = None) -> list:
+    """
+    Returns the most recent traces of all of the conductor processes,
+    oldest first.
+    :param last: The number of traces to return.
+    :param input: Only return traces for this input.
+    :param lot: Only return traces for this lot.
+    :param failed: Only return the traces of failed triggers.
+    :param slower_than: Only return traces that took longer than this
+        number of seconds.
+    """
+    traces = []
+    for path in glob.glob(os.path.join(get_trace_dir(), '*.ring')):
+        traces += read_ring(path)
+    traces = [
+        t for t in traces
+        if (input is None or t.input == input) and
+        (lot is None or t.lot == lot) and
+        (not failed or t.outcome == FAILED) and
+        (slower_than is None or t.total > slower_than)
+    ]
+    # the monotonic clocks of the processes do not share an origin
+    traces.sort(key=lambda t: t.started)
+    return traces[-last:] if last else traces
@@ -0,0 +1,398 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import asyncio
+import threading
+import time
+from collections import deque
+from logging import getLogger
+from typing import Callable, List
+
+from quartet_conductor import metrics
+from quartet_conductor import recording
+
+logger = getLogger(__name__)
+
+TERMINATOR = b'\r'
+
+# the reply commands each request command can be answered with- anything
+# not listed here is answered with an ACK or NAK
+REPLIES = {
+    'GJD': ('JDL', 'NAK'),
+    'GST': ('STS', 'NAK'),
+    'GJN': ('JOB', 'NAK'),
+    'GJL': ('JBL', 'NAK'),
+}
+DEFAULT_REPLIES = ('ACK', 'NAK')
+
+
+class ProtocolError(Exception):
+    """
+    Raised when the printer can not be reached, hangs up or does not
+    answer a request in time.
+    """
+    blink = 3
+
+
+class Frame:
+    """
+    A single carriage return terminated message from the printer, for
+    example `JDL|LOT=ABC|EXPIRY=210101|` or `ACK`.
+    """
+
+    def __init__(self, raw: bytes):
+        self.raw = raw
+        text = raw.decode('ascii', errors='replace')
+        items = text.split('|')
+        self.command = items[0].strip()
+        self.fields = {}
+        for item in items[1:]:
+            if '=' in item:
+                name, val = item.split('=', 1)
+                self.fields[name] = val
+
+    @property
+    def is_ack(self):
+        return self.command == 'ACK'
+
+    @property
+    def is_nak(self):
+        return self.command == 'NAK'
+
+    def __repr__(self):
+        return 'Frame(%r)' % self.raw
+
+
+class FrameParser:
+    """
+    Incrementally splits the bytes read off of the socket into frames.
+    Partial frames are kept until the rest of the frame arrives.
+    """
+
+    def __init__(self, terminator: bytes = TERMINATOR):
+        self.terminator = terminator
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """
+        Adds data to the parser and returns any frames that are complete.
+        """
+        self.buffer += data
+        ret = []
+        while True:
+            index = self.buffer.find(self.terminator)
+            if index < 0:
+                break
+            raw = bytes(self.buffer[:index]).strip(b'\n')
+            del self.buffer[:index + len(self.terminator)]
+            if raw:
+                ret.append(Frame(raw))
+        return ret
+
+
+def get_command(request: bytes) -> str:
+    """
+    Returns the three letter command of an encoded request.
+    """
+    return request.split(b'|', 1)[0].strip().decode('ascii')
+
+
+class VideojetProtocol(asyncio.Protocol):
+    """
+    asyncio protocol for the Videojet text communications interface.
+    The printer answers requests in the order they were received so
+    requests can be pipelined- replies are matched to the oldest
+    outstanding request.  Frames that are not an expected reply to the
+    oldest outstanding request are treated as unsolicited status frames
+    and passed to the event listeners.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.parser = FrameParser()
+        self.pending = deque()
+        self.listeners = []
+        self.closed = asyncio.Event()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data: bytes):
+        for frame in self.parser.feed(data):
+            self.frame_received(frame)
+
+    def frame_received(self, frame: Frame):
+        while self.pending and self.pending[0][1].done():
+            # drop requests that were cancelled by their caller
+            self.pending.popleft()
+        if self.pending and frame.command in self.pending[0][0]:
+            expected, future = self.pending.popleft()
+            future.set_result(frame)
+        else:
+            logger.debug('Unsolicited frame %s', frame)
+            for listener in self.listeners:
+                try:
+                    listener(frame)
+                except Exception:
+                    logger.exception('Frame listener failed.')
+
+    def connection_lost(self, exc):
+        self.fail_pending(ProtocolError('The printer closed the '
+                                        'connection. %s' % (exc or '')))
+        self.closed.set()
+
+    def fail_pending(self, exc: Exception):
+        while self.pending:
+            expected, future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(exc)
+
+    def send(self, request: bytes, expected: tuple = None) -> asyncio.Future:
+        """
+        Writes the request and returns a future for its reply.
+        :param request: The encoded request.
+        :param expected: The reply commands that answer the request.  If
+            not supplied they are looked up in REPLIES.
+        """
+        if not request.endswith(TERMINATOR):
+            request += TERMINATOR
+        expected = expected or REPLIES.get(get_command(request),
+                                           DEFAULT_REPLIES)
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append((expected, future))
+        self.transport.write(request)
+        return future
+
+
+class VideojetClient:
+    """
+    An asyncio client for the Videojet text communications protocol.
+
+    Usage::
+
+        client = VideojetClient('printer', 777)
+        await client.connect()
+        frame = await client.request(b'GJD')
+        replies = await client.pipeline([b'JDA|SN=1|', b'JDA|SN=2|'])
+    """
+
+    def __init__(self, host: str, port: int, timeout: float = 3):
+        self.host = host
+        self.port = int(port)
+        self.timeout = timeout
+        self.protocol = None
+        self.listeners = []
+        self.connect_lock = None
+
+    @property
+    def connected(self):
+        return self.protocol is not None and not self.protocol.closed.is_set()
+
+    def add_listener(self, listener: Callable[[Frame], None]):
+        """
+        Registers a callable that receives any unsolicited frames.
+        """
+        self.listeners.append(listener)
+        if self.protocol:
+            self.protocol.listeners = self.listeners
+
+    async def connect(self):
+        if self.connected:
+            return
+        if self.connect_lock is None:
+            # created on the loop that uses it
+            self.connect_lock = asyncio.Lock()
+        async with self.connect_lock:
+            # another request may have connected while this one waited
+            if not self.connected:
+                await self._connect()
+
+    async def _connect(self):
+        loop = asyncio.get_event_loop()
+        start = time.perf_counter()
+        try:
+            transport, protocol = await asyncio.wait_for(
+                loop.create_connection(VideojetProtocol, self.host,
+                                       self.port),
+                self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise ProtocolError('Could not connect to the printer at %s:%s. '
+                                '%s' % (self.host, self.port, e))
+        metrics.observe('connect', time.perf_counter() - start)
+        protocol.listeners = self.listeners
+        self.protocol = protocol
+
+    async def request(self, request: bytes, expected: tuple = None) -> Frame:
+        """
+        Sends a single request and waits for its reply.
+        """
+        return (await self.pipeline([request], expected))[0]
+
+    async def pipeline(self, requests: List[bytes],
+                       expected: tuple = None) -> List[Frame]:
+        """
+        Writes all of the requests without waiting for replies and then
+        waits for each reply.  The timeout applies to each reply, not to
+        the whole batch.  If a reply does not arrive in time the
+        connection is closed since any late reply would be matched to the
+        wrong request.
+        """
+        await self.connect()
+        protocol = self.protocol
+        with metrics.timer('write'):
+            futures = [protocol.send(request, expected)
+                       for request in requests]
+        for request in requests:
+            if not request.endswith(TERMINATOR):
+                request += TERMINATOR
+            recording.record_send(self.host, self.port, request)
+        ret = []
+        try:
+            with metrics.timer('ack'):
+                for future in futures:
+                    frame = await asyncio.wait_for(future, self.timeout)
+                    recording.record_receive(self.host, self.port,
+                                             frame.raw + TERMINATOR)
+                    ret.append(frame)
+        except asyncio.TimeoutError:
+            self.close()
+            raise ProtocolError('The printer at %s:%s did not reply within '
+                                '%s seconds.' % (self.host, self.port,
+                                                 self.timeout))
+        finally:
+            # the replies after a failed one fail with the same error,
+            # which is reported once
+            for future in futures[len(ret):]:
+                if future.done() and not future.cancelled():
+                    future.exception()
+        return ret
+
+    def close(self):
+        if self.protocol is not None:
+            self.protocol.fail_pending(
+                ProtocolError('The connection was closed.'))
+            if self.protocol.transport:
+                self.protocol.transport.close()
+            self.protocol = None
+
+
+class ClientThread:
+    """
+    Runs an event loop on a daemon thread so that synchronous code, such as
+    rule steps, can share long lived asyncio clients.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.clients = {}
+
+    def start(self):
+        with self.lock:
+            if self.thread is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever,
+                                               name='videojet-client',
+                                               daemon=True)
+                self.thread.start()
+
+    def run(self, coroutine, timeout: float = None):
+        """
+        Runs a coroutine on the client loop and waits for the result.
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(
+            coroutine, self.loop).result(timeout)
+
+    def get_client(self, host: str, port: int,
+                   timeout: float = 3) -> 'SyncVideojetClient':
+        host, port = recording.resolve(host, port)
+        key = (host, int(port))
+        client = self.clients.get(key)
+        if client is None:
+            with self.lock:
+                client = self.clients.get(key)
+                if client is None:
+                    client = SyncVideojetClient(
+                        self, VideojetClient(host, port, timeout))
+                    self.clients[key] = client
+        return client
+
+    def close_client(self, host: str, port: int):
+        """
+        Closes and forgets the client for a printer.
+        """
+        host, port = recording.resolve(host, port)
+        with self.lock:
+            client = self.clients.pop((host, int(port)), None)
+        if client is not None:
+            client.close()
+
+    def close(self):
+        """
+        Closes all of the clients and stops the event loop.  The loop is
+        started again on the next request.
+        """
+        with self.lock:
+            if self.thread is None:
+                return
+            for client in self.clients.values():
+                self.loop.call_soon_threadsafe(client.client.close)
+            self.clients = {}
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
+            self.loop = None
+            self.thread = None
+
+
+class SyncVideojetClient:
+    """
+    Blocking facade over a VideojetClient running on a ClientThread.  If
+    the connection has been lost it is re-established on the next request.
+    """
+
+    def __init__(self, thread: ClientThread, client: VideojetClient):
+        self.thread = thread
+        self.client = client
+
+    def request(self, request: bytes, expected: tuple = None) -> Frame:
+        return self.pipeline([request], expected)[0]
+
+    def pipeline(self, requests: List[bytes],
+                 expected: tuple = None) -> List[Frame]:
+        return self.thread.run(self.client.pipeline(requests, expected))
+
+    def add_listener(self, listener: Callable[[Frame], None]):
+        """
+        Registers a callable that receives unsolicited frames.  Listeners
+        are called on the client thread.
+        """
+        self.client.add_listener(listener)
+
+    def close(self):
+        if self.thread.loop:
+            self.thread.loop.call_soon_threadsafe(self.client.close)
+
+
+client_thread = ClientThread()
+
+
+def get_client(host: str, port: int, timeout: float = 3) -> SyncVideojetClient:
+    """
+    Returns the shared blocking client for a printer.
+    """
+    return client_thread.get_client(host, port, timeout)
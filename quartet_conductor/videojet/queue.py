@@ -0,0 +1,275 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import threading
+from collections import deque
+from logging import getLogger
+
+from django.db import connection
+
+from quartet_conductor.videojet import protocol
+from quartet_conductor.videojet import serials
+
+logger = getLogger(__name__)
+
+_queues_lock = threading.Lock()
+_queues = {}
+
+
+class PrinterQueueError(Exception):
+    """
+    Raised when the printer rejects queued data or reports a queue depth
+    that does not make sense for what was sent to it.
+    """
+    blink = 3
+
+
+class PrinterQueue:
+    """
+    Keeps a window of upcoming serial numbers loaded into the printer's
+    external data queue so that the printer can print without a round trip
+    to the conductor for every label.
+
+    The queue keeps every serial number that was sent to the printer, in
+    order, until the printer reports that it has been consumed.  The
+    printer is asked for its queue depth before each top up- the
+    difference between what has been sent and what is still queued is the
+    number of labels that were printed.  Only `capacity - depth` new serials
+    are ever sent so the printer buffer can not overflow.
+    """
+
+    def __init__(self, host: str, port: int, serial_identifier: str,
+                 serial_number_field: str = 'SERIAL_NUMBER',
+                 queue_command: str = 'QAD|{0}={1}|',
+                 depth_command: str = 'GQD',
+                 depth_reply: str = 'QDR',
+                 depth_field: str = 'COUNT',
+                 clear_command: str = 'QCL',
+                 capacity: int = 50,
+                 poll_interval: float = 1.0,
+                 timeout: float = 3):
+        self.host = host
+        self.port = int(port)
+        self.serial_identifier = serial_identifier
+        self.serial_number_field = serial_number_field
+        self.queue_command = queue_command
+        self.depth_command = depth_command
+        self.depth_reply = depth_reply
+        self.depth_field = depth_field
+        self.clear_command = clear_command
+        self.capacity = capacity
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.sent = deque()
+        self.printed = 0
+        self.last_printed = None
+        self.running = False
+        self.stop_event = threading.Event()
+        self.worker = None
+
+    @property
+    def client(self) -> protocol.SyncVideojetClient:
+        return protocol.get_client(self.host, self.port, self.timeout)
+
+    def format_command(self, serial_number) -> bytes:
+        return serials.format_command(self.queue_command,
+                                      self.serial_number_field,
+                                      serial_number)
+
+    def get_depth(self) -> int:
+        """
+        Asks the printer how many queued records it has not printed yet.
+        """
+        frame = self.client.request(self.depth_command.encode('ascii'),
+                                    (self.depth_reply, 'NAK'))
+        try:
+            return int(frame.fields[self.depth_field])
+        except (KeyError, ValueError):
+            raise PrinterQueueError('The printer did not return a queue '
+                                    'depth: %s' % frame.raw)
+
+    def top_up(self) -> int:
+        """
+        Confirms any serial numbers the printer has consumed and sends
+        enough new serial numbers to fill the printer queue back up to its
+        capacity.
+        :return: The number of serial numbers that were sent.
+        """
+        with self.lock:
+            depth = self.get_depth()
+            consumed = len(self.sent) - depth
+            if consumed < 0:
+                raise PrinterQueueError(
+                    'The printer reports %s queued records but only %s were '
+                    'sent.  The printer queue was changed outside of the '
+                    'conductor.' % (depth, len(self.sent)))
+            for i in range(consumed):
+                self.last_printed = self.sent.popleft()
+            self.printed += consumed
+            free = self.capacity - depth
+            if free <= 0:
+                return 0
+            numbers = serials.allocate_serial_numbers(self.serial_identifier,
+                                                      free)
+            try:
+                replies = self.client.pipeline(
+                    [self.format_command(number) for number in numbers]
+                )
+            except protocol.ProtocolError as e:
+                # which of the records the printer queued is not known-
+                # clear them all so that the next top up starts over
+                unused = self._clear() + list(numbers)
+                logger.error('Could not queue serial numbers on %s:%s: %s  '
+                             'The printer queue was cleared, unused serial '
+                             'numbers: %s', self.host, self.port, e,
+                             ','.join(str(n) for n in unused))
+                raise PrinterQueueError('Could not queue serial numbers on '
+                                        '%s:%s. %s' % (self.host, self.port,
+                                                       e))
+            rejected = [number for number, reply in zip(numbers, replies)
+                        if not reply.is_ack]
+            # the printer queued everything it acknowledged, in order
+            self.sent.extend(number for number, reply in zip(numbers, replies)
+                             if reply.is_ack)
+            if rejected:
+                # clear the printer queue so that what it holds is known
+                # again- the next top up fills it from scratch
+                unused = self._clear() + rejected
+                logger.error('The printer rejected queued serial numbers '
+                             '%s.  The printer queue was cleared, unused '
+                             'serial numbers: %s',
+                             ','.join(str(n) for n in rejected),
+                             ','.join(str(n) for n in unused))
+                raise PrinterQueueError('The printer rejected queued '
+                                        'serial number %s.' % rejected[0])
+            logger.debug('Queued %s serial numbers on %s:%s, %s printed.',
+                         len(numbers), self.host, self.port, self.printed)
+            return len(numbers)
+
+    def start(self):
+        """
+        Clears the printer queue, fills it and, if a poll interval is set,
+        starts a thread that keeps it topped up.  A stopped queue can be
+        started again.
+        """
+        self.stop_event.clear()
+        self.client.request(self.clear_command.encode('ascii'))
+        self.top_up()
+        self.running = True
+        if self.poll_interval > 0:
+            self.worker = threading.Thread(
+                target=self._run,
+                name='printer-queue-%s:%s' % (self.host, self.port),
+                daemon=True
+            )
+            self.worker.start()
+
+    def stop(self) -> list:
+        """
+        Stops the polling thread, confirms what was printed and clears
+        whatever is left in the printer queue.
+        :return: The serial numbers that were sent but never printed.
+        """
+        self.running = False
+        self.stop_event.set()
+        if self.worker and self.worker is not threading.current_thread():
+            self.worker.join(self.timeout)
+        with self.lock:
+            unused = self._clear()
+        if unused:
+            logger.warning('Removed %s unprinted serial numbers from the '
+                           'printer queue on %s:%s: %s', len(unused),
+                           self.host, self.port,
+                           ','.join(str(n) for n in unused))
+        return unused
+
+    def _clear(self) -> list:
+        """
+        Confirms what was printed and clears the printer queue.  The lock
+        must be held.
+        :return: The serial numbers that were sent but never printed.
+        """
+        try:
+            depth = self.get_depth()
+            for i in range(max(len(self.sent) - depth, 0)):
+                self.last_printed = self.sent.popleft()
+                self.printed += 1
+            self.client.request(self.clear_command.encode('ascii'))
+        except (protocol.ProtocolError, PrinterQueueError):
+            logger.exception('Could not confirm the printer queue before '
+                             'clearing it.  Serial numbers below may have '
+                             'been printed.')
+        unused = list(self.sent)
+        self.sent.clear()
+        return unused
+
+    def _run(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                self.top_up()
+            except Exception:
+                logger.exception('Could not top up the printer queue on '
+                                 '%s:%s.', self.host, self.port)
+            finally:
+                connection.close()
+
+
+def start_queue(origin_input: int, printer_queue: PrinterQueue):
+    """
+    Starts a printer queue for a session, stopping any queue that was
+    running for the same origin input.
+    """
+    stop_queue(origin_input)
+    printer_queue.start()
+    with _queues_lock:
+        _queues[int(origin_input)] = printer_queue
+
+
+def get_queue(origin_input: int) -> PrinterQueue:
+    return _queues.get(int(origin_input))
+
+
+def stop_queue(origin_input: int) -> list:
+    """
+    Stops the printer queue for an origin input if there is one.
+    :return: The serial numbers that were sent but never printed.
+    """
+    with _queues_lock:
+        printer_queue = _queues.pop(int(origin_input), None)
+    if printer_queue:
+        return printer_queue.stop()
+    return []
+
+
+def pause_queue(origin_input: int) -> list:
+    """
+    Stops the printer queue for an origin input, if there is one, but
+    keeps it so that it can be resumed.  Nothing is left in the printer
+    queue to print while the session is paused.
+    :return: The serial numbers that were sent but never printed.
+    """
+    printer_queue = get_queue(origin_input)
+    if printer_queue and printer_queue.running:
+        return printer_queue.stop()
+    return []
+
+
+def resume_queue(origin_input: int):
+    """
+    Fills and restarts a printer queue stopped by pause_queue.
+    """
+    printer_queue = get_queue(origin_input)
+    if printer_queue and not printer_queue.running:
+        printer_queue.start()
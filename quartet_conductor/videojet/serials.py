@@ -0,0 +1,307 @@
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+# Copyright 2020 SerialLab Corp.  All rights reserved.
+import threading
+from collections import deque
+from logging import getLogger
+
+from django.conf import settings
+from django.db import connection
+from rest_framework.exceptions import NotFound
+from serialbox.discovery import get_generator
+
+from quartet_conductor import settings as conductor_settings
+
+logger = getLogger(__name__)
+
+_buffers_lock = threading.Lock()
+_buffers = {}
+
+
+class dummy_request:
+    """
+    Stands in for the HTTP request serialbox expects when allocating
+    numbers.
+    """
+
+    def get_host(self):
+        return 'CONDUCTOR'
+
+
+class GeneratorCache:
+    """
+    Caches the serialbox generator for each serial identifier along with
+    the machine name of the pool that was actually resolved- either the
+    serial identifier itself or DEFAULT if the identifier has no pool and
+    USE_DEFAULT_RANGE is enabled.  The cache is invalidated whenever a
+    serialbox Pool is saved or deleted (see quartet_conductor.signals).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generators = {}
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, serial_identifier: str):
+        """
+        Returns the pool machine name and generator for a serial
+        identifier.
+        :param serial_identifier: The machine name of the pool to use.
+        :return: A tuple of pool machine name and generator.
+        """
+        ret = self.generators.get(serial_identifier)
+        if ret is not None:
+            self.hits += 1
+            return ret
+        self.misses += 1
+        generation = self.generation
+        ret = self._resolve(serial_identifier)
+        with self.lock:
+            # don't store a resolution that raced with an invalidation
+            if generation == self.generation:
+                self.generators[serial_identifier] = ret
+        return ret
+
+    def _resolve(self, serial_identifier: str):
+        try:
+            generator = get_generator(serial_identifier)
+        except NotFound as e:
+            logger.info(e)
+            if getattr(settings, 'USE_DEFAULT_RANGE', True):
+                serial_identifier = 'DEFAULT'
+                generator = get_generator(serial_identifier)
+            else:
+                raise
+        return serial_identifier, generator
+
+    def invalidate(self, *args, **kwargs):
+        """
+        Clears the cache.  The signature allows this to be used directly
+        as a signal receiver.
+        """
+        with self.lock:
+            self.generation += 1
+            self.generators = {}
+
+    def stats(self) -> dict:
+        """
+        :return: The cache hits, misses, hit rate and number of entries.
+        """
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'size': len(self.generators)
+        }
+
+
+generator_cache = GeneratorCache()
+
+
+def allocate_serial_numbers(serial_identifier: str, count: int = 1) -> list:
+    """
+    Calls serialbox and uses the serial_identifier as a machine name
+    to retrieve serial numbers.  If USE_DEFAULT_RANGE is defined as
+    True in settings (default) then if the pool can not be found, the
+    pool with the machine name DEFAULT will be used.  The generator
+    resolution (and the fallback decision) is cached.
+    :param serial_identifier: The machine name of the pool to use.
+    :param count: The number of serial numbers to allocate.
+    :return: A list of serial numbers.
+    """
+    machine_name, generator = generator_cache.get(serial_identifier)
+    response = generator.get_response(dummy_request(), count,
+                                      machine_name)
+    return expand_number_list(response)
+
+
+def expand_number_list(response) -> list:
+    """
+    Returns every serial number in a serialbox response.  Sequential
+    regions only return the first and last number of the block; random and
+    list based regions return each number.
+    :param response: A serialbox Response.
+    :return: A list of serial numbers.
+    """
+    numbers = response.number_list
+    if response.type == 'sequential' and numbers:
+        return list(range(int(numbers[0]), int(numbers[-1]) + 1))
+    return list(numbers)
+
+
+def format_command(printer_command: str, serial_number_field: str,
+                   serial_number) -> bytes:
+    """
+    Formats the carriage return terminated printer command that sends a
+    serial number to a label field.
+    :param printer_command: The command with placeholders for the field
+        ({0}) and the serial number ({1}), for example `JDA|{0}={1}|`.
+    :param serial_number_field: The label field.
+    :param serial_number: The serial number.
+    :return: The encoded command.
+    """
+    return (printer_command.format(serial_number_field, serial_number) +
+            '\r').encode('ascii')
+
+
+class SerialNumberBuffer:
+    """
+    Holds a block of pre-allocated serial numbers for a serialbox pool
+    along with the ready-to-send printer command for each number.  When
+    the number of buffered serials drops below the low watermark a
+    background thread allocates the next block so that the print path only
+    ever has to pop a value off of the buffer.
+    """
+
+    def __init__(self, serial_identifier: str, serial_number_field: str,
+                 printer_command: str, block_size: int,
+                 low_watermark: int):
+        self.serial_identifier = serial_identifier
+        self.serial_number_field = serial_number_field
+        self.printer_command = printer_command
+        self.block_size = block_size
+        self.low_watermark = low_watermark
+        self.queue = deque()
+        self.fill_lock = threading.Lock()
+        self.refill_event = threading.Event()
+        self.running = True
+        self.worker = threading.Thread(
+            target=self._run,
+            name='serial-buffer-%s' % serial_identifier,
+            daemon=True
+        )
+        self.worker.start()
+
+    def format_command(self, serial_number: str) -> bytes:
+        """
+        Formats the printer command for a serial number.
+        """
+        return format_command(self.printer_command, self.serial_number_field,
+                              serial_number)
+
+    def pop(self):
+        """
+        Returns the next serial number and its printer command.  If the
+        buffer is empty, a block is allocated in the calling thread.
+        :return: A tuple of serial number and command bytes.
+        """
+        while True:
+            try:
+                ret = self.queue.popleft()
+                break
+            except IndexError:
+                self.fill()
+        if len(self.queue) < self.low_watermark:
+            self.refill_event.set()
+        return ret
+
+    def fill(self):
+        """
+        Allocates the next block of serial numbers from serialbox unless
+        another thread has already refilled the buffer.
+        """
+        with self.fill_lock:
+            if len(self.queue) >= self.low_watermark and len(self.queue):
+                return
+            numbers = allocate_serial_numbers(self.serial_identifier,
+                                              self.block_size)
+            self.queue.extend(
+                (number, self.format_command(number)) for number in numbers
+            )
+            logger.debug('Buffered %s serial numbers for %s.',
+                         len(numbers), self.serial_identifier)
+
+    def release(self) -> list:
+        """
+        Stops the refill thread and empties the buffer.  Serialbox can not
+        take numbers back, so any unused numbers are logged.
+        :return: The list of unused serial numbers.
+        """
+        self.running = False
+        self.refill_event.set()
+        with self.fill_lock:
+            unused = [number for number, command in self.queue]
+            self.queue.clear()
+        if unused:
+            logger.warning('Releasing %s unused serial numbers for %s: %s',
+                           len(unused), self.serial_identifier,
+                           ','.join(str(n) for n in unused))
+        return unused
+
+    def _run(self):
+        while True:
+            self.refill_event.wait()
+            self.refill_event.clear()
+            if not self.running:
+                break
+            try:
+                self.fill()
+            except Exception:
+                logger.exception('Could not refill the serial number buffer '
+                                 'for %s.', self.serial_identifier)
+            finally:
+                # the worker thread has its own database connection
+                connection.close()
+
+
+def get_buffer(serial_identifier: str, serial_number_field: str,
+               printer_command: str) -> SerialNumberBuffer:
+    """
+    Returns the serial number buffer for the pool and printer command,
+    creating it if necessary.
+    """
+    key = (serial_identifier, serial_number_field, printer_command)
+    buffer = _buffers.get(key)
+    if buffer is None:
+        with _buffers_lock:
+            buffer = _buffers.get(key)
+            if buffer is None:
+                block_size = conductor_settings.SERIAL_BUFFER_SIZE
+                low_watermark = conductor_settings.SERIAL_BUFFER_LOW_WATERMARK
+                if low_watermark is None:
+                    low_watermark = block_size // 4
+                buffer = SerialNumberBuffer(serial_identifier,
+                                            serial_number_field,
+                                            printer_command,
+                                            block_size,
+                                            low_watermark)
+                _buffers[key] = buffer
+    return buffer
+
+
+def get_buffers(serial_identifier: str) -> list:
+    """
+    Returns the buffers for a serial identifier.
+    """
+    return [buffer for key, buffer in list(_buffers.items())
+            if key[0] == serial_identifier]
+
+
+def release_buffers(serial_identifier: str = None) -> list:
+    """
+    Releases the buffers for a serial identifier or all buffers if no
+    serial identifier is supplied.
+    :return: The list of unused serial numbers.
+    """
+    with _buffers_lock:
+        keys = [key for key in _buffers
+                if serial_identifier is None or key[0] == serial_identifier]
+        buffers = [_buffers.pop(key) for key in keys]
+    unused = []
+    for buffer in buffers:
+        unused += buffer.release()
+    return unused
@@ -14,22 +14,22 @@
 # Copyright 2020 SerialLab Corp.  All rights reserved.
 from enum import Enum
 from logging import getLogger
-from telnetlib import Telnet
 
 from quartet_conductor.session import SessionNotActiveError
-from revpy_dio.outputs import set_output
 from django.conf import settings
 
 from quartet_capture import models
 from quartet_capture.rules import RuleContext
-from quartet_capture.rules import Step
+from quartet_conductor.rules import Step
 from quartet_conductor import session as session_control
 from quartet_conductor import settings as conductor_settings
+from quartet_conductor import dio
+from quartet_conductor import metrics
+from quartet_conductor import traces
 from quartet_conductor.steps import TelnetStep
-from serialbox.discovery import get_generator
-from serialbox.models import Pool
-from serialbox.response import Response
-from rest_framework.exceptions import NotFound
+from quartet_conductor.videojet import serials
+from quartet_conductor.videojet import protocol
+from quartet_conductor.videojet import queue as printer_queue
 import time
 
 logger = getLogger(__name__)
@@ -72,7 +72,46 @@ class ContextFields(Enum):
     IO_PORT = 'IO_PORT'
 
 
-class JobFieldsStep(TelnetStep):
+class VideojetStep(TelnetStep):
+    """
+    Base class for steps that talk to a Videojet printer.  Commands are
+    sent over the pooled telnet connection unless the VIDEOJET_CLIENT
+    setting is `asyncio`, in which case the shared asyncio protocol client
+    is used.
+    """
+
+    def send_command(self, command: bytes) -> bytes:
+        """
+        Sends a command to the printer and returns the reply.
+        :param command: The carriage return terminated command.
+        :return: The reply from the printer.
+        """
+        if conductor_settings.VIDEOJET_CLIENT == 'asyncio':
+            try:
+                return protocol.get_client(
+                    self.host, self.port, self.timeout
+                ).request(command).raw
+            except protocol.ProtocolError as e:
+                raise PrinterError(str(e))
+        return self.get_connection().send(command, '\r'.encode('ascii'))
+
+
+def parse_job_fields(reply: bytes) -> dict:
+    """
+    Parses the job fields out of a printer's JDL reply, for example
+    `JDL|LOT=ABC|EXPIRY=210101|`.
+    :param reply: The reply to a GJD request.
+    :return: A dictionary of field name to value.
+    """
+    ret = {}
+    for item in reply.decode('ascii').split('|'):
+        if '=' in item:
+            name, val = item.split("=")
+            ret[name] = val
+    return ret
+
+
+class JobFieldsStep(VideojetStep):
     """
     Will issue a telnet command and then read the reply and return
     to the channel as the data.
@@ -91,11 +130,11 @@ class JobFieldsStep(TelnetStep):
             'Port', '777',
             'The text communications port that was enabled on the printer.'
         ))
-        self.error_output = int(self.get_or_create_parameter(
+        self.error_output = self.get_or_create_parameter(
             'Error Output Port', '2',
             'The output to raise high when the printer can not be reached, '
             'default is 2.'
-        ))
+        )
         error_output_on = self.get_or_create_parameter(
             'Error Out On', 'False', 'Whether or not to set the error output '
                                      'hot or turn it off.  Default is turn '
@@ -104,31 +143,22 @@ class JobFieldsStep(TelnetStep):
         self.error_output_on = error_output_on in ['True', 'true']
 
     def execute(self, data, rule_context: RuleContext):
-        with Telnet(self.host, self.port, timeout=self.timeout) as client:
-            rule_context.context[ContextFields.IO_PORT.value] = data
-            self.info('Getting data from host %s on port %s...',
-                      self.host, self.port)
-            command = 'GJD\r'.encode('ascii')
-            client.write(command)  # only output matches
-            ret = client.read_until('\r'.encode('ascii'))
-            client.close()
-            self.info('Data retrieved: %s', ret)
-            print(ret)
-            if 'JDL' not in ret.decode('utf-8'):
-                raise PrinterError('The printer did not return the expected '
-                                   'JDL reply.  Please check the printer.')
-            ret = ret.decode('ascii').split('|')
-            dict = {}
-            for item in ret:
-                if '=' in item:
-                    name, val = item.split("=")
-                    dict[name] = val
-            self.info('Fields: %s', dict)
-            rule_context.context[ContextFields.JOB_FIELDS.value] = dict
-            rule_context.context[ContextFields.PRINTER_HOST.value] = self.host
-            rule_context.context[ContextFields.PRINTER_PORT.value] = self.port
-            logger.info('Rule Context: %s', rule_context.context)
-            self.info('%s: %s', __name__, rule_context.context)
+        rule_context.context[ContextFields.IO_PORT.value] = data
+        self.info('Getting data from host %s on port %s...',
+                  self.host, self.port)
+        command = 'GJD\r'.encode('ascii')
+        ret = self.send_command(command)
+        self.info('Data retrieved: %s', ret)
+        if 'JDL' not in ret.decode('utf-8'):
+            raise PrinterError('The printer did not return the expected '
+                               'JDL reply.  Please check the printer.')
+        fields = parse_job_fields(ret)
+        self.info('Fields: %s', fields)
+        rule_context.context[ContextFields.JOB_FIELDS.value] = fields
+        rule_context.context[ContextFields.PRINTER_HOST.value] = self.host
+        rule_context.context[ContextFields.PRINTER_PORT.value] = self.port
+        logger.info('Rule Context: %s', rule_context.context)
+        self.info('%s: %s', __name__, rule_context.context)
 
     @property
     def declared_parameters(self):
@@ -226,7 +256,8 @@ class StartSessionStep(Step):
             self.expiry_field_key]
 
     def execute(self, data, rule_context: RuleContext):
-        session_val = int(rule_context.context[ContextFields.IO_PORT.value])
+        session_val = dio.get_input_key(
+            rule_context.context[ContextFields.IO_PORT.value])
         self.info('Creating a session for input %s', session_val)
         lot, expiry = self.get_lot_expiry(rule_context)
         session_control.start_session(
@@ -250,7 +281,7 @@ class StartSessionStep(Step):
         self.info('On failured called.')
 
 
-class PrintLabelStep(TelnetStep):
+class PrintLabelStep(VideojetStep):
     """
     Sends a serialnumber from serialbox to the label's serial_number field
     and issues a print command.  The carriage return is appended to the
@@ -286,46 +317,59 @@ class PrintLabelStep(TelnetStep):
         self.error_output_on = error_output_on in ['True', 'true']
 
     def execute(self, data, rule_context: RuleContext):
-        with Telnet(self.host, self.port, timeout=self.timeout) as client:
-            # get the serial identifier from the context
-            job_fields = rule_context.context.get(
-                ContextFields.JOB_FIELDS.value)
-            if not job_fields:
-                somehow_ = 'There were no job fields in the context ' \
-                           'this typically means the session was ' \
-                           'not started properly or was reset ' \
-                           'somehow.'
-                self.error(somehow_)
-                raise NoJobFieldsError(somehow_)
-            serial_identifier = rule_context.context.get(
-                ContextFields.SERIAL_IDENTIFIER.value)
-            if not serial_identifier:
-                self.error('Could not find a serial identifier in the contex.'
-                           ' This is necessary to print a label.  Please ensure '
-                           'your label has a GTIN field or that your '
-                           'GetSerialIdentifier step is configured to pull '
-                           'the appropriate field from the printer job data.')
-                raise NoJobFieldsError('Could not find the job field to use '
-                                       'for the serial identifier in the '
-                                       'current job fields using key %s' %
-                                       ContextFields.SERIAL_IDENTIFIER.value)
-            # pull a number from serialbox using that identifier
-            serial_number = self.get_serial_number(serial_identifier)
-            # create the command
-            command = self.printer_command.format(
+        # get the serial identifier from the context
+        job_fields = rule_context.context.get(
+            ContextFields.JOB_FIELDS.value)
+        if not job_fields:
+            somehow_ = 'There were no job fields in the context ' \
+                       'this typically means the session was ' \
+                       'not started properly or was reset ' \
+                       'somehow.'
+            self.error(somehow_)
+            raise NoJobFieldsError(somehow_)
+        serial_identifier = rule_context.context.get(
+            ContextFields.SERIAL_IDENTIFIER.value)
+        if not serial_identifier:
+            self.error('Could not find a serial identifier in the contex.'
+                       ' This is necessary to print a label.  Please ensure '
+                       'your label has a GTIN field or that your '
+                       'GetSerialIdentifier step is configured to pull '
+                       'the appropriate field from the printer job data.')
+            raise NoJobFieldsError('Could not find the job field to use '
+                                   'for the serial identifier in the '
+                                   'current job fields using key %s' %
+                                   ContextFields.SERIAL_IDENTIFIER.value)
+        # pull a number from serialbox using that identifier
+        with metrics.timer('serial'):
+            serial_number, command = self.get_serial_command(
+                serial_identifier)
+        traces.annotate(serial_number=serial_number)
+        # send to the printer and then print
+        ret = self.send_command(command)
+        self.info('Data retrieved: %s', ret)
+        if 'ACK' not in ret.decode('utf-8'):
+            raise PrinterError('The printer did not return the expected '
+                               'ACK reply.  Please check the printer.')
+        self.info('sent %s command to the printer', command)
+
+    def get_serial_command(self, serial_identifier):
+        """
+        Returns the next serial number along with the encoded printer
+        command for it.  If SERIAL_BUFFER_SIZE is greater than zero, both
+        are popped off of a pre-filled buffer for the pool, otherwise
+        serialbox is called directly.
+        :param serial_identifier: The machine name of the pool to use.
+        :return: A tuple of serial number and command bytes.
+        """
+        if conductor_settings.SERIAL_BUFFER_SIZE > 0:
+            return serials.get_buffer(
+                serial_identifier,
                 self.serial_number_field,
-                serial_number
-            ) + '\r'
-            command = command.encode('ascii')
-            # send to the printer and then print
-            client.write(command)
-            ret = client.read_until('\r'.encode('ascii'))
-            self.info('Data retrieved: %s', ret)
-            if 'ACK' not in ret.decode('utf-8'):
-                raise PrinterError('The printer did not return the expected '
-                                   'ACK reply.  Please check the printer.')
-            client.close()
-            self.info('sent %s command to the printer', command)
+                self.printer_command
+            ).pop()
+        serial_number = self.get_serial_number(serial_identifier)
+        return serial_number, serials.format_command(
+            self.printer_command, self.serial_number_field, serial_number)
 
     def get_serial_number(self, serial_identifier):
         """
@@ -336,24 +380,7 @@ class PrintLabelStep(TelnetStep):
         :param serial_identifier: The machine name of the pool to use.
         :return: A serial number.
         """
-
-        class dummy_request:
-            def get_host(self):
-                return 'CONDUCTOR'
-
-        try:
-            generator = get_generator(serial_identifier)
-        except NotFound as e:
-            print(e)
-            if getattr(settings, 'USE_DEFAULT_RANGE', True):
-                serial_identifier = 'DEFAULT'
-                generator = get_generator(serial_identifier)
-            else:
-                raise
-        response = generator.get_response(dummy_request(), 1,
-                                          serial_identifier)
-        serial_number = response.number_list[0]
-        return serial_number
+        return serials.allocate_serial_numbers(serial_identifier, 1)[0]
 
     @property
     def declared_parameters(self):
@@ -367,3 +394,158 @@ class PrintLabelStep(TelnetStep):
                                  'JDA|{1}={0}|\r - make sure to include a ' \
                                  'carriage return at the end of each command.'
         return ret
+
+
+class StartPrintQueueStep(Step):
+    """
+    Starts queued print mode for a session.  Instead of sending a serial
+    number to the printer on every print trigger, a window of upcoming
+    serial numbers is loaded into the printer's external data queue and
+    topped up as the printer reports that it has consumed them.  This step
+    belongs in the session start rule after the StartSessionStep.
+
+    The queue commands differ between printer models and firmware
+    versions, so each of them can be configured via step parameters.
+    """
+
+    def __init__(self, db_task: models.Task, **kwargs):
+        super().__init__(db_task, **kwargs)
+        self.timeout = getattr(settings, 'TELNET_TIMEOUT', 3)
+        self.serial_number_field = self.get_or_create_parameter(
+            'Serial Number Field',
+            'SERIAL_NUMBER',
+            self.declared_parameters.get('Serial Number Field')
+        )
+        self.queue_command = self.get_or_create_parameter(
+            'Queue Command',
+            'QAD|{0}={1}|',
+            self.declared_parameters.get('Queue Command')
+        )
+        self.depth_command = self.get_or_create_parameter(
+            'Queue Depth Command',
+            'GQD',
+            self.declared_parameters.get('Queue Depth Command')
+        )
+        self.depth_reply = self.get_or_create_parameter(
+            'Queue Depth Reply',
+            'QDR',
+            self.declared_parameters.get('Queue Depth Reply')
+        )
+        self.depth_field = self.get_or_create_parameter(
+            'Queue Depth Field',
+            'COUNT',
+            self.declared_parameters.get('Queue Depth Field')
+        )
+        self.clear_command = self.get_or_create_parameter(
+            'Clear Queue Command',
+            'QCL',
+            self.declared_parameters.get('Clear Queue Command')
+        )
+        self.capacity = int(self.get_or_create_parameter(
+            'Queue Size',
+            '50',
+            self.declared_parameters.get('Queue Size')
+        ))
+        self.poll_interval = float(self.get_or_create_parameter(
+            'Poll Interval',
+            '1',
+            self.declared_parameters.get('Poll Interval')
+        ))
+
+    def execute(self, data, rule_context: RuleContext):
+        context = rule_context.context
+        serial_identifier = context.get(ContextFields.SERIAL_IDENTIFIER.value)
+        if not serial_identifier:
+            raise NoJobFieldsError('Could not find a serial identifier in '
+                                   'the context.  Make sure the '
+                                   'GetSerialIdentifierStep runs before '
+                                   'this step.')
+        host = context.get(ContextFields.PRINTER_HOST.value)
+        port = context.get(ContextFields.PRINTER_PORT.value)
+        if not host or not port:
+            raise NoJobFieldsError('Could not find the printer host and port '
+                                   'in the context.  Make sure the '
+                                   'JobFieldsStep runs before this step.')
+        origin_input = dio.get_input_key(context[ContextFields.IO_PORT.value])
+        self.info('Starting the printer queue for input %s with %s '
+                  'records.', origin_input, self.capacity)
+        try:
+            printer_queue.start_queue(origin_input, printer_queue.PrinterQueue(
+                host,
+                port,
+                serial_identifier,
+                serial_number_field=self.serial_number_field,
+                queue_command=self.queue_command,
+                depth_command=self.depth_command,
+                depth_reply=self.depth_reply,
+                depth_field=self.depth_field,
+                clear_command=self.clear_command,
+                capacity=self.capacity,
+                poll_interval=self.poll_interval,
+                timeout=self.timeout
+            ))
+        except protocol.ProtocolError as e:
+            raise PrinterError(str(e))
+        return data
+
+    @property
+    def declared_parameters(self):
+        ret = {}
+        ret['Serial Number Field'] = 'The name of the field in the label ' \
+                                     'where the serial number value will ' \
+                                     'be sent to.'
+        ret['Queue Command'] = 'The command that adds a record to the ' \
+                               'printer data queue.  {0} is the field name ' \
+                               'and {1} the serial number.'
+        ret['Queue Depth Command'] = 'The command that asks the printer ' \
+                                     'how many queued records are left.'
+        ret['Queue Depth Reply'] = 'The reply command to the queue depth ' \
+                                   'command.'
+        ret['Queue Depth Field'] = 'The field in the queue depth reply ' \
+                                   'that contains the number of records.'
+        ret['Clear Queue Command'] = 'The command that clears the printer ' \
+                                     'data queue.'
+        ret['Queue Size'] = 'The maximum number of records to keep in the ' \
+                            'printer queue.  Default is 50.'
+        ret['Poll Interval'] = 'How often, in seconds, to check the queue ' \
+                               'and top it up.  Set to 0 to only top up ' \
+                               'via the QueuedPrintLabelStep.'
+        return ret
+
+    def on_failure(self):
+        pass
+
+
+class QueuedPrintLabelStep(Step):
+    """
+    Used in place of the PrintLabelStep when the session was started with
+    the StartPrintQueueStep.  Rather than sending a serial number, the
+    printer queue is topped up to account for the label that was just
+    printed.
+    """
+
+    def execute(self, data, rule_context: RuleContext):
+        address = rule_context.context.get(ContextFields.IO_PORT.value)
+        origin_input = dio.get_input_key(address) \
+            if address is not None else None
+        queue = printer_queue.get_queue(origin_input) \
+            if origin_input is not None else None
+        if not queue:
+            raise PrinterError('There is no printer queue running for '
+                               'input %s.  Make sure the session was '
+                               'started with a StartPrintQueueStep.'
+                               % origin_input)
+        try:
+            sent = queue.top_up()
+        except protocol.ProtocolError as e:
+            raise PrinterError(str(e))
+        self.info('Sent %s serial numbers to the printer queue, %s '
+                  'printed so far.', sent, queue.printed)
+        return data
+
+    @property
+    def declared_parameters(self):
+        return {}
+
+    def on_failure(self):
+        pass
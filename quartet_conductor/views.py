@@ -1,10 +1,20 @@
+import re
+
 from django.shortcuts import render
-from django.http import HttpResponseRedirect, HttpRequest
+from django.http import HttpResponseRedirect, HttpRequest, HttpResponse, \
+    JsonResponse
 from django.views import generic
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 
 from quartet_conductor.forms import SessionForm, InputMapForm
 from quartet_conductor import session
 from quartet_conductor import models
+from quartet_conductor import control
+from quartet_conductor import dio
+from quartet_conductor import metrics
+from quartet_conductor import traces
 from quartet_conductor import settings as conductor_settings
 
 from logging import getLogger
@@ -13,6 +23,9 @@ logger = getLogger(__name__)
 
 
 def start_session(request: HttpRequest):
+    if request.method == 'POST' and \
+            request.POST.get('action') in ('pause', 'resume'):
+        return change_session_state(request)
     if request.method == 'POST':
         try:
             form = SessionForm(request.POST)
@@ -28,9 +41,25 @@ def start_session(request: HttpRequest):
     return render(request, 'session.html', {'form': form})
 
 
+def change_session_state(request: HttpRequest):
+    lot = request.POST.get('lot')
+    try:
+        if request.POST.get('action') == 'pause':
+            session.pause_session(lot)
+        else:
+            session.resume_session(lot)
+    except (session.SessionNotActiveError, session.SessionStateError):
+        logger.exception('Could not change the state of session %s.', lot)
+        return HttpResponseRedirect('/conductor/session/')
+    return HttpResponseRedirect('/conductor/running/?lot=%s' % lot)
+
+
 def session_info(request: HttpRequest):
     if request.method == 'GET':
-        current_session = session.get_session()
+        lot = request.GET.get('lot')
+        sessions = [s for s in models.Session.get_sessions()
+                    if not lot or s.lot == lot]
+        current_session = sessions[0] if sessions else None
         if not current_session:
             return HttpResponseRedirect('/conductor/session/')
         else:
@@ -49,6 +78,91 @@ def input_map_detail(request: HttpRequest, id: int=None):
                       )
 
 
+def metrics_view(request: HttpRequest):
+    """
+    Returns the print path latency histograms and error counts of all of
+    the conductor processes in the Prometheus text format.
+    """
+    return HttpResponse(metrics.metrics.render(),
+                        content_type='text/plain; version=0.0.4')
+
+
+def traces_view(request: HttpRequest):
+    """
+    Returns the most recent per-trigger traces as JSON.  The `last`,
+    `input` (a point or `module:point` address), `lot`, `failed` and
+    `slower_than` (milliseconds) query parameters filter the traces.
+    """
+    params = request.GET
+    slower_than = params.get('slower_than')
+    input_key = None
+    if params.get('input'):
+        try:
+            input_key = dio.get_input_key(params['input'])
+        except dio.InvalidAddressError as e:
+            return JsonResponse({'detail': str(e)}, status=400)
+    found = traces.get_traces(
+        last=int(params.get('last', 20)),
+        input=input_key,
+        lot=params.get('lot'),
+        failed=params.get('failed') in ('1', 'true', 'True'),
+        slower_than=float(slower_than) / 1000 if slower_than else None
+    )
+    return JsonResponse([t.to_dict() for t in found], safe=False)
+
+
+# the control commands that can be posted to the control view and the
+# types of the parameters each may be sent
+CONTROL_COMMANDS = {
+    'profile': {'seconds': float, 'triggers': int, 'interval_ms': float},
+    'memory_snapshot': {'limit': int, 'frames': int, 'keep': int},
+    'memory_diff': {'first': int, 'second': int, 'limit': int},
+    'memory_stop': {},
+    'record_start': {'name': str},
+    'record_stop': {},
+}
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAdminUser])
+def control_view(request, command: str):
+    """
+    POST asks the running conductor processes to run a control command,
+    for example `profile`, with the posted values as its parameters and
+    returns the request id.  Only the commands and parameters in
+    CONTROL_COMMANDS, plus `pid`, are accepted.  GET with a `request`
+    query parameter returns the results the processes have reported for
+    that request.  Both require a staff user.
+    """
+    if command not in CONTROL_COMMANDS:
+        return Response({'detail': '%s is not a control command.' %
+                         command}, status=404)
+    if request.method == 'POST':
+        allowed = dict(CONTROL_COMMANDS[command], pid=int)
+        params = {}
+        for name, value in request.data.items():
+            if name in ('csrfmiddlewaretoken',):
+                continue
+            if name not in allowed:
+                return Response({'detail': '%s is not a parameter of %s.' %
+                                 (name, command)}, status=400)
+            try:
+                params[name] = allowed[name](value)
+            except (TypeError, ValueError):
+                return Response({'detail': '%s is not a valid %s.' %
+                                 (value, name)}, status=400)
+        pid = params.pop('pid', None)
+        request_id = control.request(command, pid=pid, **params)
+        return Response({'request': request_id}, status=202)
+    request_id = request.GET.get('request', '')
+    # request ids are uuid hex strings, anything else could match the
+    # results of other requests
+    if not re.fullmatch('[0-9a-f]{32}', request_id):
+        return Response({'detail': 'The request parameter is required.'},
+                        status=400)
+    return Response(control.get_results(request_id))
+
+
 class InputMapView(generic.ListView):
     model = models.InputMap
     template_name = 'input_maps.html'
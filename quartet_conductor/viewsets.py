@@ -13,9 +13,13 @@
 #
 # Copyright 2020 SerialLab Corp.  All rights reserved.
 
-from rest_framework.viewsets import ModelViewSet
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from quartet_conductor import models
 from quartet_conductor import serializers
+from quartet_conductor import session
 
 class InputModelViewSet(ModelViewSet):
     '''
@@ -23,3 +27,31 @@ class InputModelViewSet(ModelViewSet):
     '''
     queryset = models.InputMap.objects.all()
     serializer_class = serializers.InputMapSerializer
+
+
+class SessionViewSet(ReadOnlyModelViewSet):
+    '''
+    Lists sessions by lot and pauses and resumes running sessions.
+    '''
+    queryset = models.Session.objects.all()
+    serializer_class = serializers.SessionSerializer
+    lookup_field = 'lot'
+
+    @action(detail=True, methods=['post'])
+    def pause(self, request, lot=None):
+        return self._change_state(session.pause_session, lot)
+
+    @action(detail=True, methods=['post'])
+    def resume(self, request, lot=None):
+        return self._change_state(session.resume_session, lot)
+
+    def _change_state(self, func, lot):
+        try:
+            cur_session = func(lot)
+        except session.SessionNotActiveError as e:
+            return Response({'detail': str(e)},
+                            status=status.HTTP_404_NOT_FOUND)
+        except session.SessionStateError as e:
+            return Response({'detail': str(e)},
+                            status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(cur_session).data)
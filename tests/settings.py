@@ -26,6 +26,9 @@ INSTALLED_APPS = [
     'material',
     'quartet_capture',
     'quartet_templates',
+    'serialbox',
+    'quartet_epcis',
+    'quartet_output',
     "quartet_conductor",
 ]
 
@@ -0,0 +1,41 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+
+from django.test import TestCase
+
+from quartet_conductor import benchmarks, traces
+from quartet_conductor import settings as conductor_settings
+
+
+class TestPrintPathBenchmark(TestCase):
+
+    def test_run_benchmark(self):
+        results = benchmarks.run_benchmark(labels=10, warmup=2)
+        self.assertEqual(results['printed'], 12)
+        self.assertEqual(results['errors'], {})
+        self.assertGreater(results['labels_per_second'], 0)
+        self.assertGreater(results['queries_per_label'], 0)
+        self.assertLessEqual(results['latency_ms']['p50'],
+                             results['latency_ms']['p99'])
+
+    def test_temporary_state_dir(self):
+        state_dir = conductor_settings.CONDUCTOR_STATE_DIR
+        ring = traces.get_ring()
+        with benchmarks.temporary_state_dir() as directory:
+            self.assertEqual(conductor_settings.CONDUCTOR_STATE_DIR,
+                             directory)
+            results = benchmarks.run_benchmark(labels=2, warmup=0)
+            self.assertEqual(results['printed'], 2)
+            self.assertTrue(os.path.exists(os.path.join(
+                directory, 'traces', '%s.ring' % os.getpid())))
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual(conductor_settings.CONDUCTOR_STATE_DIR, state_dir)
+        self.assertIs(traces.get_ring(), ring)
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmarks.percentile(values, 50), 50)
+        self.assertEqual(benchmarks.percentile(values, 99), 99)
+        self.assertEqual(benchmarks.percentile([], 50), 0.0)
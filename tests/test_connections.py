@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import select
+import socketserver
+import threading
+
+from django.test import TestCase
+
+from quartet_conductor.connections import ConnectionPool
+
+
+class EchoHandler(socketserver.StreamRequestHandler):
+    """
+    Answers every carriage return terminated line with an ACK.
+    """
+
+    def handle(self):
+        self.server.connection_count += 1
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            self.server.lines.append(line)
+            if self.server.drop_reply:
+                break
+            self.wfile.write(b'ACK\r')
+            if self.server.hang_up:
+                break
+
+
+class EchoServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), EchoHandler)
+        self.connection_count = 0
+        self.hang_up = False
+        self.drop_reply = False
+        self.lines = []
+
+
+class TestConnectionPool(TestCase):
+
+    def setUp(self) -> None:
+        self.server = EchoServer()
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever,
+                         daemon=True).start()
+        self.pool = ConnectionPool()
+
+    def test_connection_reused(self):
+        connection = self.pool.get_connection('127.0.0.1', self.port)
+        for i in range(5):
+            ret = connection.send(b'JDA|SN=%d|\n' % i, b'\r')
+            self.assertEqual(ret, b'ACK\r')
+        self.assertEqual(self.server.connection_count, 1)
+        self.assertEqual(self.pool.stats()['misses'], 1)
+        self.assertEqual(self.pool.stats()['hits'], 4)
+        self.assertIs(connection,
+                      self.pool.get_connection('127.0.0.1', self.port))
+
+    def test_reconnect(self):
+        self.server.hang_up = True
+        connection = self.pool.get_connection('127.0.0.1', self.port)
+        self.assertEqual(connection.send(b'GJD\n', b'\r'), b'ACK\r')
+        # wait for the hang up to reach the client
+        select.select([connection.client.sock], [], [], 1)
+        self.assertEqual(connection.send(b'GJD\n', b'\r'), b'ACK\r')
+        self.assertEqual(self.server.connection_count, 2)
+        self.assertEqual(self.pool.stats()['reconnects'], 1)
+
+    def test_no_resend_after_write(self):
+        # the host hangs up after the command was written, the command
+        # must not be sent again
+        self.server.drop_reply = True
+        connection = self.pool.get_connection('127.0.0.1', self.port)
+        with self.assertRaises(EOFError):
+            connection.send(b'JDA|SN=1|\n', b'\r')
+        self.assertEqual(self.server.lines, [b'JDA|SN=1|\n'])
+        self.assertFalse(connection.connected)
+        self.assertEqual(self.pool.stats()['reconnects'], 0)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.shutdown()
+        self.server.server_close()
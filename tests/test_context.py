@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from quartet_conductor.context import LayeredContext
+
+
+class TestLayeredContext(TestCase):
+
+    def test_layers(self):
+        session = {'JOB_FIELDS': {'LOT': 'W6G'}, 'IO_PORT': b'1'}
+        context = LayeredContext({'RULE_PARAMETERS': {}}, session)
+        self.assertEqual(context['JOB_FIELDS']['LOT'], 'W6G')
+        self.assertEqual(context.get('IO_PORT'), b'1')
+        context['IO_PORT'] = b'2'
+        context['INPUT_NUMBER'] = 2
+        self.assertEqual(context['IO_PORT'], b'2')
+        # the session is never changed
+        self.assertEqual(session['IO_PORT'], b'1')
+        self.assertNotIn('INPUT_NUMBER', session)
+        self.assertIs(context['JOB_FIELDS'], session['JOB_FIELDS'])
+        with self.assertRaises(TypeError):
+            context.session['LOT'] = 'X'
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from django.test import TestCase
+
+from quartet_conductor import dio
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.dio import ProcessImage, Debouncer, CycleStats
+from quartet_conductor.simulators.dio import ProcessImageSimulator
+
+
+class TestProcessImage(TestCase):
+
+    def setUp(self) -> None:
+        fd, self.path = tempfile.mkstemp()
+        os.write(fd, bytes(64))
+        os.close(fd)
+
+    def test_read_word(self):
+        image = ProcessImage(self.path, 64)
+        self.assertEqual(image.read_word(11), 0)
+        with open(self.path, 'r+b') as f:
+            f.seek(11)
+            f.write(bytes([0b00000101, 0b10000000]))
+        self.assertEqual(image.read_word(11), 0b1000000000000101)
+        image.close()
+
+    def tearDown(self):
+        os.remove(self.path)
+
+
+class TestDebouncer(TestCase):
+
+    def test_edges(self):
+        debouncer = Debouncer(16)
+        self.assertEqual(debouncer.update(0b101, 0.0), ([1, 3], []))
+        self.assertEqual(debouncer.update(0b101, 0.1), ([], []))
+        self.assertEqual(debouncer.update(0b100, 0.2), ([], [1]))
+
+    def test_debounce_window(self):
+        debouncer = Debouncer(16, {2: .01})
+        self.assertEqual(debouncer.update(0b10, 0.0), ([], []))
+        # a bounce back low resets the window
+        self.assertEqual(debouncer.update(0b00, 0.005), ([], []))
+        self.assertEqual(debouncer.update(0b10, 0.006), ([], []))
+        self.assertEqual(debouncer.update(0b10, 0.012), ([], []))
+        self.assertEqual(debouncer.update(0b10, 0.017), ([2], []))
+
+
+class TestCycleStats(TestCase):
+
+    def test_jitter(self):
+        stats = CycleStats(.001)
+        for period in (.001, .001, .001):
+            stats.add(period)
+        self.assertAlmostEqual(stats.stats()['jitter'], 0.0)
+        stats.add(.003)
+        self.assertAlmostEqual(stats.stats()['max'], .003)
+        self.assertAlmostEqual(stats.stats()['jitter'], .001)
+
+
+class TestAddresses(TestCase):
+
+    def setUp(self) -> None:
+        self.modules = conductor_settings.DIO_MODULES
+        conductor_settings.DIO_MODULES = ['left', 'right']
+
+    def test_parse_address(self):
+        self.assertEqual(dio.parse_address(b'3'), ('left', 3))
+        self.assertEqual(dio.parse_address('right:3'), ('right', 3))
+        self.assertEqual(dio.format_address('right', 3), 'right:3')
+        self.assertEqual(dio.format_address('left', 3), '3')
+        self.assertEqual(dio.get_input_key('3'), 3)
+        self.assertEqual(dio.get_input_key('right:3'), 19)
+        self.assertEqual(dio.parse_address_list('1, right:2'),
+                         [('left', 1), ('right', 2)])
+
+    def test_invalid_address(self):
+        for address in ('0', '17', 'top:1', 'right:x'):
+            with self.assertRaises(dio.InvalidAddressError):
+                dio.parse_address(address)
+
+    def test_key_address(self):
+        self.assertEqual(dio.key_address(3), '3')
+        self.assertEqual(dio.key_address(16), '16')
+        self.assertEqual(dio.key_address(19), 'right:3')
+        for key in (-1, 0, 33):
+            with self.assertRaises(dio.InvalidAddressError):
+                dio.key_address(key)
+
+    def tearDown(self):
+        conductor_settings.DIO_MODULES = self.modules
+
+
+class TestProcessImageSimulator(TestCase):
+
+    def setUp(self) -> None:
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.backend = conductor_settings.DIO_BACKEND
+        self.simulator = ProcessImageSimulator(self.path, 64,
+                                               {dio.default_module(): 10})
+
+    def test_inputs(self):
+        image = ProcessImage(self.path, 64)
+        self.simulator.set_input(None, 3)
+        self.assertEqual(image.read_word(10), 0b100)
+        self.simulator.play([(0, '1', True), (.01, '3', False)]).join()
+        self.assertEqual(image.read_word(10), 0b1)
+        image.close()
+
+    def test_outputs_recorded(self):
+        conductor_settings.DIO_BACKEND = 'simulator'
+        from quartet_conductor.simulators import dio as simulated_dio
+        simulated_dio._simulator = self.simulator
+        dio.set_output(dio.default_module(), 6, on=True)
+        self.assertTrue(self.simulator.get_output(None, 6))
+        timestamp, module, point, on = self.simulator.outputs[-1]
+        self.assertEqual((module, point, on),
+                         (dio.default_module(), 6, True))
+        simulated_dio._simulator = None
+
+    def tearDown(self):
+        conductor_settings.DIO_BACKEND = self.backend
+        self.simulator.close()
+        os.remove(self.path)
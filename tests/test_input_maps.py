@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+from django.db import IntegrityError, transaction
+from django.test import TestCase
+from quartet_capture.models import Rule
+
+from quartet_conductor import dio
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.input_maps import InputMapCache, input_map_cache
+from quartet_conductor.invalidation import VersionStamp
+from quartet_conductor.models import InputMap
+
+
+class TestVersionStamp(TestCase):
+
+    def test_changed_in_other_instance(self):
+        local = VersionStamp('test')
+        other = VersionStamp('test')
+        other.changed()
+        self.assertFalse(other.changed())
+        value = local.bump()
+        self.assertTrue(other.changed())
+        self.assertFalse(other.changed())
+        local.bump()
+        self.assertTrue(other.changed())
+        self.assertEqual(other.read(), value + 1)
+
+    def test_check_does_not_create_state_dir(self):
+        state_dir = conductor_settings.CONDUCTOR_STATE_DIR
+        with tempfile.TemporaryDirectory() as directory:
+            conductor_settings.CONDUCTOR_STATE_DIR = os.path.join(
+                directory, 'state')
+            try:
+                stamp = VersionStamp('test')
+                stamp.changed()
+                self.assertFalse(stamp.changed())
+                self.assertFalse(os.path.exists(
+                    conductor_settings.CONDUCTOR_STATE_DIR))
+                stamp.bump()
+                self.assertTrue(os.path.exists(stamp.path))
+            finally:
+                conductor_settings.CONDUCTOR_STATE_DIR = state_dir
+
+
+class TestInputMapCache(TestCase):
+
+    def setUp(self) -> None:
+        self.rule = Rule.objects.create(name='Print')
+        self.input_map = InputMap.objects.create(input_number=2,
+                                                 rule=self.rule)
+
+    def test_cached(self):
+        cache = InputMapCache()
+        self.assertEqual(cache.get(None, 2), self.input_map)
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get(None, 2).rule.name, 'Print')
+            self.assertIsNone(cache.get(None, 3))
+
+    def test_invalidated_by_other_process(self):
+        # a cache in another process is simulated by a second cache that
+        # only sees the version file
+        cache = InputMapCache()
+        cache.get(None, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            InputMap.objects.create(input_number=3, rule=self.rule)
+        self.assertIsNotNone(cache.get(None, 3))
+        self.assertIsNotNone(input_map_cache.get(None, 3))
+
+    def test_blank_module_is_default_module(self):
+        self.assertEqual(self.input_map.module, dio.default_module())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            InputMap.objects.create(module=dio.default_module(),
+                                    input_number=2, rule=self.rule)
+
+    def test_invalidated_on_commit(self):
+        cache = InputMapCache()
+        cache.get(None, 2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            InputMap.objects.create(input_number=3, rule=self.rule)
+        # nothing is reloaded before the new map is committed
+        self.assertIsNone(cache.get(None, 3))
+        for callback in callbacks:
+            callback()
+        self.assertIsNotNone(cache.get(None, 3))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management import call_command
+from django.test import TestCase
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import session
+from quartet_conductor.lifecycle import LifecycleManager
+from quartet_conductor.models import Session
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol
+from quartet_conductor.videojet import queue as printer_queue
+from quartet_conductor.videojet import serials
+
+
+class TestLifecycleManager(TestCase):
+
+    def setUp(self) -> None:
+        call_command('create_default_number_range')
+        self.manager = LifecycleManager(ttl=60)
+        context = RuleContext('Start', 'task', {
+            'SERIAL_IDENTIFIER': '00377713123456',
+            'JOB_FIELDS': {'LOT': 'W6G'}
+        })
+        session.start_session('W6G', '221100', 1, context)
+        self.buffer = serials.SerialNumberBuffer(
+            '00377713123456', 'SERIAL_NUMBER', 'JDA|{0}={1}|', 5, 0)
+        serials._buffers[('00377713123456', 'SERIAL_NUMBER',
+                          'JDA|{0}={1}|')] = self.buffer
+        self.buffer.fill()
+
+    def test_idle_eviction(self):
+        self.manager.last_used[1] = 100.0
+        self.assertEqual(self.manager.evict_idle(now=130.0), [])
+        self.assertGreater(self.manager.memory_usage()['W6G'], 0)
+        self.assertEqual(self.manager.evict_idle(now=161.0), ['W6G'])
+        self.assertEqual(self.manager.stats()['memory'], {})
+        self.assertEqual(len(self.buffer.queue), 0)
+        self.assertEqual(serials.get_buffers('00377713123456'), [])
+        # the evicted session is still running and comes back when used
+        self.assertEqual(Session.objects.get(lot='W6G').state, 'RUNNING')
+        restored = session.get_session(1)
+        self.assertEqual(restored.context.context['JOB_FIELDS']['LOT'],
+                         'W6G')
+
+    def test_printer_queue_not_evicted(self):
+        simulator = VideojetSimulator().start_in_thread()
+        queue = printer_queue.PrinterQueue(
+            '127.0.0.1', simulator.port, '00377713123456', capacity=5,
+            poll_interval=0)
+        printer_queue.start_queue(1, queue)
+        try:
+            self.manager.last_used[1] = 100.0
+            self.assertEqual(self.manager.evict_idle(now=161.0), [])
+            self.assertIs(printer_queue.get_queue(1), queue)
+            self.assertEqual(len(simulator.queue), 5)
+        finally:
+            printer_queue.stop_queue(1)
+            protocol.client_thread.close()
+            simulator.stop_in_thread()
+
+    def tearDown(self):
+        session.finish_session('W6G')
+        serials.release_buffers()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+
+from django.test import TestCase
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import control, memory
+
+
+class TestMemorySnapshots(TestCase):
+
+    def test_diff(self):
+        first = memory.take_snapshot()
+        leaked = [RuleContext('leak', 'task') for i in range(5)]
+        second = memory.take_snapshot()
+        report = memory.diff_snapshots(first['id'], second['id'])
+        self.assertEqual(report['objects']['RuleContext'], 5)
+        self.assertGreater(report['size_diff'], 0)
+        self.assertTrue(report['top'])
+        del leaked
+
+    def test_control_request(self):
+        listener = control.ControlListener()
+        request_id = control.request('memory_snapshot', pid=os.getpid(),
+                                     limit=3)
+        listener.poll()
+        result = control.get_results(request_id)[0]['result']
+        self.assertLessEqual(len(result['top']), 3)
+        self.assertIn('Session', result['objects'])
+
+    def tearDown(self):
+        memory.stop_tracing()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import json
+import os
+import threading
+
+from django.test import TestCase
+
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.metrics import Metrics
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self) -> None:
+        self.metrics = Metrics()
+        self.other = os.path.join(self.metrics.directory,
+                                  '%s.json' % os.getppid())
+
+    def test_render(self):
+        self.metrics.observe('serial', .0003)
+        self.metrics.observe('serial', .002)
+        error = ValueError('bad')
+        self.metrics.count_error(error)
+        # reported again further up the stack
+        self.metrics.count_error(error)
+        text = self.metrics.render()
+        self.assertIn('quartet_conductor_stage_seconds_bucket'
+                      '{stage="serial",le="0.0005"} 1', text)
+        self.assertIn('quartet_conductor_stage_seconds_bucket'
+                      '{stage="serial",le="+Inf"} 2', text)
+        self.assertIn('quartet_conductor_stage_seconds_count'
+                      '{stage="serial"} 2', text)
+        self.assertIn('quartet_conductor_errors_total{type="ValueError"} 1',
+                      text)
+
+    def test_other_processes(self):
+        other = Metrics()
+        other.observe('ack', .004)
+        with open(self.other, 'w') as f:
+            json.dump(other.snapshot(), f)
+        self.metrics.observe('ack', .004)
+        collected = self.metrics.collect()
+        self.assertEqual(collected['histograms']['ack'].count, 2)
+
+    def test_export_in_background(self):
+        exported = threading.Event()
+        threads = []
+
+        def export():
+            threads.append(threading.current_thread())
+            exported.set()
+
+        self.metrics.export = export
+        interval = conductor_settings.METRICS_EXPORT_INTERVAL
+        conductor_settings.METRICS_EXPORT_INTERVAL = .01
+        try:
+            self.metrics.observe('write', .001)
+            self.assertTrue(exported.wait(5))
+        finally:
+            conductor_settings.METRICS_EXPORT_INTERVAL = interval
+        # the thread that observed never writes the file itself
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def tearDown(self):
+        if os.path.exists(self.other):
+            os.remove(self.other)
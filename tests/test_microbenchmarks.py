@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+
+from quartet_conductor import microbenchmarks
+from quartet_conductor.videojet import serials
+from quartet_conductor.videojet.steps import parse_job_fields
+
+
+class TestMicrobenchmarks(TestCase):
+
+    def test_summarize(self):
+        summary = microbenchmarks.summarize([10, 11, 12, 11, 10, 50])
+        self.assertEqual(summary['rounds'], 6)
+        self.assertEqual(summary['median'], 11)
+        self.assertEqual(summary['min'], 10)
+        self.assertEqual(summary['outliers'], 1)
+        self.assertGreater(summary['ci95'], 0)
+
+    def test_compare(self):
+        baseline = {'benchmarks': {'a': {'mean': 100, 'median': 100,
+                                         'ci95': 5},
+                                   'b': {'mean': 100, 'median': 100,
+                                         'ci95': 5}}}
+        results = {'benchmarks': {'a': {'mean': 50, 'median': 50,
+                                        'ci95': 5},
+                                  'b': {'mean': 96, 'median': 96,
+                                        'ci95': 5}}}
+        comparison = microbenchmarks.compare(baseline, results)
+        self.assertEqual(comparison['a']['ratio'], .5)
+        self.assertTrue(comparison['a']['significant'])
+        self.assertFalse(comparison['b']['significant'])
+
+    def test_primitives(self):
+        self.assertEqual(parse_job_fields(b'JDL|LOT=W6G|EXPIRY=221100|\r'),
+                         {'LOT': 'W6G', 'EXPIRY': '221100'})
+        self.assertEqual(
+            serials.format_command('JDA|{0}={1}|', 'SERIAL_NUMBER', 12),
+            b'JDA|SERIAL_NUMBER=12|\r')
+
+    def test_run(self):
+        results = microbenchmarks.run_microbenchmarks(
+            repeat=2, min_time=.001, threads=(1, 2))
+        self.assertEqual(set(results['benchmarks']), {
+            'get_session[threads=1]', 'get_session[threads=2]',
+            'get_session_step', 'match_string_step', 'convert_command_value',
+            'print_command', 'job_fields_parse', 'job_fields_frame'
+        })
+        for summary in results['benchmarks'].values():
+            self.assertEqual(summary['rounds'], 2)
+            self.assertGreater(summary['median'], 0)
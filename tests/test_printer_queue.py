@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import glob
+import multiprocessing
+import os
+
+from django.core.management import call_command
+from django.test import TestCase
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import control, models, registry, session
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol
+from quartet_conductor.videojet import queue as printer_queue
+from quartet_conductor.videojet.queue import PrinterQueue, \
+    PrinterQueueError
+
+
+class TestPrinterQueue(TestCase):
+
+    def setUp(self) -> None:
+        call_command('create_default_number_range')
+        self.simulator = VideojetSimulator().start_in_thread()
+        self.queue = PrinterQueue('127.0.0.1', self.simulator.port,
+                                  '00377713123456', capacity=10,
+                                  poll_interval=0)
+
+    def test_flow_control(self):
+        self.queue.start()
+        self.assertEqual(len(self.simulator.queue), 10)
+        # the queue is full so nothing is sent
+        self.assertEqual(self.queue.top_up(), 0)
+        printed = self.simulator.print_labels(4)
+        self.assertEqual(self.queue.top_up(), 4)
+        self.assertEqual(self.queue.printed, 4)
+        self.assertEqual(str(self.queue.last_printed),
+                         printed[-1]['SERIAL_NUMBER'])
+        self.assertEqual(len(self.simulator.queue), 10)
+
+    def test_stop(self):
+        self.queue.start()
+        self.simulator.print_labels(3)
+        unused = self.queue.stop()
+        self.assertEqual(len(unused), 7)
+        self.assertEqual(self.queue.printed, 3)
+        self.assertEqual(len(self.simulator.queue), 0)
+
+    def test_rejected_record_clears_queue(self):
+        reply = self.simulator.reply
+        queued = []
+
+        def reject_third(frame):
+            if frame.command == 'QAD':
+                queued.append(frame)
+                if len(queued) == 3:
+                    return b'NAK'
+            return reply(frame)
+
+        self.simulator.reply = reject_third
+        with self.assertRaises(PrinterQueueError):
+            self.queue.start()
+        # the records after the rejected one were cleared off the printer
+        self.assertEqual(len(self.simulator.queue), 0)
+        self.assertEqual(len(self.queue.sent), 0)
+        self.assertEqual(self.queue.top_up(), 10)
+        self.assertEqual(len(self.simulator.queue), 10)
+
+    def test_dropped_reply_clears_queue(self):
+        replies = []
+
+        def drop_third_record():
+            # the clear and depth requests come first
+            replies.append(None)
+            return len(replies) == 5
+
+        self.simulator.faults.drop = drop_third_record
+        with self.assertRaises(PrinterQueueError):
+            self.queue.start()
+        self.assertEqual(self.simulator.dropped, 1)
+        # what the printer had queued before the drop was cleared
+        self.assertEqual(len(self.simulator.queue), 0)
+        self.assertEqual(len(self.queue.sent), 0)
+        self.assertEqual(self.queue.top_up(), 10)
+        self.assertEqual(len(self.simulator.queue), 10)
+
+    def test_held_while_paused(self):
+        session.start_session('W6G', '221100', 1,
+                              RuleContext('Start', 'task', {}))
+        printer_queue.start_queue(1, self.queue)
+        try:
+            session.pause_session('W6G')
+            # nothing is left on the printer for the paused lot
+            self.assertEqual(len(self.simulator.queue), 0)
+            self.assertFalse(self.queue.running)
+            session.resume_session('W6G')
+            self.assertEqual(len(self.simulator.queue), 10)
+            self.assertIs(printer_queue.get_queue(1), self.queue)
+        finally:
+            session.finish_session('W6G')
+        self.assertIsNone(printer_queue.get_queue(1))
+
+    def test_paused_from_other_process(self):
+        session.start_session('W6G', '221100', 1,
+                              RuleContext('Start', 'task', {}))
+        printer_queue.start_queue(1, self.queue)
+        listener = control.ControlListener()
+        # earlier requests are not for this test
+        listener.handled.update(
+            os.path.basename(path).split('.')[0] for path in
+            glob.glob(os.path.join(control.get_control_dir(), '*.request')))
+        child = multiprocessing.get_context('fork').Process(
+            target=pause_elsewhere, args=('W6G',))
+        try:
+            child.start()
+            while child.is_alive():
+                listener.poll()
+                child.join(.05)
+            self.assertEqual(child.exitcode, 0)
+            # the process that owns the queue held it
+            self.assertFalse(self.queue.running)
+            self.assertEqual(len(self.simulator.queue), 0)
+            self.assertEqual(session.get_session(1).state, 'PAUSED')
+        finally:
+            session.finish_session('W6G')
+
+    def tearDown(self):
+        protocol.client_thread.close()
+        self.simulator.stop_in_thread()
+
+
+def pause_elsewhere(lot: str):
+    # a web worker with the local registry does not see the session
+    registry._registry = registry.LocalSessionRegistry()
+    models._restore_attempted.add(1)
+    paused = session.pause_session(lot)
+    os._exit(0 if paused.state == 'PAUSED' else 1)
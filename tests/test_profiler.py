@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from quartet_conductor import control, profiler
+
+
+def busy(event):
+    while not event.is_set():
+        sum(range(100))
+
+
+class TestSamplingProfiler(TestCase):
+
+    def test_collapsed_stacks(self):
+        event = threading.Event()
+        thread = threading.Thread(target=busy, args=(event,), name='busy')
+        thread.start()
+        profile = profiler.SamplingProfiler(seconds=.2, interval=.01)
+        profile.start()
+        profile.join()
+        event.set()
+        thread.join()
+        self.assertGreater(profile.samples, 5)
+        with open(profile.path) as f:
+            lines = f.read().splitlines()
+        os.remove(profile.path)
+        self.assertTrue(any(line.startswith('busy;') and
+                            'test_profiler.py:busy' in line
+                            for line in lines))
+
+    def test_control_request(self):
+        listener = control.ControlListener()
+        request_id = control.request('profile', pid=os.getpid(),
+                                     seconds=.1)
+        listener.poll()
+        results = control.get_results(request_id)
+        self.assertEqual(results[0]['result']['seconds'], .1)
+        profiler.get_profiler().join()
+        os.remove(profiler.get_profiler().path)
+        # a request is only handled once
+        listener.poll()
+        self.assertEqual(len(control.get_results(request_id)), 1)
+
+    def test_interval_bounds(self):
+        listener = control.ControlListener()
+        request_id = control.request('profile', pid=os.getpid(),
+                                     seconds=.1, interval_ms=0)
+        listener.poll()
+        results = control.get_results(request_id)
+        self.assertIn('at least 1 millisecond', results[0]['error'])
+        for limits in ({'seconds': -1}, {'triggers': 0},
+                       {'interval_ms': .5}):
+            with self.assertRaises(ValueError):
+                profiler.check_profile(**limits)
+
+
+class TestControlView(TestCase):
+
+    def setUp(self) -> None:
+        self.user = User.objects.create_user('operator', password='x')
+        self.client = APIClient()
+
+    def test_staff_only(self):
+        response = self.client.post('/control/profile/', {'seconds': 1})
+        self.assertIn(response.status_code, (401, 403))
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/control/profile/', {'seconds': 1})
+        self.assertEqual(response.status_code, 403)
+
+    def test_whitelist(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_authenticate(self.user)
+        response = self.client.post('/control/shutdown/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post('/control/record_start/',
+                                    {'path': '/etc/passwd'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/control/profile/',
+                                    {'seconds': 'x'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/control/profile/', {'request': '*'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/control/profile/',
+                                    {'seconds': '.1', 'pid': '1'})
+        self.assertEqual(response.status_code, 202)
+        request_id = response.json()['request']
+        response = self.client.get('/control/profile/',
+                                   {'request': request_id})
+        self.assertEqual(response.json(), [])
+        os.remove(os.path.join(control.get_control_dir(),
+                               '%s.request' % request_id))
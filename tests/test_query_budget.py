@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+from quartet_capture.models import Rule
+
+from quartet_conductor import query_budget
+
+
+class TestQueryBudget(TestCase):
+
+    def test_print_path_within_budget(self):
+        # raises QueryBudgetExceeded with the query breakdown
+        results = query_budget.run_query_budget(triggers=3)
+        self.assertEqual(results['violations'], [])
+        print_rule = results['VideoJet Print']
+        self.assertIn('compile', print_rule['first'])
+        self.assertNotIn('compile', print_rule['per_trigger'])
+        self.assertLessEqual(print_rule['per_trigger']['total'],
+                             print_rule['budget'])
+
+    def test_no_triggers(self):
+        with self.assertRaises(ValueError):
+            query_budget.run_query_budget(triggers=0)
+
+    def test_check_budget(self):
+        with query_budget.QueryCounter() as counter:
+            Rule.objects.count()
+            Rule.objects.count()
+        self.assertEqual(counter.total, 2)
+        self.assertEqual(counter.counts['other'], 2)
+        query_budget.check_budget('Test', counter, 2)
+        with self.assertRaises(query_budget.QueryBudgetExceeded) as e:
+            query_budget.check_budget('Test', counter, {'other': 1})
+        self.assertIn('other: 2 queries, the budget is 1', str(e.exception))
+        self.assertIn('SELECT COUNT(*)', str(e.exception))
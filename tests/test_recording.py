@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+
+from django.core.management import call_command
+from django.test import TestCase
+from quartet_capture.models import Rule, Step
+
+from quartet_conductor import connections, recording, replay
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.models import InputMap
+from quartet_conductor.simulators.microscan import MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+
+
+class TestTrafficLog(TestCase):
+
+    def setUp(self) -> None:
+        self.printer = VideojetSimulator().start_in_thread()
+        self.scanner = MicroscanSimulator().start_in_thread()
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def record(self):
+        recording.start(self.path)
+        recording.record_edge(None, 1)
+        connections.get_connection('127.0.0.1', self.printer.port).send(
+            b'GJD\r', b'\r')
+        connections.get_connection('127.0.0.1', self.scanner.port).send(
+            b'<K705,1,0,0><K231h,1,*W6G*>')
+        recording.record_edge(None, 2)
+        return recording.stop()
+
+    def test_record(self):
+        self.assertEqual(self.record()['records'], 7)
+        records = list(recording.read_log(self.path))
+        self.assertEqual(
+            [recording.KINDS[r.kind] for r in records],
+            ['edge', 'device', 'send', 'receive', 'device', 'send', 'edge']
+        )
+        self.assertEqual(records[-1].data, b'2')
+        times = [r.time for r in records]
+        self.assertEqual(times, sorted(times))
+
+    def test_load_log(self):
+        self.record()
+        edges, devices = replay.load_log(self.path)
+        self.assertEqual([address for t, address in edges], ['1', '2'])
+        printer, scanner = devices[0], devices[1]
+        self.assertTrue(printer.is_printer)
+        self.assertEqual(printer.job_fields()['LOT'], 'W6G')
+        self.assertEqual(len(printer.delays), 1)
+        self.assertFalse(scanner.is_printer)
+        self.assertEqual(scanner.frames(), 2)
+
+    def test_device_record_first(self):
+        recorder = recording.TrafficRecorder(self.path)
+        barrier = threading.Barrier(8)
+
+        def send():
+            barrier.wait()
+            recorder.send('127.0.0.1', 9100, b'GJD\r')
+
+        threads = [threading.Thread(target=send) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        recorder.close()
+        kinds = [recording.KINDS[r.kind] for r in
+                 recording.read_log(self.path)]
+        self.assertEqual(kinds, ['device'] + ['send'] * 8)
+
+    def test_unknown_device(self):
+        recorder = recording.TrafficRecorder(self.path)
+        recorder.write(recording.SEND, 3, b'GJD\r')
+        recorder.send('127.0.0.1', 9100, b'GJD\r')
+        recorder.close()
+        with self.assertLogs('quartet_conductor.replay', 'WARNING'):
+            edges, devices = replay.load_log(self.path)
+        self.assertEqual(list(devices), [0])
+        self.assertEqual(len(devices[0].sent), 1)
+
+    def test_control_start(self):
+        for name in ('../sessions.log', '/tmp/x.log', 'sessions.mmap'):
+            with self.assertRaises(ValueError):
+                recording.start_from_control(name)
+        with tempfile.TemporaryDirectory() as directory:
+            state_dir = conductor_settings.CONDUCTOR_STATE_DIR
+            conductor_settings.CONDUCTOR_STATE_DIR = directory
+            try:
+                result = recording.start_from_control('shift.log')
+                recording.stop()
+            finally:
+                conductor_settings.CONDUCTOR_STATE_DIR = state_dir
+            self.assertEqual(result['path'],
+                             os.path.join(directory, 'shift.log'))
+
+    def test_redirect(self):
+        recording.redirects[('printer', 777)] = ('127.0.0.1',
+                                                 self.printer.port)
+        try:
+            connection = connections.get_connection('printer', 777)
+            self.assertEqual(connection.port, self.printer.port)
+        finally:
+            recording.redirects.clear()
+
+    def tearDown(self):
+        connections.pool.close()
+        self.printer.stop_in_thread()
+        self.scanner.stop_in_thread()
+        os.remove(self.path)
+
+
+class TestConfigurationCopy(TestCase):
+
+    def test_copy_configuration(self):
+        call_command('create_default_number_range')
+        rule = Rule.objects.create(name='Replay')
+        Step.objects.create(rule=rule, name='Step', order=1,
+                            step_class='quartet_conductor.steps.'
+                                       'GetSessionStep')
+        InputMap.objects.create(input_number=3, rule=rule)
+        data = replay.copy_configuration()
+        InputMap.objects.all().delete()
+        Rule.objects.all().delete()
+        replay.load_configuration(data)
+        input_map = InputMap.objects.get(input_number=3)
+        self.assertEqual(input_map.rule.name, 'Replay')
+        self.assertEqual(input_map.rule.step_set.get().name, 'Step')
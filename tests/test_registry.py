@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+import time
+
+from django.test import TestCase
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import models, registry
+from quartet_conductor.models import Session
+from quartet_conductor.registry import SharedSessionRegistry
+from quartet_conductor.session import start_session, get_session
+
+
+class TestSharedSessionRegistry(TestCase):
+
+    def setUp(self) -> None:
+        self.dir = tempfile.TemporaryDirectory()
+        path = os.path.join(self.dir.name, 'sessions.mmap')
+        self.registry = SharedSessionRegistry(path, slots=4,
+                                              slot_size=1024)
+        # a second mapping of the same file stands in for another process
+        self.other = SharedSessionRegistry(path, slots=4, slot_size=1024)
+        self.session = Session(lot='W6G', expiry='221100')
+        self.session.context = RuleContext('Start', 'task', {
+            'IO_PORT': b'1',
+            'PRINTER_HOST': '127.0.0.1',
+        })
+
+    def test_shared(self):
+        self.registry.put(1, self.session)
+        session = self.other.get(1)
+        self.assertEqual(session.lot, 'W6G')
+        self.assertEqual(session.context.context['IO_PORT'], b'1')
+        # an unchanged slot is not decoded again
+        self.assertIs(self.other.get(1), session)
+        self.assertEqual(self.other.find('W6G'), 1)
+        self.assertIsNone(self.other.get(5))
+        self.other.remove(1)
+        self.assertIsNone(self.registry.get(1))
+        self.assertEqual(self.registry.all(), [])
+
+    def test_collisions(self):
+        # inputs 1 and 5 share a slot
+        self.registry.put(1, self.session)
+        self.registry.put(5, Session(lot='X1', expiry='221100'))
+        self.registry.remove(1)
+        self.assertEqual(self.other.get(5).lot, 'X1')
+        self.registry.put(1, self.session)
+        self.assertEqual(len(self.other.all()), 2)
+
+    def test_recover_dead_writer(self):
+        self.registry.put(1, self.session)
+        self.registry.put(5, Session(lot='X1', expiry='221100'))
+        # a writer died after making the first slot odd
+        offset = self.registry._offset(1)
+        seq = registry.SLOT_HEADER.unpack_from(self.registry.mm, offset)[0]
+        registry.struct.pack_into('<I', self.registry.mm, offset, seq + 1)
+        reopened = SharedSessionRegistry(self.registry.path, slots=4,
+                                         slot_size=1024)
+        try:
+            self.assertIsNone(reopened.get(1))
+            # the slot is not emptied so later slots can still be found
+            self.assertEqual(reopened.get(5).lot, 'X1')
+            reopened.put(1, self.session)
+            self.assertEqual(self.other.get(1).lot, 'W6G')
+        finally:
+            reopened.close()
+
+    def tearDown(self):
+        self.registry.close()
+        self.other.close()
+        self.dir.cleanup()
+
+
+class TestLocalSessionRegistry(TestCase):
+
+    def test_lookup_without_lock(self):
+        local = registry.LocalSessionRegistry()
+        session = Session(lot='W6G', expiry='221100')
+        local.put(1, session)
+        with local.lock:
+            # a writer holds the lock- lookups still succeed
+            self.assertIs(local.get(1), session)
+            self.assertEqual(local.find('W6G'), 1)
+
+    def test_lock_wait_stats(self):
+        local = registry.LocalSessionRegistry()
+        session = Session(lot='W6G', expiry='221100')
+        local.lock.__enter__()
+        thread = threading.Thread(target=local.put, args=(1, session))
+        thread.start()
+        time.sleep(.05)
+        local.lock.__exit__()
+        thread.join()
+        stats = local.stats()
+        self.assertEqual(stats['contended'], 1)
+        self.assertGreater(stats['max_wait'], .01)
+        self.assertEqual(stats['sessions'], 1)
+
+
+class TestSessionRestore(TestCase):
+
+    def setUp(self) -> None:
+        self.registry = registry._registry
+
+    def restart(self):
+        # a restart loses the in-memory sessions
+        registry._registry = registry.LocalSessionRegistry()
+        models._restore_attempted.clear()
+
+    def test_restored_after_restart(self):
+        context = RuleContext('Start', 'task', {'IO_PORT': b'1',
+                                                'LOT': 'W6G'})
+        start_session('W6G', '221100', 1, context)
+        self.restart()
+        with self.assertNumQueries(1):
+            session = get_session(1)
+        self.assertEqual(session.lot, 'W6G')
+        self.assertEqual(session.context.context['IO_PORT'], b'1')
+        with self.assertNumQueries(0):
+            self.assertIs(get_session(1), session)
+
+    def test_restores_last_started(self):
+        start_session('W6G', '221100', 1, RuleContext('Start', 'task', {}))
+        start_session('X1', '221100', 1, RuleContext('Start', 'task', {}))
+        # the first lot is started again and keeps its old row
+        start_session('W6G', '221100', 1, RuleContext('Start', 'task', {}))
+        self.assertEqual(
+            Session.objects.get(lot='X1').state, 'FINISHED')
+        self.restart()
+        self.assertEqual(get_session(1).lot, 'W6G')
+
+    def tearDown(self):
+        registry._registry = self.registry
+        models._restore_attempted.clear()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.test import TestCase
+from quartet_capture.models import Rule, Step, StepParameter, Task
+
+from quartet_conductor import rules
+
+
+class LabelStep(rules.Step):
+
+    def __init__(self, db_task, **kwargs):
+        super().__init__(db_task, **kwargs)
+        self.label = self.get_or_create_parameter('Label', 'first')
+
+    def execute(self, data, rule_context):
+        rule_context.context['LABEL'] = self.label
+        rule_context.context['DATA'] = data
+
+    @property
+    def declared_parameters(self):
+        return {}
+
+    def on_failure(self):
+        pass
+
+
+class TestCompiledRules(TestCase):
+
+    def setUp(self) -> None:
+        rules.rule_cache.clear()
+        self.rule = Rule.objects.create(name='Compiled')
+        self.step = Step.objects.create(name='Label', rule=self.rule,
+                                        step_class='tests.test_rules.LabelStep',
+                                        order=1)
+
+    def test_reused(self):
+        misses = rules.rule_cache.stats()['misses']
+        with self.captureOnCommitCallbacks(execute=True):
+            context = rules.execute_rule(b'1', self.rule)
+        self.assertEqual(context.context['LABEL'], 'first')
+        # creating the Label parameter with its default on the first load
+        # does not throw the compiled copy away
+        with self.assertNumQueries(3):
+            # the task is inserted, logged to and updated- nothing is loaded
+            context = rules.execute_rule(b'2', self.rule)
+        self.assertEqual(context.context['DATA'], b'2')
+        self.assertEqual(rules.rule_cache.stats()['misses'], misses + 1)
+
+    def test_invalidated(self):
+        rules.execute_rule(b'1', self.rule)
+        param = StepParameter.objects.get(step=self.step, name='Label')
+        param.value = 'second'
+        with self.captureOnCommitCallbacks(execute=True):
+            param.save()
+        context = rules.execute_rule(b'1', self.rule)
+        self.assertEqual(context.context['LABEL'], 'second')
+
+    def test_task_record(self):
+        rules.execute_rule('1', self.rule)
+        task = Task.objects.get(rule=self.rule)
+        self.assertEqual(task.status, 'FINISHED')
+        self.assertEqual(task.execution_time, 1)
+        context = rules.execute_rule('1', self.rule)
+        self.assertEqual(context.context['DATA'], b'1')
@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+from django.core.management import call_command
+from django.test import TestCase
+from serialbox.models import Pool
+
+from quartet_conductor.videojet import serials
+
+
+class TestSerialNumberBuffer(TestCase):
+
+    def setUp(self) -> None:
+        call_command('create_default_number_range')
+
+    def test_pop_and_release(self):
+        buffer = serials.SerialNumberBuffer('00377713123456',
+                                            'SERIAL_NUMBER',
+                                            'JDA|{0}={1}|',
+                                            block_size=5,
+                                            low_watermark=0)
+        serial_number, command = buffer.pop()
+        self.assertEqual(
+            command,
+            ('JDA|SERIAL_NUMBER=%s|\r' % serial_number).encode('ascii')
+        )
+        self.assertEqual(len(buffer.queue), 4)
+        unused = buffer.release()
+        self.assertEqual(len(unused), 4)
+        self.assertNotIn(serial_number, unused)
+        self.assertEqual(len(buffer.queue), 0)
+
+
+class TestGeneratorCache(TestCase):
+
+    def setUp(self) -> None:
+        call_command('create_default_number_range')
+        serials.generator_cache.invalidate()
+
+    def test_default_fallback_cached(self):
+        cache = serials.generator_cache
+        machine_name, generator = cache.get('00377713123456')
+        self.assertEqual(machine_name, 'DEFAULT')
+        hits = cache.stats()['hits']
+        with self.assertNumQueries(0):
+            self.assertIs(cache.get('00377713123456')[1], generator)
+        self.assertEqual(cache.stats()['hits'], hits + 1)
+
+    def test_invalidated_on_pool_save(self):
+        cache = serials.generator_cache
+        cache.get('00377713123456')
+        self.assertEqual(cache.stats()['size'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Pool.objects.create(readable_name='GTIN Range',
+                                machine_name='00377713123456',
+                                active=True)
+        self.assertEqual(cache.stats()['size'], 0)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import time
+
+from django.test import TestCase
+from quartet_capture.rules import RuleContext
+
+from quartet_conductor import session
+from quartet_conductor import settings as conductor_settings
+from quartet_conductor.models import Session
+
+
+class TestPauseResume(TestCase):
+
+    def setUp(self) -> None:
+        self.context = RuleContext('Start', 'task', {
+            'JOB_FIELDS': {'LOT': 'W6G'}
+        })
+        session.start_session('W6G', '221100', 1, self.context)
+
+    def test_pause_resume(self):
+        paused = session.pause_session('W6G')
+        self.assertEqual(paused.state, 'PAUSED')
+        self.assertEqual(Session.objects.get(lot='W6G').state, 'PAUSED')
+        with self.assertRaises(session.SessionStateError):
+            session.pause_session('W6G')
+        start = time.perf_counter()
+        with self.assertNumQueries(1):
+            resumed = session.resume_session('W6G')
+        self.assertLess(time.perf_counter() - start, .1)
+        self.assertEqual(session.get_session(1).state, 'RUNNING')
+        # the context gathered when the session started is kept
+        self.assertIs(resumed.context, self.context)
+
+    def test_not_running(self):
+        interval = conductor_settings.CONTROL_POLL_INTERVAL
+        # no other process answers for the lot
+        conductor_settings.CONTROL_POLL_INTERVAL = .01
+        try:
+            with self.assertRaises(session.SessionNotActiveError):
+                session.pause_session('X1')
+        finally:
+            conductor_settings.CONTROL_POLL_INTERVAL = interval
+
+    def tearDown(self):
+        session.finish_session('W6G')
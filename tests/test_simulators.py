@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import socket
+import time
+
+from django.test import TestCase
+
+from quartet_conductor.simulators.base import Faults
+from quartet_conductor.simulators.microscan import MicroscanSimulator
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol
+
+
+class TestVideojetFaults(TestCase):
+
+    def setUp(self) -> None:
+        self.simulator = VideojetSimulator().start_in_thread()
+        self.thread = protocol.ClientThread()
+        self.client = self.thread.get_client('127.0.0.1',
+                                             self.simulator.port,
+                                             timeout=.5)
+
+    def test_latency(self):
+        self.simulator.faults = Faults(latency=.05)
+        start = time.perf_counter()
+        self.assertEqual(self.client.request(b'GJD').command, 'JDL')
+        self.assertGreaterEqual(time.perf_counter() - start, .05)
+
+    def test_malformed_reply(self):
+        self.simulator.faults = Faults(malformed_rate=1, seed=1)
+        with self.assertRaises(protocol.ProtocolError):
+            self.client.request(b'GST')
+        self.assertEqual(self.simulator.malformed, 1)
+
+    def test_recovery_after_drop(self):
+        self.simulator.faults = Faults(drop_rate=1)
+        with self.assertRaises(protocol.ProtocolError):
+            self.client.request(b'GST')
+        self.simulator.faults = Faults()
+        self.assertEqual(self.client.request(b'GST').command, 'STS')
+        self.assertEqual(self.simulator.connection_count, 2)
+
+    def test_nak(self):
+        self.simulator.nak_rate = 1
+        self.assertTrue(
+            self.client.request(b'JDA|SERIAL_NUMBER=1|').is_nak)
+
+    def tearDown(self):
+        self.thread.close()
+        self.simulator.stop_in_thread()
+
+
+class TestMicroscanSimulator(TestCase):
+
+    def test_k_commands(self):
+        simulator = MicroscanSimulator().start_in_thread()
+        with socket.create_connection(('127.0.0.1', simulator.port)) as s:
+            s.sendall(b'<K705,1,0,0>\r\n<K231h,1,*W6G*>\r\n<K231?>')
+            reply = s.recv(1024)
+        simulator.stop_in_thread()
+        self.assertEqual(reply, b'<K231h,1,*W6G*>')
+        self.assertEqual(simulator.received,
+                         ['K705,1,0,0', 'K231h,1,*W6G*', 'K231?'])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+from quartet_conductor import dio, metrics, traces
+from quartet_conductor import settings as conductor_settings
+
+
+class TestTraces(TestCase):
+
+    def test_trace(self):
+        traces.begin(3)
+        metrics.observe('serial', .002)
+        metrics.observe('write', .001)
+        metrics.observe('write', .001)
+        traces.annotate(lot='TRACE-LOT', serial_number='1001')
+        traces.end(ValueError('bad'))
+        found = traces.get_traces(lot='TRACE-LOT', last=1)
+        self.assertEqual(len(found), 1)
+        data = found[0].to_dict()
+        self.assertEqual(data['input'], 3)
+        self.assertEqual(data['serial_number'], '1001')
+        self.assertEqual(data['outcome'], 'FAILED')
+        self.assertEqual(data['error'], 'ValueError')
+        self.assertAlmostEqual(data['stages']['write'], .002, places=5)
+        self.assertNotIn('ack', data['stages'])
+        self.assertIsNone(traces.current())
+
+    def test_ring_wraps(self):
+        with tempfile.TemporaryDirectory() as directory:
+            ring = traces.TraceRing(os.path.join(directory, '1.ring'), 4)
+            for i in range(10):
+                trace = traces.Trace(i)
+                ring.write(trace)
+            found = traces.read_ring(ring.path)
+            ring.close()
+        self.assertEqual([t.input for t in found], [6, 7, 8, 9])
+
+    def test_dump_by_address(self):
+        modules = conductor_settings.DIO_MODULES
+        conductor_settings.DIO_MODULES = ['left', 'right']
+        try:
+            traces.begin(dio.input_key('right', 3))
+            traces.annotate(lot='DUMP-LOT')
+            traces.end()
+            out = StringIO()
+            call_command('dump_traces', input='right:3', lot='DUMP-LOT',
+                         stdout=out)
+            self.assertIn('input=right:3 lot=DUMP-LOT', out.getvalue())
+            out = StringIO()
+            call_command('dump_traces', input='3', lot='DUMP-LOT',
+                         stdout=out)
+            self.assertEqual(out.getvalue(), '')
+            with self.assertRaises(CommandError):
+                call_command('dump_traces', input='top:3')
+        finally:
+            conductor_settings.DIO_MODULES = modules
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import asyncio
+import time
+
+from django.test import TestCase
+
+from quartet_conductor.simulators.videojet import VideojetSimulator
+from quartet_conductor.videojet import protocol
+
+
+class TestFrameParser(TestCase):
+
+    def test_partial_frames(self):
+        parser = protocol.FrameParser()
+        self.assertEqual(parser.feed(b'JDL|LOT=W6'), [])
+        frames = parser.feed(b'G|EXPIRY=221100|\rAC')
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0].command, 'JDL')
+        self.assertEqual(frames[0].fields,
+                         {'LOT': 'W6G', 'EXPIRY': '221100'})
+        frames = parser.feed(b'K\r\nNAK\r')
+        self.assertEqual([f.command for f in frames], ['ACK', 'NAK'])
+
+
+class TestVideojetClient(TestCase):
+
+    def setUp(self) -> None:
+        self.simulator = VideojetSimulator().start_in_thread()
+        self.thread = protocol.ClientThread()
+
+    def test_pipeline(self):
+        client = self.thread.get_client('127.0.0.1', self.simulator.port)
+        frame = client.request(b'GJD')
+        self.assertEqual(frame.fields['LOT'], 'W6G')
+        replies = client.pipeline(
+            [b'JDA|SERIAL_NUMBER=%d|' % i for i in range(10)]
+        )
+        self.assertTrue(all(reply.is_ack for reply in replies))
+        self.assertEqual(self.simulator.job_fields['SERIAL_NUMBER'], '9')
+        self.assertEqual(self.simulator.connection_count, 1)
+
+    def test_unsolicited_frames(self):
+        client = self.thread.get_client('127.0.0.1', self.simulator.port)
+        events = []
+        client.add_listener(events.append)
+        client.request(b'GST')
+        self.simulator.call(self.simulator.push(b'STS|STATE=FAULT|'))
+        frame = client.request(b'SLA|LABEL1|')
+        self.assertTrue(frame.is_ack)
+        self.assertEqual([e.command for e in events], ['STS'])
+
+    def test_reconnect(self):
+        client = self.thread.get_client('127.0.0.1', self.simulator.port)
+        client.request(b'GST')
+        for writer in list(self.simulator.writers):
+            self.simulator.loop.call_soon_threadsafe(writer.close)
+        while client.client.connected:
+            time.sleep(.01)
+        self.assertEqual(client.request(b'GST').command, 'STS')
+        self.assertEqual(self.simulator.connection_count, 2)
+
+    def test_concurrent_connect(self):
+        client = self.thread.get_client('127.0.0.1', self.simulator.port)
+
+        async def both():
+            return await asyncio.gather(
+                client.client.request(b'GST'),
+                client.client.pipeline([b'GST', b'GST']))
+
+        single, batch = self.thread.run(both())
+        self.assertEqual(single.command, 'STS')
+        self.assertEqual([f.command for f in batch], ['STS', 'STS'])
+        self.assertEqual(self.simulator.connection_count, 1)
+
+    def tearDown(self):
+        self.thread.close()
+        self.simulator.stop_in_thread()